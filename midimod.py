@@ -11,11 +11,25 @@ from pathlib import Path
 import sys
 import random
 import re 
+import ast
+import keyword
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 from queue import Queue
+from collections import namedtuple, deque
+import heapq
+import itertools
+import copy
+from bisect import bisect_right
 import threading
 import html
+import io
+import contextlib
+import tempfile
+import hashlib
+import marshal
+import tracemalloc
+import gc
 
 # --- OSC Imports ---
 from pythonosc import dispatcher, osc_server, udp_client
@@ -31,6 +45,9 @@ from prompt_toolkit.formatted_text import HTML, to_formatted_text
 
 # --- TUI Constants ---
 TUI_MSG_TIMEOUT = 1.5
+TUI_ACTIVITY_FLASH = 0.2 # Barra verde de actividad muy reciente
+TUI_MAX_REFRESH_RATE = 20 # Redibujos por segundo como máximo (--tui-fps); solo si algo ha cambiado
+KEYBOARD_POLL_INTERVAL = 0.05 # Sondeo del teclado en modo monitor
 
 # --- Global Configuration ---
 RULES_DIR_NAME = "rules" 
@@ -48,6 +65,9 @@ cc_input_s_state = {}
 tui_last_osc_msg_str = ""
 tui_last_osc_msg_time = 0
 tui_app = None
+tui_max_refresh_rate = TUI_MAX_REFRESH_RATE
+tui_panel_cache = {} # panel -> (estado visible, fragmentos ya formateados)
+tui_screen_content = None # Última pantalla completa (lista de (estilo, texto))
 
 
 # --- OSC Globals ---
@@ -58,6 +78,19 @@ osc_server_instance = None
 osc_message_queue = Queue()
 all_loaded_osc_filters = []
 
+# --- Despertador del motor de eventos ---
+# Los callbacks de entrada MIDI, el manejador OSC y la recarga en vivo despiertan
+# al bucle principal a través de este evento, en vez de sondear cada milisegundo.
+engine_wakeup_event = threading.Event()
+midi_input_queue = Queue()
+ENGINE_IDLE_WAIT = 0.05 # Espera máxima del motor sin eventos (mantenimiento de módulos)
+
+# --- Hilo del motor ---
+# Todo el procesamiento MIDI/reloj/módulos ocurre en un hilo dedicado. La interfaz
+# (teclado del monitor o TUI) solo envía comandos y lee instantáneas bajo el cerrojo.
+engine_state_lock = threading.RLock()
+engine_command_queue = Queue()
+
 
 
 active_note_map = {}
@@ -65,6 +98,8 @@ user_variables = {}
 channel_arrays = {}      
 sequencers_state = [] 
 persisted_sequencer_states = {}
+loaded_rule_files = {} # nombre de fichero -> (contenido en uso, copia intacta tal como se leyó)
+required_port_aliases = set() # Puertos que pedía la configuración en la última carga completa
 arpeggiator_templates = {}
 arpeggiator_instances = {}
 clock_tick_counters = {} 
@@ -72,6 +107,67 @@ user_ordered_scale_names = []
 clock_tick_counters = {}
 user_ordered_scale_names = []
 
+# --- Índice de despacho de filtros ---
+# Por puerto de entrada: filtros (en su orden original) cuyo device_in coincide, con sus
+# condiciones estáticas. La caché guarda, por (puerto, evento, canal, value_1), la tupla
+# de filtros que pueden coincidir. Ambos se reconstruyen en cada carga/recarga.
+filter_dispatch_index = {}
+filter_dispatch_cache = {}
+
+# --- Resolución de alias a puertos ---
+# alias de device_out -> objeto de puerto de salida, y alias de reloj/entrada -> nombre de
+# puerto abierto. Se rellenan al consultar y se vacían cuando load_configuration abre o cierra puertos.
+output_port_by_alias = {}
+port_name_by_alias = {}
+
+# --- Suscripciones de reloj ---
+# Puerto de entrada -> (secuenciadores, instancias de arpegiador) que siguen su reloj.
+# Se reconstruye al cargar módulos y al crear/eliminar instancias de arpegiador.
+clock_subscribers = {}
+
+# --- Perfilador del camino caliente ---
+# Desactivado por defecto (--profile). El bucle del motor elige la función perfilada o la
+# normal una vez por iteración, así que apagado no añade coste por filtro ni por paso.
+profiler_enabled = False
+profiler_stats = {} # clave ('plant.3', 'SEQ[0]', 'ARP[1,0]') -> {'calls', 'total_time', 'max_time', 'outputs'}
+profiler_clock_periods = {} # puerto -> [último tick (perf_counter), periodo suavizado]
+PROFILE_DUMP_FILE = "midimod_profile.json"
+TUI_PROFILER_ROWS = 12
+
+# --- Medición de jitter reloj -> salida ---
+# Con --measure-jitter cada clock entrante lleva su hora de llegada (perf_counter) en msg.time y
+# cada nota enviada por un secuenciador/arpegiador se compara con el clock que la provocó.
+jitter_measure_enabled = False
+jitter_stats = {} # 'SEQ[0]' / 'ARP[1,0]' -> {'count', 'sum', 'sum_sq', 'max', 'bins'}
+jitter_pending_clock = {} # módulo -> llegada del primer clock aún no atendido en esta iteración
+JITTER_BIN_WIDTH = 0.00005 # 50 us por barra del histograma
+JITTER_NUM_BINS = 400 # Hasta 20 ms; lo que pase va a la última barra (desbordamiento)
+JITTER_REPORT_BIN_GROUP = 5 # Barras agrupadas de 0.25 ms en el informe
+JITTER_REPORT_FILE = "midimod_jitter_report.txt"
+JITTER_SUMMARY_INTERVAL = 5.0 # Resumen periódico en modo monitor
+TUI_JITTER_ROWS = 8
+jitter_last_summary_time = 0
+
+# --- Log del monitor ---
+# En modo monitor sys.stdout se sustituye por un MonitorLogWriter: los print() del motor solo
+# dejan la línea en un buffer circular y un hilo aparte la escribe en la terminal (y en el log).
+MONITOR_LOG_BUFFER_LINES = 4096 # Si la terminal no da abasto se descartan las líneas más antiguas
+MONITOR_LOG_FLUSH_INTERVAL = 0.02
+MONITOR_LOG_FILE_MAX_BYTES = 5 * 1024 * 1024
+MONITOR_LOG_FILE_BACKUPS = 3
+monitor_log_writer = None
+
+# --- Reloj maestro interno ---
+# Los módulos lo usan con "clock_in": "internal"; sus ticks llegan al motor bajo este nombre de puerto.
+INTERNAL_CLOCK_ALIAS = "internal"
+INTERNAL_CLOCK_PORT_NAME = "MIDImod internal clock"
+INTERNAL_CLOCK_DEFAULTS = {"bpm": 120, "ppqn": 24, "autostart": False}
+INTERNAL_CLOCK_SPIN_WINDOW = 0.001 # Último tramo antes de cada tick que se espera activamente
+INTERNAL_CLOCK_MAX_LATE_TICKS = 4 # Retraso (en ticks) a partir del cual se re-sincroniza
+internal_clock = None
+offline_mode = False # Benchmark/render: sin hilos de reloj ni puertos reales
+midi_backend = mido # Lista y abre los puertos; LoopbackMidiBackend para funcionar sin hardware
+
 
 DEFAULT_NOTE_DURATIONS = [
     "1/64", "1/32", "1/16t", "1/16", "1/8t", "1/8", "1/4t", "1/4", "1/2t", "1/2", "1", "1.5", "2", "3", "4"
@@ -194,9 +290,16 @@ def clear_reloadable_state():
     global global_device_aliases, all_loaded_filters, user_variables, sequencers_state
     global arpeggiator_templates, full_json_contents, active_scales
     global user_ordered_scale_names, user_ordered_duration_names, arpeggiator_instances
+    global all_loaded_osc_filters
 
     global_device_aliases = {}
     all_loaded_filters = []
+    filter_dispatch_index.clear()
+    filter_dispatch_cache.clear()
+    compiled_expression_cache.clear()
+    output_port_by_alias.clear()
+    port_name_by_alias.clear()
+    clock_subscribers.clear()
     all_loaded_osc_filters = []
     user_variables = {}
     sequencers_state = []
@@ -206,6 +309,7 @@ def clear_reloadable_state():
     active_scales = PREDEFINED_SCALES.copy()
     user_ordered_scale_names = []
     user_ordered_duration_names = []
+    loaded_rule_files.clear()
 
 # Renombrar y expandir la función para inicializar todo el estado global
 def initialize_state():
@@ -241,6 +345,13 @@ def initialize_state():
 
     # Estado de Transporte
     midimaster_assumed_status = "STOPPED"
+    output_batch.clear()
+    output_batch_cc_slots.clear()
+    output_rate_policies.clear()
+    filter_rate_policies.clear()
+    cc_rate_state.clear()
+    cc_rate_pending.clear()
+    sysex_chunk_schedule.clear()
 
     # Estructuras de Configuración Cargadas
     global_device_aliases = {}
@@ -251,6 +362,9 @@ def initialize_state():
     # Manejo de Puertos
     opened_ports_tracking = {}
     active_input_handlers = {}
+    output_port_by_alias.clear()
+    port_name_by_alias.clear()
+    clock_subscribers.clear()
 
 
 # --- Non-Blocking Character Input ---
@@ -289,6 +403,25 @@ def verbose_print(*args, **kwargs):
         print(*args, **kwargs)
 
 
+def _wake_engine():
+    """Despierta al bucle principal para que procese los eventos pendientes."""
+    engine_wakeup_event.set()
+
+def _make_midi_input_callback(port_name):
+    """Crea el callback de un puerto de entrada: encola el mensaje y despierta al motor."""
+    if jitter_measure_enabled:
+        def _on_midi_message_timed(msg):
+            if msg.type == 'clock':
+                msg = msg.copy(time=time.perf_counter()) # Hora de llegada del tick
+            midi_input_queue.put((port_name, msg))
+            engine_wakeup_event.set()
+        return _on_midi_message_timed
+    def _on_midi_message(msg):
+        midi_input_queue.put((port_name, msg))
+        engine_wakeup_event.set()
+    return _on_midi_message
+
+
 def _update_tui_port_out_data(port_obj, msg, alias_str):
     """Actualiza la estructura de datos de un puerto para la TUI cuando se envía un mensaje."""
     if not port_obj or port_obj.closed:
@@ -296,149 +429,269 @@ def _update_tui_port_out_data(port_obj, msg, alias_str):
     port_name = port_obj.name
     if port_name in opened_ports_tracking:
         port_info = opened_ports_tracking[port_name]
-        # Usamos un prefijo mínimo para el log de la TUI
-        port_info["last_out_msg_str"] = format_midi_message_for_log(msg, prefix="")
+        # Solo se guarda el mensaje; la TUI lo formatea al dibujar (_format_tui_port_msg)
+        port_info["last_out_msg"] = msg
         now = time.time()
         port_info["last_out_msg_time"] = now
         port_info["activity_time"] = now
 
 # --- TUI Content Generators ---
 
-def _get_tui_status_bar_text():
-    """Genera el texto formateado para la barra de estado superior de la TUI."""
-    global current_active_version, available_versions, midimaster_assumed_status
-    global tui_last_osc_msg_str, tui_last_osc_msg_time
-
-    version_str = f"Versión: {current_active_version}/{len(available_versions) - 1}"
-    transport_str = f"TPT: {midimaster_assumed_status}"
-    
-    osc_str = "OSC: Inactivo"
-    if osc_server_instance:
-        osc_str = "OSC: Escuchando"
-        if time.time() - tui_last_osc_msg_time < TUI_MSG_TIMEOUT:
-            osc_str = f"OSC: {tui_last_osc_msg_str}"
-
-    parts = [
-        f"<style bg='ansiblue' fg='ansiwhite'> MIDImod v1.40 </style>",
-        f"<b>{version_str}</b>",
-        f"<b>{transport_str}</b>",
-        f"<b>{osc_str}</b>"
-    ]
-    # Devuelve directamente FormattedText
-    return to_formatted_text(HTML(" || ".join(parts)))
+def _format_tui_port_msg(msg):
+    """Texto de la columna IN/OUT del panel de puertos: un mensaje mido o una etiqueta ya hecha."""
+    if msg is None or isinstance(msg, str):
+        return msg or ''
+    return format_midi_message_for_log(msg, prefix="") or msg.type.title()
+
+def _take_tui_snapshot():
+    """Copia, bajo el cerrojo del motor, el estado que muestra la TUI."""
+    with engine_state_lock:
+        return {
+            'version': current_active_version,
+            'num_versions': len(available_versions),
+            'transport': midimaster_assumed_status,
+            'internal_clock_bpm': internal_clock.bpm if internal_clock else None,
+            'osc_listening': osc_server_instance is not None,
+            'osc_msg': tui_last_osc_msg_str,
+            'osc_msg_time': tui_last_osc_msg_time,
+            'ports': sorted(
+                ((port_name, dict({k: v for k, v in port_info.items() if k != 'obj'},
+                                  queue_stats=port_info['obj'].get_queue_stats() if isinstance(port_info.get('obj'), PacedOutputPort) else None))
+                 for port_name, port_info in opened_ports_tracking.items()),
+                key=lambda item: (item[1]['type'], item[0])
+            ),
+            'sequencers': [
+                (str(seq.get('config', {}).get('seq_id', f'SEQ {i}')), seq.get('is_playing'), seq.get('is_armed'), seq.get('last_fire_time', 0))
+                for i, seq in enumerate(sequencers_state)
+            ],
+            'arpeggiators': [
+                (key, arp.get('is_playing'), arp.get('is_armed'), len(arp.get('input_notes', [])), arp.get('last_fire_time', 0))
+                for key, arp in arpeggiator_instances.items()
+            ],
+            'profiler': (_get_profiler_rows()[:TUI_PROFILER_ROWS], _profiler_tick_period()) if profiler_enabled else None,
+            'jitter': _get_jitter_rows()[:TUI_JITTER_ROWS] if jitter_measure_enabled else None,
+            'monitor_dropped': monitor_log_writer.dropped_lines if monitor_log_writer else 0,
+        }
 
-def _get_tui_ports_panel_text():
+TUI_SEPARATOR = "-------------------------------------------------------------------------------------------"
+tui_markup_cache = {}
+
+def _tui_markup(markup):
+    """Fragmentos de un texto fijo con marcas HTML; se analiza una sola vez."""
+    fragments = tui_markup_cache.get(markup)
+    if fragments is None:
+        fragments = tui_markup_cache[markup] = list(to_formatted_text(HTML(markup)))
+    return fragments
+
+def _tui_lines_to_fragments(lines):
+    """Une líneas (listas de fragmentos) en un único bloque con sus saltos de línea."""
+    fragments = []
+    for line in lines:
+        fragments.extend(line)
+        fragments.append(('', '\n'))
+    return fragments
+
+def _get_cached_tui_panel(panel_name, visible_state, build_func):
+    """Devuelve los fragmentos del panel; solo se regeneran si cambia lo que muestra (visible_state)."""
+    cached = tui_panel_cache.get(panel_name)
+    if cached is not None and cached[0] == visible_state:
+        return cached[1], False
+    fragments = build_func(visible_state)
+    tui_panel_cache[panel_name] = (visible_state, fragments)
+    return fragments, True
+
+def _get_tui_status_bar_text(snapshot, now):
+    """Genera el texto formateado para la barra de estado superior de la TUI."""
+    osc_msg = snapshot['osc_msg'] if snapshot['osc_listening'] and now - snapshot['osc_msg_time'] < TUI_MSG_TIMEOUT else None
+    visible_state = (snapshot['version'], snapshot['num_versions'], snapshot['transport'], snapshot['internal_clock_bpm'],
+                     snapshot['osc_listening'], osc_msg, snapshot['monitor_dropped'])
+
+    def build(state):
+        version, num_versions, transport, clock_bpm, osc_listening, osc_msg, dropped = state
+        transport_str = f"TPT: {transport}"
+        if clock_bpm is not None:
+            transport_str += f" (CLK {clock_bpm:g} BPM)"
+        osc_str = "OSC: Inactivo"
+        if osc_listening:
+            osc_str = f"OSC: {osc_msg}" if osc_msg is not None else "OSC: Escuchando"
+        parts = [
+            [('bg:ansiblue fg:ansiwhite', ' MIDImod v1.40 ')],
+            [('class:b', f"Versión: {version}/{num_versions - 1}")],
+            [('class:b', transport_str)],
+            [('class:b', osc_str)],
+        ]
+        if dropped:
+            parts.append([('fg:ansiyellow', f"Log: {dropped} descartadas")])
+        line = []
+        for i, part in enumerate(parts):
+            if i:
+                line.append(('', ' || '))
+            line.extend(part)
+        return _tui_lines_to_fragments([line])
+    return _get_cached_tui_panel('status', visible_state, build)
+
+def _get_tui_ports_panel_text(snapshot, now):
     """Genera el texto para el panel de puertos MIDI."""
-    # Ahora esta función devuelve una lista de objetos FormattedText
-    lines = [] 
-    lines.append(to_formatted_text(HTML("<b>MIDI PORTS         |              IN            |             OUT            |   ACT       </b>")))
-    lines.append(to_formatted_text(HTML("-------------------|----------------------------|----------------------------|-------------")))
-    
-    now = time.time()
-    
-    sorted_ports = sorted(opened_ports_tracking.items(), key=lambda item: (item[1]['type'], item[0]))
-
-    for port_name, port_info in sorted_ports:
-        alias = port_info.get('alias_used', '')
-        display_name = f"{alias[:18]:<18}"
-
-        in_msg = ""
-        if port_info['type'] == 'in' and (now - port_info.get('last_in_msg_time', 0)) < TUI_MSG_TIMEOUT:
-            in_msg = port_info.get('last_in_msg_str') or ''
-        
-        out_msg = ""
-        if (now - port_info.get('last_out_msg_time', 0)) < TUI_MSG_TIMEOUT:
-            out_msg = port_info.get('last_out_msg_str') or ''
-
-        activity_bar = " "
-        if (now - port_info.get('activity_time', 0)) < 0.2: # Actividad muy reciente
-            activity_bar = "<style bg='ansigreen'> </style>" * 10
-        elif (now - port_info.get('activity_time', 0)) < TUI_MSG_TIMEOUT: # Actividad reciente
-            activity_bar = "<style bg='ansiyellow'> </style>" * 3
-
-        line = f"{display_name} | {in_msg[:26]:<26} | {out_msg[:26]:<26} | {activity_bar}"
-        # Cada línea se convierte a FormattedText
-        lines.append(to_formatted_text(HTML(line)))
-        
-    return lines
+    # Estado visible por puerto: hora de los mensajes aún dentro de TUI_MSG_TIMEOUT y nivel de
+    # actividad. La hora identifica el mensaje (los mensajes mido no se comparan con None).
+    visible_state = []
+    port_messages = []
+    for port_name, port_info in snapshot['ports']:
+        in_time = port_info.get('last_in_msg_time', 0)
+        if port_info['type'] != 'in' or (now - in_time) >= TUI_MSG_TIMEOUT:
+            in_time = None
+        out_time = port_info.get('last_out_msg_time', 0)
+        if (now - out_time) >= TUI_MSG_TIMEOUT:
+            out_time = None
+        since_activity = now - port_info.get('activity_time', 0)
+        activity = 2 if since_activity < TUI_ACTIVITY_FLASH else (1 if since_activity < TUI_MSG_TIMEOUT else 0)
+        # Cola con ritmo (PacedOutputPort): mensajes en espera y retraso añadido en ms
+        queue_stats = port_info.get('queue_stats')
+        queue = (queue_stats[0], round(queue_stats[1] * 1000)) if queue_stats else None
+        visible_state.append((port_info.get('alias_used', ''), in_time, out_time, activity, queue))
+        port_messages.append((port_info.get('last_in_msg'), port_info.get('last_out_msg')))
+
+    def build(state):
+        show_queue = any(queue is not None for *_, queue in state)
+        lines = [
+            _tui_markup("<b>MIDI PORTS         |              IN            |             OUT            |"
+                        + ("   QUEUE    |" if show_queue else "") + "   ACT       </b>"),
+            _tui_markup("-------------------|----------------------------|----------------------------|"
+                        + ("------------|" if show_queue else "") + "-------------"),
+        ]
+        for (alias, in_time, out_time, activity, queue), (in_msg, out_msg) in zip(state, port_messages):
+            # Los mensajes se formatean aquí, solo cuando el panel cambia
+            in_str = _format_tui_port_msg(in_msg) if in_time is not None else ""
+            out_str = _format_tui_port_msg(out_msg) if out_time is not None else ""
+            line = [('', f"{alias[:18]:<18} | {in_str[:26]:<26} | {out_str[:26]:<26} | ")]
+            if show_queue:
+                queue_str = f"{queue[0]} +{queue[1]}ms" if queue else ""
+                line.append(('', f"{queue_str[:10]:<10} | "))
+            if activity == 2: # Actividad muy reciente
+                line.append(('bg:ansigreen', " " * 10))
+            elif activity == 1: # Actividad reciente
+                line.append(('bg:ansiyellow', " " * 3))
+            else:
+                line.append(('', " "))
+            lines.append(line)
+        return _tui_lines_to_fragments(lines)
+    return _get_cached_tui_panel('ports', tuple(visible_state), build)
 
-def _get_tui_modules_panel_text():
+def _get_tui_modules_panel_text(snapshot, now):
     """Genera el texto para el panel de módulos activos."""
-    num_seq = len(sequencers_state)
-    num_arp = len(arpeggiator_instances)
-    
-    # Ahora esta función devuelve una lista de objetos FormattedText
-    lines = []
-    lines.append(to_formatted_text(HTML(f"<b>MODULES: {num_seq} Seq / {num_arp} Arp</b>")))
-    lines.append(to_formatted_text(HTML("-------------------------------------------------------------------------------------------")))
-    
-    now = time.time()
-
-    for i, seq in enumerate(sequencers_state):
-        seq_id = seq.get('config', {}).get('seq_id', f'SEQ {i}')
-        state = "PLAY" if seq.get('is_playing') else ("ARM" if seq.get('is_armed') else "STOP")
-        
-        activity_bar = ""
-        if seq.get('is_playing') and (now - seq.get('last_fire_time', 0)) < 0.2:
-             activity_bar = "<style bg='ansigreen'> </style>"
-        
-        line = f"{seq_id[:15]:<15} | {state:<4} | {activity_bar}"
-        # Cada línea se convierte a FormattedText
-        lines.append(to_formatted_text(HTML(line)))
-
-    for key, arp in arpeggiator_instances.items():
-        arp_id = f"ARP[{key[0]},{key[1]}]"
-        state = "PLAY" if arp.get('is_playing') else ("ARM" if arp.get('is_armed') else "STOP")
-        notes = len(arp.get('input_notes', []))
-        
-        activity_bar = ""
-        if arp.get('is_playing') and (now - arp.get('last_fire_time', 0)) < 0.2:
-             activity_bar = "<style bg='ansigreen'> </style>"
+    visible_state = (
+        tuple((seq_id, "PLAY" if is_playing else ("ARM" if is_armed else "STOP"), bool(is_playing and (now - last_fire_time) < TUI_ACTIVITY_FLASH))
+              for seq_id, is_playing, is_armed, last_fire_time in snapshot['sequencers']),
+        tuple((f"ARP[{key[0]},{key[1]}]", "PLAY" if is_playing else ("ARM" if is_armed else "STOP"), notes, bool(is_playing and (now - last_fire_time) < TUI_ACTIVITY_FLASH))
+              for key, is_playing, is_armed, notes, last_fire_time in snapshot['arpeggiators']),
+    )
 
-        line = f"{arp_id[:15]:<15} | {state:<4} | Notas: {notes} {activity_bar}"
-        # Cada línea se convierte a FormattedText
-        lines.append(to_formatted_text(HTML(line)))
+    def build(state):
+        seq_rows, arp_rows = state
+        lines = [
+            [('class:b', f"MODULES: {len(seq_rows)} Seq / {len(arp_rows)} Arp")],
+            _tui_markup(TUI_SEPARATOR),
+        ]
+        for seq_id, state_str, flashing in seq_rows:
+            line = [('', f"{seq_id[:15]:<15} | {state_str:<4} | ")]
+            if flashing:
+                line.append(('bg:ansigreen', " "))
+            lines.append(line)
+        for arp_id, state_str, notes, flashing in arp_rows:
+            line = [('', f"{arp_id[:15]:<15} | {state_str:<4} | Notas: {notes} ")]
+            if flashing:
+                line.append(('bg:ansigreen', " "))
+            lines.append(line)
+        return _tui_lines_to_fragments(lines)
+    return _get_cached_tui_panel('modules', visible_state, build)
+
+def _get_tui_profiler_panel_text(snapshot, now):
+    """Genera el texto para el panel del perfilador (filtros y módulos más costosos)."""
+
+    def build(state):
+        rows, tick_period = state
+        tick_str = f"tick {tick_period * 1e3:.2f} ms" if tick_period else "sin reloj"
+        lines = [
+            [('class:b', f"PROFILER ({tick_str})  |  CALLS   |  TOTAL ms  |  MEAN us  |  MAX ms  |  OUTS")],
+            _tui_markup(TUI_SEPARATOR),
+        ]
+        for key, calls, total_time, max_time, outputs in rows:
+            mean_us = total_time / calls * 1e6 if calls else 0.0
+            line = f"{key[:22]:<22} | {calls:>8} | {total_time * 1e3:>9.1f} | {mean_us:>8.1f} | {max_time * 1e3:>7.2f} | {outputs:>6}"
+            if tick_period and max_time > tick_period:
+                # Este filtro/módulo ha tardado más que un tick de reloj en algún momento
+                lines.append([('fg:ansired', f"{line}  > TICK")])
+            else:
+                lines.append([('', line)])
+        return _tui_lines_to_fragments(lines)
+    rows, tick_period = snapshot['profiler']
+    return _get_cached_tui_panel('profiler', (tuple(rows), tick_period), build)
+
+def _get_tui_jitter_panel_text(snapshot, now):
+    """Genera el texto para el panel de retraso reloj -> salida."""
+
+    def build(state):
+        lines = [
+            _tui_markup("<b>CLOCK→OUT ms | SAMPLES |   MEAN |    P50 |    P99 |     MAX | JITTER</b>"),
+            _tui_markup(TUI_SEPARATOR),
+        ]
+        if not state:
+            lines.append([('', "(esperando notas de secuenciadores/arpegiadores con reloj)")])
+        for row in state:
+            lines.append([('', _format_jitter_row(row))])
+        return _tui_lines_to_fragments(lines)
+    return _get_cached_tui_panel('jitter', tuple(snapshot['jitter']), build)
+
+def _build_tui_content():
+    """Compone la pantalla a partir de los paneles en caché; devuelve None si nada visible ha cambiado."""
+    global tui_screen_content
+    snapshot = _take_tui_snapshot()
+    now = time.time()
+    panels = [_get_tui_status_bar_text, _get_tui_ports_panel_text, _get_tui_modules_panel_text]
+    if snapshot['profiler'] is not None: # Solo con --profile
+        panels.append(_get_tui_profiler_panel_text)
+    if snapshot['jitter'] is not None: # Solo con --measure-jitter
+        panels.append(_get_tui_jitter_panel_text)
+
+    rendered_panels = [panel_func(snapshot, now) for panel_func in panels]
+    if tui_screen_content is not None and not any(changed for _, changed in rendered_panels):
+        return None
 
-    return lines
+    separator = _tui_lines_to_fragments([_tui_markup(TUI_SEPARATOR)])
+    content = []
+    for i, (fragments, _) in enumerate(rendered_panels):
+        if i:
+            content.extend(separator)
+        content.extend(fragments)
+    content.extend(separator)
+    profile_help = "  |  [p] Guardar perfil" if snapshot['profiler'] is not None else ""
+    content.extend(_tui_markup(f"<b>[m] Monitor  |  [Esp] Versión  |  [Enter] Start/Stop{profile_help}  |  [Ctrl+C / q] Exit</b>"))
+    tui_screen_content = content
+    return content
+
+def _tui_refresh_loop(app, stop_event):
+    """Hilo de refresco: redibuja la TUI solo cuando cambia algo visible, como mucho tui_max_refresh_rate veces/s."""
+    refresh_interval = 1.0 / max(1, tui_max_refresh_rate)
+    while not stop_event.wait(refresh_interval):
+        try:
+            if _build_tui_content() is not None:
+                app.invalidate()
+        except Exception as e:
+            if VERBOSE_MODE:
+                print(f"[!] Error refrescando la TUI: {e}")
 
 def _create_tui_layout():
     """Crea el layout de la TUI con todos los paneles."""
+    global tui_screen_content
+    tui_panel_cache.clear()
+    tui_screen_content = None
+    # La primera pantalla se compone aquí, antes de arrancar el hilo de refresco: a partir de entonces
+    # solo ese hilo llama a _build_tui_content() y el hilo de la interfaz se limita a leer el resultado.
+    _build_tui_content()
 
     def get_all_content():
-        """Recopila todo el contenido en una sola lista de FormattedText."""
-        # Esta será la lista final de tuplas (estilo, texto)
-        final_formatted_content = []
-        
-        # Añadir la barra de estado. Es un FormattedText (lista de tuplas).
-        final_formatted_content.extend(_get_tui_status_bar_text())
-        final_formatted_content.append(('', '\n')) # Salto de línea explícito
-
-        # Separador. Convertirlo a FormattedText y añadirlo.
-        final_formatted_content.extend(to_formatted_text(HTML("-------------------------------------------------------------------------------------------")))
-        final_formatted_content.append(('', '\n')) # Salto de línea explícito
-        
-        # Panel de puertos. Cada elemento de _get_tui_ports_panel_text() es un FormattedText (lista de tuplas).
-        # Necesitamos extender la lista final con CADA UNA de estas sublistas.
-        for line_formatted_text in _get_tui_ports_panel_text():
-            final_formatted_content.extend(line_formatted_text)
-            final_formatted_content.append(('', '\n')) # Salto de línea explícito después de cada línea del panel
-
-        # Separador
-        final_formatted_content.extend(to_formatted_text(HTML("-------------------------------------------------------------------------------------------")))
-        final_formatted_content.append(('', '\n')) # Salto de línea explícito
-
-        # Panel de módulos. Similar al de puertos.
-        for line_formatted_text in _get_tui_modules_panel_text():
-            final_formatted_content.extend(line_formatted_text)
-            final_formatted_content.append(('', '\n')) # Salto de línea explícito después de cada línea del panel
-            
-        # Separador y línea de ayuda
-        final_formatted_content.extend(to_formatted_text(HTML("-------------------------------------------------------------------------------------------")))
-        final_formatted_content.append(('', '\n')) # Salto de línea explícito
-        final_formatted_content.extend(to_formatted_text(HTML("<b>[m] Monitor  |  [Esp] Versión  |  [Enter] Start/Stop  |  [Ctrl+C / q] Exit</b>")))
-
-        # Devolver la lista final de tuplas (estilo, texto).
-        return final_formatted_content
+        """Última pantalla compuesta por el hilo de refresco."""
+        return tui_screen_content
 
     # El control de texto recibe la función que devuelve la lista de FormattedText
     main_content_control = FormattedTextControl(text=get_all_content)
@@ -456,17 +709,18 @@ def _create_tui_layout():
 class RuleChangeHandler(FileSystemEventHandler):
     def __init__(self, reload_queue):
         self.queue = reload_queue
-        self.last_event_time = 0
+        self.last_event_times = {} # Por fichero
         self.debounce_period = 0.5 # 500 ms
 
     def on_modified(self, event):
         current_time = time.time()
         if not event.is_directory and event.src_path.endswith('.json'):
             # Debounce para evitar múltiples recargas por un solo guardado
-            if (current_time - self.last_event_time) > self.debounce_period:
+            if (current_time - self.last_event_times.get(event.src_path, 0)) > self.debounce_period:
                 print(f"[*] Fichero de reglas modificado: {os.path.basename(event.src_path)}. Recargando...")
-                self.queue.put("reload")
-                self.last_event_time = current_time
+                self.queue.put(("reload", event.src_path)) # El motor recarga solo este fichero si puede
+                _wake_engine()
+                self.last_event_times[event.src_path] = current_time
 
 def parse_step_duration(duration_input, ppqn):
     # Primero, manejar tipos numéricos directamente.
@@ -598,6 +852,103 @@ def import_from_midi_file(filepath, quantize_grid_str, ppqn, step_total_from_con
 
 
 
+def _build_sequencer_state(i, seq_conf, device_aliases_map):
+    """Crea el estado (parado) de un secuenciador a partir de su configuración."""
+    print(f"  - Cargando Secuenciador #{i}...")
+    
+    new_state = {
+        'config': seq_conf, 'is_playing': False, 'tick_counter': 0, 'cycle_start_tick': 0,
+        'clock_in_port_name': None, 'arrays': {}, 'midi_file_data': {}, 'pending_note_offs': [],
+        'is_armed': False,
+        'event_schedule': [], 'event_fire_ticks': [], 'schedule_needs_rebuild': True, 'last_known_tick': -1,
+        'last_step_total': 0, 'last_ticks_per_step': 0
+    }
+    eval_context = {"version": current_active_version}
+
+    clock_in_alias = seq_conf.get('device_in', seq_conf.get('clock_in'))
+    if clock_in_alias:
+        new_state['clock_in_port_name'] = device_aliases_map.get(clock_in_alias, clock_in_alias)
+    compile_output_blocks(seq_conf.get("output", []))
+    
+    ppqn = int(get_evaluated_value_from_output_config(seq_conf.get('ppqn'), SEQ_DEFAULTS['ppqn'], eval_context, f"SEQ{i}", "ppqn"))
+
+    # --- INICIO: Lógica de longitud de secuencia revisada ---
+    # Primero, cargamos todos los arrays definidos por el usuario tal cual.
+    user_defined_arrays = {}
+    for key, value in seq_conf.items():
+        if key.startswith("seq_") and isinstance(value, list):
+            user_defined_arrays[key] = value
+
+    # Determinamos la longitud de la secuencia.
+    num_steps = 0
+    if 'step_total' in seq_conf:
+        # Caso A: step_total tiene la máxima prioridad.
+        num_steps = int(get_evaluated_value_from_output_config(seq_conf['step_total'], SEQ_DEFAULTS['step_total'], eval_context, f"SEQ{i}", "step_total"))
+    elif user_defined_arrays:
+        # Caso B: Si no hay step_total, la longitud es la del array más largo.
+        num_steps = max(len(arr) for arr in user_defined_arrays.values())
+    else:
+        # Fallback si no hay ni step_total ni arrays.
+        num_steps = SEQ_DEFAULTS['step_total']
+    
+    # Guardamos el número de pasos para usarlo en la reconstrucción de la agenda.
+    # Esto es un truco para que la lógica de redimensionamiento dinámico funcione.
+    seq_conf['step_total'] = num_steps
+
+    # 1. Poblar con los defaults del programa, usando la longitud calculada.
+    for key, value in SEQ_DEFAULTS.items():
+        new_state['arrays'][key] = [value] * num_steps
+
+    if 'global_root_note' in user_variables and 'seq_root_note' not in seq_conf:
+        new_state['arrays']['seq_root_note'] = [user_variables['global_root_note']] * num_steps
+        if VERBOSE_MODE: print(f"    - SEQ{i} hereda 'global_root_note' ({user_variables['global_root_note']}).")
+
+    # 2. Sobrescribir con cualquier array/valor definido en el JSON.
+    for key, value in seq_conf.items():
+        if key in new_state['arrays']:
+            if isinstance(value, list):
+                # Asignamos la lista directamente, sin expandirla.
+                # La lógica de repetición se hará en process_sequencer_step.
+                if len(value) > 0:
+                    new_state['arrays'][key] = value
+            elif value is not None:
+                 # Si es un valor único, creamos un array de ese valor.
+                 new_state['arrays'][key] = [value] * num_steps
+    # --- FIN: Lógica de longitud de secuencia revisada ---
+
+    if 'shift_array' not in seq_conf:
+         new_state['arrays']['shift_array'] = [SEQ_DEFAULTS['shift_array'][0]] * num_steps
+
+    # 3. Sobrescribir con datos del fichero MIDI (máxima prioridad)
+    if "midi_file" in seq_conf and isinstance(seq_conf["midi_file"], list):
+        if len(seq_conf["midi_file"]) > 0:
+            mf_block = seq_conf["midi_file"][0]
+            mf_path = mf_block.get("add_file")
+            if mf_path:
+                track_index = mf_block.get("track_index")
+                start_step = mf_block.get("start_step", 0)
+                imported_data = import_from_midi_file(mf_path, mf_block.get("quantize", "1/16"), ppqn, num_steps, track_index, start_step)
+                if imported_data:
+                    new_state['midi_file_data'][0] = (imported_data, num_steps)
+                    if 'seq_note' in imported_data:
+                        new_state['arrays']['seq_note'] = imported_data['seq_note']
+                        for array_name in ['seq_gate', 'seq_velocity', 'seq_note_length']:
+                            if array_name in imported_data:
+                                new_state['arrays'][array_name] = imported_data[array_name]
+                    
+                    if VERBOSE_MODE:
+                        print(f"    - Sobrescribiendo arrays del SEQ{i} con datos del fichero MIDI:")
+                        notes = new_state['arrays']['seq_note']; gates = new_state['arrays']['seq_gate']; velos = new_state['arrays']['seq_velocity']
+                        log_line_notes = "      Notas:    "; log_line_gates = "      Gates:    "; log_line_velos = "      Velocidad:"
+                        for step in range(num_steps):
+                            note_str = f"{notes[step % len(notes)] if gates[step % len(gates)] == 1 else '---':>3}"
+                            gate_str = f"{gates[step % len(gates)]:>3}"
+                            velo_str = f"{velos[step % len(velos)] if gates[step % len(gates)] == 1 else '---':>3}"
+                            log_line_notes += f" {note_str}"; log_line_gates += f" {gate_str}"; log_line_velos += f" {velo_str}"
+                        print(log_line_notes); print(log_line_gates); print(log_line_velos)
+    return new_state
+
+
 def load_sequencers(full_json_contents, device_aliases_map):
     global sequencers_state, user_variables
 
@@ -614,100 +965,7 @@ def load_sequencers(full_json_contents, device_aliases_map):
     
     for i, seq_conf in enumerate(all_sequencer_configs):
         if not isinstance(seq_conf, dict): continue
-
-        print(f"  - Cargando Secuenciador #{i}...")
-        
-        new_state = {
-            'config': seq_conf, 'is_playing': False, 'tick_counter': 0, 
-            'clock_in_port_name': None, 'arrays': {}, 'midi_file_data': {}, 'pending_note_offs': [],
-            'is_armed': False,
-            'event_schedule': [], 'schedule_needs_rebuild': True, 'last_known_tick': -1,
-            'last_step_total': 0, 'last_ticks_per_step': 0
-        }
-        eval_context = {"version": current_active_version}
-
-        clock_in_alias = seq_conf.get('device_in', seq_conf.get('clock_in'))
-        if clock_in_alias:
-            new_state['clock_in_port_name'] = device_aliases_map.get(clock_in_alias, clock_in_alias)
-        
-        ppqn = int(get_evaluated_value_from_output_config(seq_conf.get('ppqn'), SEQ_DEFAULTS['ppqn'], eval_context, f"SEQ{i}", "ppqn"))
-
-        # --- INICIO: Lógica de longitud de secuencia revisada ---
-        # Primero, cargamos todos los arrays definidos por el usuario tal cual.
-        user_defined_arrays = {}
-        for key, value in seq_conf.items():
-            if key.startswith("seq_") and isinstance(value, list):
-                user_defined_arrays[key] = value
-
-        # Determinamos la longitud de la secuencia.
-        num_steps = 0
-        if 'step_total' in seq_conf:
-            # Caso A: step_total tiene la máxima prioridad.
-            num_steps = int(get_evaluated_value_from_output_config(seq_conf['step_total'], SEQ_DEFAULTS['step_total'], eval_context, f"SEQ{i}", "step_total"))
-        elif user_defined_arrays:
-            # Caso B: Si no hay step_total, la longitud es la del array más largo.
-            num_steps = max(len(arr) for arr in user_defined_arrays.values())
-        else:
-            # Fallback si no hay ni step_total ni arrays.
-            num_steps = SEQ_DEFAULTS['step_total']
-        
-        # Guardamos el número de pasos para usarlo en la reconstrucción de la agenda.
-        # Esto es un truco para que la lógica de redimensionamiento dinámico funcione.
-        seq_conf['step_total'] = num_steps
-
-        # 1. Poblar con los defaults del programa, usando la longitud calculada.
-        for key, value in SEQ_DEFAULTS.items():
-            new_state['arrays'][key] = [value] * num_steps
-
-        if 'global_root_note' in user_variables and 'seq_root_note' not in seq_conf:
-            new_state['arrays']['seq_root_note'] = [user_variables['global_root_note']] * num_steps
-            if VERBOSE_MODE: print(f"    - SEQ{i} hereda 'global_root_note' ({user_variables['global_root_note']}).")
-
-        # 2. Sobrescribir con cualquier array/valor definido en el JSON.
-        for key, value in seq_conf.items():
-            if key in new_state['arrays']:
-                if isinstance(value, list):
-                    # Asignamos la lista directamente, sin expandirla.
-                    # La lógica de repetición se hará en process_sequencer_step.
-                    if len(value) > 0:
-                        new_state['arrays'][key] = value
-                elif value is not None:
-                     # Si es un valor único, creamos un array de ese valor.
-                     new_state['arrays'][key] = [value] * num_steps
-        # --- FIN: Lógica de longitud de secuencia revisada ---
-
-        if 'shift_array' not in seq_conf:
-             new_state['arrays']['shift_array'] = [SEQ_DEFAULTS['shift_array'][0]] * num_steps
-
-        # 3. Sobrescribir con datos del fichero MIDI (máxima prioridad)
-        if "midi_file" in seq_conf and isinstance(seq_conf["midi_file"], list):
-            if len(seq_conf["midi_file"]) > 0:
-                mf_block = seq_conf["midi_file"][0]
-                mf_path = mf_block.get("add_file")
-                if mf_path:
-                    track_index = mf_block.get("track_index")
-                    start_step = mf_block.get("start_step", 0)
-                    imported_data = import_from_midi_file(mf_path, mf_block.get("quantize", "1/16"), ppqn, num_steps, track_index, start_step)
-                    if imported_data:
-                        new_state['midi_file_data'][0] = (imported_data, num_steps)
-                        if 'seq_note' in imported_data:
-                            new_state['arrays']['seq_note'] = imported_data['seq_note']
-                            for array_name in ['seq_gate', 'seq_velocity', 'seq_note_length']:
-                                if array_name in imported_data:
-                                    new_state['arrays'][array_name] = imported_data[array_name]
-                        
-                        if VERBOSE_MODE:
-                            print(f"    - Sobrescribiendo arrays del SEQ{i} con datos del fichero MIDI:")
-                            notes = new_state['arrays']['seq_note']; gates = new_state['arrays']['seq_gate']; velos = new_state['arrays']['seq_velocity']
-                            log_line_notes = "      Notas:    "; log_line_gates = "      Gates:    "; log_line_velos = "      Velocidad:"
-                            for step in range(num_steps):
-                                note_str = f"{notes[step % len(notes)] if gates[step % len(gates)] == 1 else '---':>3}"
-                                gate_str = f"{gates[step % len(gates)]:>3}"
-                                velo_str = f"{velos[step % len(velos)] if gates[step % len(gates)] == 1 else '---':>3}"
-                                log_line_notes += f" {note_str}"; log_line_gates += f" {gate_str}"; log_line_velos += f" {velo_str}"
-                            print(log_line_notes); print(log_line_gates); print(log_line_velos)
-
-        sequencers_state.append(new_state)
+        sequencers_state.append(_build_sequencer_state(i, seq_conf, device_aliases_map))
 
 
 def process_sequencer_step(seq_index, seq_state, fire_at_tick, mido_ports_map_g, is_virtual_mode_now, virtual_out_obj=None, virtual_out_name=""):
@@ -782,9 +1040,10 @@ def process_sequencer_step(seq_index, seq_state, fire_at_tick, mido_ports_map_g,
     # 2. Determinar qué bloques de 'output' procesar
     output_blocks = seq_conf.get("output", [])
     if not output_blocks:
-        output_blocks = [{"event_out": "note"}]
+        output_blocks = DEFAULT_SEQUENCER_OUTPUT_BLOCKS
 
     # 3. Iterar, procesar y ENVIAR cada bloque de 'output'
+    messages_sent = 0
     for i, out_block in enumerate(output_blocks):
         if not isinstance(out_block, dict):
             continue
@@ -803,9 +1062,10 @@ def process_sequencer_step(seq_index, seq_state, fire_at_tick, mido_ports_map_g,
                 continue
 
             try:
-                dest_port_obj.send(msg_to_send)
+                _queue_output(dest_port_obj, msg_to_send, f"SEQ[{seq_index}]" if jitter_measure_enabled else None)
                 _update_tui_port_out_data(dest_port_obj, msg_to_send, dest_alias_str)
                 seq_state['last_fire_time'] = time.time()
+                messages_sent += 1
 
                 if monitor_active:
                     total_steps = len(seq_state['arrays'].get('seq_gate', []))
@@ -827,11 +1087,12 @@ def process_sequencer_step(seq_index, seq_state, fire_at_tick, mido_ports_map_g,
                         note_off_fire_at = fire_at_tick + note_off_delay
 
                         note_off_msg = mido.Message('note_off', channel=msg_to_send.channel, note=msg_to_send.note)
-                        seq_state['pending_note_offs'].append((note_off_fire_at, note_off_msg, dest_port_obj, dest_alias_str))
+                        _schedule_note_off(seq_state, seq_state['cycle_start_tick'] + note_off_fire_at, note_off_msg, dest_port_obj, dest_alias_str)
 
             except Exception as e:
                 if monitor_active:
                     print(f"  [!] Error enviando mensaje de SEQ[{seq_index}]: {e}")
+    return messages_sent
 
 def load_arpeggiators(full_json_contents):
     global arpeggiator_templates
@@ -846,24 +1107,30 @@ def load_arpeggiators(full_json_contents):
 
     print("\n--- Configuración de Plantillas de Arpegiador ---")
     for i, arp_conf in enumerate(all_arp_configs):
-        if not isinstance(arp_conf, dict) or "arp_id" not in arp_conf:
-            print(f"  [!] ADVERTENCIA ARP: Configuración de arpegiador #{i} inválida (falta 'arp_id').")
-            continue
-        
-        arp_id = arp_conf["arp_id"]
-        if not isinstance(arp_id, int):
-            print(f"  [!] ADVERTENCIA ARP: El 'arp_id' debe ser un número entero. Ignorando config #{i}.")
-            continue
+        arp_template = _build_arp_template(i, arp_conf)
+        if arp_template:
+            arpeggiator_templates[arp_template[0]] = arp_template[1]
+
+def _build_arp_template(i, arp_conf):
+    """Devuelve (arp_id, plantilla con los valores por defecto) o None si la configuración no es válida."""
+    if not isinstance(arp_conf, dict) or "arp_id" not in arp_conf:
+        print(f"  [!] ADVERTENCIA ARP: Configuración de arpegiador #{i} inválida (falta 'arp_id').")
+        return None
 
-        print(f"  - Cargando Plantilla de Arpegiador id:{arp_id}...")
-        
-        final_config = ARP_DEFAULTS.copy()
-        final_config.update(arp_conf)
+    arp_id = arp_conf["arp_id"]
+    if not isinstance(arp_id, int):
+        print(f"  [!] ADVERTENCIA ARP: El 'arp_id' debe ser un número entero. Ignorando config #{i}.")
+        return None
+
+    print(f"  - Cargando Plantilla de Arpegiador id:{arp_id}...")
+
+    final_config = ARP_DEFAULTS.copy()
+    final_config.update(arp_conf)
 
-        if "octave_mode" in final_config:
-            final_config["arp_octave_mode"] = final_config["octave_mode"]
+    if "octave_mode" in final_config:
+        final_config["arp_octave_mode"] = final_config["octave_mode"]
 
-        arpeggiator_templates[arp_id] = final_config
+    return arp_id, final_config
 
 
 def _recalculate_arp_pattern(instance, instance_key=None):
@@ -1083,16 +1350,12 @@ def process_arpeggiator_step(instance_key, instance_state, mido_ports_map_g, is_
     device_out_alias = arp_conf.get('device_out')
     if not device_out_alias: return
     
-    target_port_obj = None
-    out_dev_sub = global_device_aliases.get(device_out_alias, device_out_alias)
-    for p_name, p_info in mido_ports_map_g.items():
-        if p_info["type"] == "out" and out_dev_sub.lower() in p_name.lower():
-            target_port_obj = p_info["obj"]; break
+    target_port_obj = _resolve_output_port(device_out_alias)
     
     if target_port_obj:
         final_channel = instance_key[1]
         out_msg = mido.Message('note_on', channel=final_channel, note=final_note, velocity=final_vel)
-        target_port_obj.send(out_msg)
+        _queue_output(target_port_obj, out_msg, f"ARP[{instance_key[0]},{instance_key[1]}]" if jitter_measure_enabled else None)
         _update_tui_port_out_data(target_port_obj, out_msg, device_out_alias)
         instance_state['last_fire_time'] = time.time()
         
@@ -1109,11 +1372,245 @@ def process_arpeggiator_step(instance_key, instance_state, mido_ports_map_g, is_
 
         note_len_factor = float(get_evaluated_value_from_output_config(arp_conf.get('arp_note_length', 0.9), 0.9, eval_context, log_id_str, "arp_note_length"))
         note_off_delay = int(round(ticks_for_step * note_len_factor))
-        fire_at_tick = current_tick + note_off_delay
+        # Las note-off del arpegiador se programan sobre su reloj absoluto ('clock_tick'),
+        # no sobre 'tick_counter', que se descuenta en cada paso.
+        fire_at_tick = instance_state['clock_tick'] + note_off_delay
         note_off_msg = mido.Message('note_off', channel=final_channel, note=final_note)
-        instance_state['pending_note_offs'].append((fire_at_tick, note_off_msg, target_port_obj, device_out_alias))
+        _schedule_note_off(instance_state, fire_at_tick, note_off_msg, target_port_obj, device_out_alias)
+        return 1
+
+
+
+# --- Etapa de salida por ciclo ---
+# Lo que genera una iteración del motor (filtros, OSC, versiones, secuenciadores, arpegiadores,
+# note-offs) se agrupa por puerto y se envía de una vez al final de la iteración. Dentro de un
+# puerto se respeta el orden; un CC que repite canal y control antes de cualquier otro tipo de
+# mensaje sustituye al anterior (solo sale el último valor, en el sitio del primero).
+output_batch = {} # puerto -> [(mensaje, módulo para la medición de jitter o None)]
+output_batch_cc_slots = {} # puerto -> {(canal, control): índice en su lista}
+OUTPUT_CC_NO_COALESCE = frozenset({0, 6, 32, 38, 96, 97, 98, 99, 100, 101}) # Bank select y (N)RPN: cuenta cada mensaje
+output_cc_coalesced = 0
+
+def _queue_output(port_obj, msg, jitter_key=None, rate_policy=None):
+    """Añade un mensaje a la salida del ciclo (ver _flush_output_batch), pasando antes por el límite de ritmo de CC."""
+    if msg.type == 'control_change' and (rate_policy or output_rate_policies):
+        policy = rate_policy or output_rate_policies.get(port_obj)
+        if policy and not _cc_rate_limit_allows(port_obj, msg, policy):
+            return
+    _batch_output(port_obj, msg, jitter_key)
+
+def _batch_output(port_obj, msg, jitter_key=None):
+    global output_cc_coalesced
+    port_messages = output_batch.get(port_obj)
+    if port_messages is None:
+        port_messages = output_batch[port_obj] = []
+        cc_slots = output_batch_cc_slots[port_obj] = {}
+    else:
+        cc_slots = output_batch_cc_slots[port_obj]
+    if msg.type == 'control_change' and msg.control not in OUTPUT_CC_NO_COALESCE:
+        slot_key = (msg.channel, msg.control)
+        slot = cc_slots.get(slot_key)
+        if slot is not None:
+            port_messages[slot] = (msg, jitter_key)
+            output_cc_coalesced += 1
+            return
+        cc_slots[slot_key] = len(port_messages)
+    elif cc_slots:
+        cc_slots.clear() # Nota, PC, sysex...: los CC anteriores ya no se pueden fundir con los siguientes
+    port_messages.append((msg, jitter_key))
+
+def _flush_output_batch():
+    """Envía lo acumulado en el ciclo, puerto a puerto y en orden."""
+    if not output_batch:
+        return
+    for port_obj, port_messages in output_batch.items():
+        if port_obj.closed:
+            continue
+        send = port_obj.send
+        for msg, jitter_key in port_messages:
+            try:
+                send(msg)
+            except Exception as e_send:
+                if monitor_active:
+                    print(f"  ERR SEND: {e_send} (msg: {msg})")
+                continue
+            if jitter_key:
+                _jitter_note_send(jitter_key)
+    output_batch.clear()
+    output_batch_cc_slots.clear()
+
+# --- Límite de ritmo de CC por salida ---
+# "output_rate_limit": {"VIRUS": {"cc_max_rate": 30}} en el fichero de reglas (por alias de salida) o
+# "cc_max_rate" en un filtro. Cada (puerto, canal, CC) sale como mucho cc_max_rate veces por segundo;
+# lo que llega entre medias queda pendiente (solo el último valor) y el motor lo envía al vencer el
+# intervalo. Con "cc_skip_unchanged" (activo por defecto) no se repite el último valor enviado al puerto.
+# "bytes_per_sec" (número o "din") en la misma entrada del alias activa la cola con ritmo de PacedOutputPort.
+output_rate_policies = {} # puerto -> (intervalo mínimo, omitir valores repetidos)
+filter_rate_policies = {} # id de filtro -> (intervalo mínimo, omitir valores repetidos)
+cc_rate_state = {} # (puerto, canal, control) -> [próximo envío permitido, mensaje pendiente, último valor enviado, intervalo]
+cc_rate_pending = set() # Claves de cc_rate_state con un valor pendiente
+cc_rate_next_due = None # Instante del próximo pendiente (acorta la espera del motor)
+
+def _cc_rate_clock():
+    """perf_counter en vivo; en render, el instante virtual del backend (el render no transcurre en tiempo real)."""
+    if offline_mode and isinstance(midi_backend, LoopbackMidiBackend):
+        return midi_backend.now()
+    return time.perf_counter()
+
+def _make_cc_rate_policy(conf, source_desc):
+    """Convierte {"cc_max_rate": N, "cc_skip_unchanged": bool} en (intervalo mínimo, omitir repetidos)."""
+    if not isinstance(conf, dict):
+        return None
+    max_rate = conf.get("cc_max_rate")
+    try:
+        min_interval = 1.0 / float(max_rate) if max_rate and float(max_rate) > 0 else 0.0
+    except (TypeError, ValueError):
+        print(f"  [!] 'cc_max_rate' no válido en {source_desc}: {max_rate!r}")
+        return None
+    return (min_interval, bool(conf.get("cc_skip_unchanged", True)))
 
+def _parse_bytes_per_sec(value, source_desc):
+    """'din' -> DIN_BYTES_PER_SEC; número positivo -> bytes/s; lo demás (o 0) -> sin límite."""
+    if isinstance(value, str) and value.strip().lower() == "din":
+        return DIN_BYTES_PER_SEC
+    try:
+        return float(value) if value is not None and float(value) > 0 else None
+    except (TypeError, ValueError):
+        print(f"  [!] 'bytes_per_sec' no válido en {source_desc}: {value!r}")
+        return None
 
+def _cc_rate_limit_allows(port_obj, msg, policy):
+    """Decide si un CC sale ya; si no, lo deja como pendiente (o lo descarta por repetido)."""
+    min_interval, skip_unchanged = policy
+    key = (port_obj, msg.channel, msg.control)
+    state = cc_rate_state.get(key)
+    if state is None:
+        state = cc_rate_state[key] = [0.0, None, None, min_interval]
+    state[3] = min_interval
+    if skip_unchanged and msg.value == state[2]:
+        if state[1] is not None: # Se vuelve al valor ya enviado: lo pendiente sobra
+            state[1] = None
+            cc_rate_pending.discard(key)
+        return False
+    now = _cc_rate_clock()
+    if now >= state[0]:
+        state[0] = now + min_interval
+        state[1] = None
+        state[2] = msg.value
+        cc_rate_pending.discard(key)
+        return True
+    state[1] = msg
+    cc_rate_pending.add(key)
+    return False
+
+def _flush_due_rate_limited_ccs():
+    """Pasa a la salida del ciclo los valores pendientes cuyo intervalo ha vencido."""
+    global cc_rate_next_due
+    cc_rate_next_due = None
+    if not cc_rate_pending:
+        return
+    now = _cc_rate_clock()
+    for key in list(cc_rate_pending):
+        state = cc_rate_state[key]
+        if now >= state[0]:
+            port_obj, msg = key[0], state[1]
+            state[0] = now + state[3]
+            state[1] = None
+            state[2] = msg.value
+            cc_rate_pending.discard(key)
+            if not port_obj.closed:
+                _batch_output(port_obj, msg)
+        elif cc_rate_next_due is None or state[0] < cc_rate_next_due:
+            cc_rate_next_due = state[0]
+
+def _rebuild_cc_rate_policies():
+    """Resuelve las políticas de 'output_rate_limit' y de los filtros tras (re)cargar las reglas."""
+    global cc_rate_next_due
+    for key in cc_rate_pending: # Lo pendiente se entrega ya: tras la recarga las políticas pueden cambiar
+        if not key[0].closed:
+            _batch_output(key[0], cc_rate_state[key][1])
+    cc_rate_pending.clear()
+    cc_rate_state.clear()
+    cc_rate_next_due = None
+    output_rate_policies.clear()
+    filter_rate_policies.clear()
+    port_bandwidths = {}
+    for content in full_json_contents:
+        rate_conf = content.get("output_rate_limit")
+        if not isinstance(rate_conf, dict):
+            continue
+        for alias, policy_conf in rate_conf.items():
+            port_obj = _resolve_output_port(alias)
+            if isinstance(policy_conf, dict) and "bytes_per_sec" in policy_conf:
+                bytes_per_sec = _parse_bytes_per_sec(policy_conf["bytes_per_sec"], f"output_rate_limit['{alias}']")
+                if bytes_per_sec and port_obj:
+                    port_bandwidths[port_obj] = bytes_per_sec
+                    print(f"  - [RATE] '{alias}': cola con ritmo a {bytes_per_sec:g} bytes/s"
+                          f"{' (sin efecto en modo offline)' if offline_mode else ''}")
+                if not ("cc_max_rate" in policy_conf or "cc_skip_unchanged" in policy_conf):
+                    continue
+            policy = _make_cc_rate_policy(policy_conf, f"output_rate_limit['{alias}']")
+            if policy and port_obj:
+                output_rate_policies[port_obj] = policy
+                rate_desc = f"máx {1.0 / policy[0]:g} CC/s por control" if policy[0] else "sin límite de ritmo"
+                print(f"  - [RATE] '{alias}': {rate_desc}{', sin repetir valores' if policy[1] else ''}")
+    for p_info in opened_ports_tracking.values():
+        if p_info["type"] == "out" and isinstance(p_info["obj"], PacedOutputPort):
+            # En render/benchmark el tiempo no es real: la salida no se retiene
+            p_info["obj"].set_bandwidth(None if offline_mode else port_bandwidths.get(p_info["obj"]))
+    for f_config in all_loaded_filters + all_loaded_osc_filters:
+        if "cc_max_rate" in f_config or "cc_skip_unchanged" in f_config:
+            policy = _make_cc_rate_policy(f_config, f"el filtro {f_config.get('_filter_id_str', '?')}")
+            if policy:
+                filter_rate_policies[f_config.get('_filter_id_str')] = policy
+
+# --- SysEx por partes ---
+# Una plantilla 'sysex_data' con varios mensajes (separados por 0xF7) se envía parte a parte;
+# con "sysex_chunk_delay" (ms) cada parte espera en esta agenda a que pase la pausa.
+sysex_chunk_schedule = [] # montículo de (perf_counter de envío, nº de orden, puerto, mensaje)
+_sysex_chunk_order = itertools.count()
+
+def _schedule_sysex_chunks(port_obj, messages, delay_seconds):
+    """Agenda las partes de un SysEx; la primera sale en este mismo ciclo."""
+    start = time.perf_counter()
+    for index, msg in enumerate(messages):
+        if index == 0 or delay_seconds <= 0 or offline_mode: # En render/benchmark no hay tiempo real que esperar
+            _queue_output(port_obj, msg)
+        else:
+            heapq.heappush(sysex_chunk_schedule, (start + index * delay_seconds, next(_sysex_chunk_order), port_obj, msg))
+
+def _flush_due_sysex_chunks():
+    """Pasa a la salida del ciclo las partes de SysEx cuya pausa ha vencido."""
+    now = time.perf_counter()
+    while sysex_chunk_schedule and sysex_chunk_schedule[0][0] <= now:
+        _, _, port_obj, msg = heapq.heappop(sysex_chunk_schedule)
+        if not port_obj.closed:
+            _queue_output(port_obj, msg)
+
+def _get_engine_wait_timeout():
+    """Espera máxima del motor: ENGINE_IDLE_WAIT, o menos si hay un CC o una parte de SysEx por vencer."""
+    next_due = cc_rate_next_due
+    if sysex_chunk_schedule and (next_due is None or sysex_chunk_schedule[0][0] < next_due):
+        next_due = sysex_chunk_schedule[0][0]
+    if next_due is None:
+        return ENGINE_IDLE_WAIT
+    return max(0.0, min(ENGINE_IDLE_WAIT, next_due - time.perf_counter()))
+
+# --- Agenda de note-off ---
+# 'pending_note_offs' de cada módulo es un montículo (heapq) de
+# (tick absoluto, nº de orden, mensaje, puerto, alias): inserción y extracción O(log n).
+_note_off_order = itertools.count()
+
+def _schedule_note_off(module_state, fire_at_tick, note_off_msg, target_port_obj, device_out_alias):
+    heapq.heappush(module_state['pending_note_offs'], (fire_at_tick, next(_note_off_order), note_off_msg, target_port_obj, device_out_alias))
+
+def _pop_due_note_offs(module_state, current_tick):
+    """Extrae, en orden de tick, las note-off cuyo tick absoluto ya ha llegado."""
+    pending_heap = module_state['pending_note_offs']
+    due_note_offs = []
+    while pending_heap and pending_heap[0][0] <= current_tick:
+        due_note_offs.append(heapq.heappop(pending_heap))
+    return due_note_offs
 
 def _silence_instance(instance_state, module_type_str=""):
 
@@ -1122,11 +1619,11 @@ def _silence_instance(instance_state, module_type_str=""):
     if not instance_state or 'pending_note_offs' not in instance_state:
         return
 
-    # Iterar sobre una copia para poder modificar la original de forma segura
-    for _, note_off_msg, target_port_obj, device_out_alias in list(instance_state['pending_note_offs']):
+    # Iterar sobre una copia (en orden de programación) para poder modificar la original de forma segura
+    for _, _, note_off_msg, target_port_obj, device_out_alias in sorted(instance_state['pending_note_offs'], key=lambda entry: entry[1]):
         if target_port_obj and not target_port_obj.closed:
             try:
-                target_port_obj.send(note_off_msg)
+                _queue_output(target_port_obj, note_off_msg)
                 _update_tui_port_out_data(target_port_obj, note_off_msg, device_out_alias)
                 if monitor_active:
                     log_line = format_midi_message_for_log(note_off_msg, prefix=f"   silenced {module_type_str}: ", target_port_alias_for_log_output=device_out_alias)
@@ -1137,18 +1634,89 @@ def _silence_instance(instance_state, module_type_str=""):
     # Vaciar la lista de notas pendientes
     instance_state['pending_note_offs'].clear()
 
-def _find_port_name_by_alias(alias, open_ports, device_aliases):
-    """Encuentra el nombre completo de un puerto abierto a partir de su alias."""
+def _find_port_name_by_alias(alias):
+    """Encuentra el nombre completo de un puerto abierto a partir de su alias (con caché)."""
     if not alias:
         return None
-    for p_name, p_info in open_ports.items():
+    if alias in port_name_by_alias:
+        return port_name_by_alias[alias]
+    found_port_name = None
+    for p_name, p_info in opened_ports_tracking.items():
         if p_info.get('alias_used') == alias:
-            return p_name
-    resolved_substring = device_aliases.get(alias, alias)
-    for p_name in open_ports.keys():
-        if resolved_substring.lower() in p_name.lower():
-            return p_name
-    return None
+            found_port_name = p_name
+            break
+    if found_port_name is None:
+        resolved_substring = str(global_device_aliases.get(alias, alias)).lower()
+        if resolved_substring == INTERNAL_CLOCK_ALIAS:
+            found_port_name = INTERNAL_CLOCK_PORT_NAME
+        else:
+            for p_name in opened_ports_tracking.keys():
+                if resolved_substring in p_name.lower():
+                    found_port_name = p_name
+                    break
+    port_name_by_alias[alias] = found_port_name
+    return found_port_name
+
+def _resolve_output_port(alias):
+    """Devuelve el objeto del primer puerto de salida abierto cuyo nombre contiene el alias resuelto (con caché)."""
+    try:
+        return output_port_by_alias[alias]
+    except KeyError:
+        pass
+    except TypeError:
+        return None # Alias no válido como clave (p.ej. una lista)
+    target_port_obj = None
+    out_dev_sub = str(global_device_aliases.get(alias, alias)).lower()
+    for p_name, p_info in opened_ports_tracking.items():
+        if p_info["type"] == "out" and out_dev_sub in p_name.lower():
+            target_port_obj = p_info["obj"]
+            break
+    output_port_by_alias[alias] = target_port_obj
+    return target_port_obj
+
+def _rebuild_port_alias_tables():
+    """Invalida y vuelve a resolver las tablas de alias tras abrir/cerrar puertos."""
+    output_port_by_alias.clear()
+    port_name_by_alias.clear()
+    for alias in global_device_aliases:
+        _resolve_output_port(alias)
+        _find_port_name_by_alias(alias)
+
+def _arp_clock_source(arp_config):
+    """Nombre (o parte del nombre) del puerto cuyo reloj sigue un arpegiador; None si no tiene."""
+    arp_clock_in_alias = arp_config.get('clock_in', arp_config.get('device_in'))
+    if not arp_clock_in_alias:
+        return None
+    return str(global_device_aliases.get(arp_clock_in_alias, arp_clock_in_alias))
+
+def _build_clock_subscription(port_name):
+    """Calcula y guarda qué secuenciadores y arpegiadores avanzan con el reloj de un puerto."""
+    port_name_lower = port_name.lower()
+    seq_subscribers = [
+        (i, seq_state) for i, seq_state in enumerate(sequencers_state)
+        if seq_state['clock_in_port_name'] and str(seq_state['clock_in_port_name']).lower() in port_name_lower
+    ]
+    arp_subscribers = []
+    for key, instance in arpeggiator_instances.items():
+        arp_clock_in_substr = _arp_clock_source(instance['config'])
+        if arp_clock_in_substr and arp_clock_in_substr.lower() in port_name_lower:
+            arp_subscribers.append((key, instance))
+    subscription = (seq_subscribers, arp_subscribers)
+    clock_subscribers[port_name] = subscription
+    return subscription
+
+def _get_clock_subscribers(port_name):
+    """Devuelve (secuenciadores, arpegiadores) suscritos al reloj de un puerto."""
+    try:
+        return clock_subscribers[port_name]
+    except KeyError:
+        return _build_clock_subscription(port_name) # Puerto no previsto (p.ej. virtual)
+
+def _rebuild_clock_subscriptions():
+    """Reconstruye la tabla de suscripciones de reloj para todos los puertos de entrada conocidos."""
+    clock_subscribers.clear()
+    for port_name in list(active_input_handlers) + [INTERNAL_CLOCK_PORT_NAME]:
+        _build_clock_subscription(port_name)
 
 def _load_staged_config(rule_files_to_load, base_dir):
     """Carga una configuración completa en un diccionario temporal para el staging."""
@@ -1240,6 +1808,7 @@ def global_panic(trigger_source="comando STOP"):
         _silence_instance(instance_state, f"ARP[{key[0]},{key[1]}]")
 
     # 3. Enviar CC 123 (All Notes Off) a todos los puertos de salida en todos los canales
+    _flush_output_batch() # Primero las note-off de los módulos silenciados
     for port_name, port_info in opened_ports_tracking.items():
         if port_info["type"] == "out" and port_info["obj"] and not port_info["obj"].closed:
             if monitor_active:
@@ -1330,6 +1899,8 @@ def _rebuild_sequencer_schedule(seq_index, seq_state):
         new_schedule.sort(key=lambda x: x['fire_at'])
         
         seq_state['event_schedule'] = new_schedule
+        # Índice por tick (ordenado) de la agenda: localiza por bisección los pasos que vencen.
+        seq_state['event_fire_ticks'] = [ev['fire_at'] for ev in new_schedule]
         seq_state['schedule_needs_rebuild'] = False
 
         seq_state['current_cycle_duration'] = new_num_steps * ticks_per_base_step
@@ -1350,6 +1921,7 @@ def _rebuild_sequencer_schedule(seq_index, seq_state):
 def signal_handler(sig, frame):
     global shutdown_flag
     shutdown_flag = True
+    _wake_engine()
     print("\n[*] Interrupción recibida")
 
 def find_port_by_substring(ports, sub, type_desc="puerto"):
@@ -1360,10 +1932,48 @@ def find_port_by_substring(ports, sub, type_desc="puerto"):
     return None
 
 
+# --- Caché de reglas en disco ---
+# json5 es un analizador en Python puro y lento con ficheros grandes. El resultado de cada fichero se
+# guarda con marshal en RULE_CACHE_DIR; la clave combina ruta, contenido y versiones de Python/json5,
+# así que un fichero editado (o otro intérprete) nunca lee una entrada antigua.
+RULE_CACHE_DIR = Path("./.midimod_cache")
+RULE_CACHE_FORMAT = 1 # Subir si cambia lo que se guarda
+RULE_CACHE_MAX_ENTRIES = 256 # Al superarlo se borran las entradas más antiguas
+rule_cache_enabled = True
+
+def _rule_cache_path(filepath, raw_content):
+    key = hashlib.blake2b(digest_size=16)
+    for part in (str(RULE_CACHE_FORMAT), sys.version, str(marshal.version), getattr(json5, "__version__", ""), str(filepath.resolve())):
+        key.update(part.encode('utf-8') + b"\0")
+    key.update(raw_content)
+    return RULE_CACHE_DIR / (key.hexdigest() + ".marshal")
+
+def _store_rule_cache(cache_path, content):
+    """Guarda el contenido analizado (escritura atómica). Si no se puede, se sigue sin caché."""
+    try:
+        RULE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=RULE_CACHE_DIR, suffix=".tmp", delete=False) as tmp_file:
+            tmp_file.write(marshal.dumps(content))
+        os.replace(tmp_file.name, cache_path)
+        cache_entries = sorted(RULE_CACHE_DIR.glob("*.marshal"), key=lambda entry: entry.stat().st_mtime)
+        for old_entry in cache_entries[:-RULE_CACHE_MAX_ENTRIES]:
+            old_entry.unlink()
+    except (OSError, ValueError) as e:
+        verbose_print(f"  [!] No se pudo guardar la caché de '{cache_path.name}': {e}")
+
 def _load_json_file_content(filepath: Path):
     if not filepath.is_file(): print(f"Err: Archivo '{filepath.name}' no encontrado."); return None
     try:
-        with open(filepath, 'r', encoding='utf-8') as f: content = json5.load(f) 
+        with open(filepath, 'rb') as f: raw_content = f.read()
+        cache_path = _rule_cache_path(filepath, raw_content) if rule_cache_enabled else None
+        if cache_path and cache_path.is_file():
+            try:
+                return marshal.loads(cache_path.read_bytes())
+            except (OSError, EOFError, ValueError, TypeError):
+                pass # Entrada dañada: se vuelve a analizar
+        content = json5.loads(raw_content.decode('utf-8'))
+        if cache_path:
+            _store_rule_cache(cache_path, content)
         return content
     except Exception as e: 
         print(f"Err inesperado cargando o parseando '{filepath.name}': {e}")
@@ -1464,202 +2074,371 @@ def collect_available_versions_from_filters(all_filters):
         available_versions = [0]
 
 
-def evaluate_expression(expression_str, context_vars_for_eval):
-    global user_variables, channel_arrays
-
-    if not isinstance(expression_str, (str, int, float, list, dict)): return expression_str 
-    if isinstance(expression_str, (int, float)): return int(expression_str)
-
-    current_expr_str = str(expression_str)
+# --- Caché de expresiones compiladas ---
+# Cada texto de expresión se clasifica y compila una sola vez (clave: el propio texto).
+# Se vacía en cada recarga de reglas.
+compiled_expression_cache = {}
+EXPRESSION_CACHE_MAX_SIZE = 4096
+RANDOM_EXPRESSION_PATTERN = re.compile(r"^\s*random\s*\(\s*(.+)\s*,\s*(.+)\s*\)\s*$", re.IGNORECASE)
 
+def _compile_expression(expr_text):
+    """
+    Clasifica una expresión: 'int' y 'const' (literales), 'random' (min, max), 'name' (variable
+    simple), 'code' (objeto de código para eval) o 'invalid' (no compila).
+    """
     try:
-        return int(current_expr_str)
+        return ('int', int(expr_text))
     except ValueError:
-        pass 
+        pass
 
-    
-    random_match = re.match(r"^\s*random\s*\(\s*(.+)\s*,\s*(.+)\s*\)\s*$", current_expr_str, re.IGNORECASE)
+    random_match = RANDOM_EXPRESSION_PATTERN.match(expr_text)
     if random_match:
-        min_expr_str = random_match.group(1).strip()
-        max_expr_str = random_match.group(2).strip()
-        min_val = evaluate_expression(min_expr_str, context_vars_for_eval)
-        max_val = evaluate_expression(max_expr_str, context_vars_for_eval)
-        if isinstance(min_val, int) and isinstance(max_val, int):
-            if min_val > max_val: min_val, max_val = max_val, min_val
-            try: return random.randint(min_val, max_val)
-            except ValueError: return min_val 
-        return None
-    
-    eval_locals = context_vars_for_eval.copy()
-
-    # Añade alias más amigables para las variables de entrada comunes.
-    public_to_internal_var_map = {
-        "channel_in": "ch0_in_ctx", "ch_in": "ch0_in_ctx", "channel": "ch0_in_ctx",
-        "value_1_in": "value_in_1_ctx", "value_1": "value_in_1_ctx",
-        "value_2_in": "value_in_2_ctx", "value_2": "value_in_2_ctx",
-        "delta_in": "delta_in_2_ctx",
-        "cc_val2_saved": "cc_value_sent_ctx",
-        "event_in": "event_type_in_ctx", "event": "event_type_in_ctx",
-        "cc_type_in": "cc_type_in_ctx", "cc_type": "cc_type_in_ctx"
-    }
-    for public_name, internal_name in public_to_internal_var_map.items():
-        if internal_name in context_vars_for_eval:
-            eval_locals[public_name] = context_vars_for_eval[internal_name]
+        return ('random', (random_match.group(1).strip(), random_match.group(2).strip()))
 
-    # Añade las variables de usuario globales, que pueden sobrescribir otras si tienen el mismo nombre.
-    eval_locals.update(user_variables)
+    stripped_text = expr_text.strip()
+    if stripped_text.isidentifier() and not keyword.iskeyword(stripped_text):
+        return ('name', stripped_text)
 
-    # if VERBOSE_MODE and "step" in context_vars_for_eval: # Solo para logs del secuenciador
-    #     verbose_print(f"    - DEBUG_EVAL: Expresión='{expression_str}'")
-    #     verbose_print(f"    - DEBUG_EVAL: Contexto RECIBIDO: {context_vars_for_eval}")
-    #     verbose_print(f"    - DEBUG_EVAL: Contexto CONSTRUIDO para eval(): {eval_locals}")
-
-    eval_locals['random'] = random.randint
-    eval_locals['prob'] = lambda p: 1 if random.random() < float(p) else 0
+    try:
+        code_obj = compile(expr_text, "<expresion>", "eval")
+    except (SyntaxError, ValueError):
+        return ('invalid', stripped_text)
 
-    def _toggle_func(value_arg):
-        """Invierte un valor numérico (0 a 1, y cualquier otro número a 0)."""
-        try:
-            # El argumento ya debería ser un número evaluado.
-            current_val = int(value_arg)
-            return 1 if current_val == 0 else 0
-        except (ValueError, TypeError):
-            # Si la expresión no resolvió a un número, retorna 0 de forma segura.
-            return 0
-
-    eval_locals['toggle'] = _toggle_func
-
-    def _chord_func(root, num_notes=3, scale_def='major'):
-        root = int(root)
-        num_notes = int(get_evaluated_value_from_output_config(num_notes, 3, context_vars_for_eval, "chord", "num_notes"))
-
-        intervals = []
-        if isinstance(scale_def, str):
-            scale_name = str(scale_def)
-            if scale_name in active_scales:
-                intervals = active_scales[scale_name]
-        elif isinstance(scale_def, list):
-            intervals = scale_def
-        
-        if not intervals: return [root]
+    try:
+        literal_value = ast.literal_eval(stripped_text)
+        if isinstance(literal_value, (int, float, str, bool, type(None))):
+            return ('const', literal_value)
+    except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+        pass
+    return ('code', (code_obj, stripped_text))
+
+def _get_compiled_expression(expr_text):
+    compiled = compiled_expression_cache.get(expr_text)
+    if compiled is None:
+        if len(compiled_expression_cache) >= EXPRESSION_CACHE_MAX_SIZE:
+            compiled_expression_cache.clear()
+        compiled = _compile_expression(expr_text)
+        compiled_expression_cache[expr_text] = compiled
+    return compiled
+
+# --- Plantillas SysEx precompiladas ---
+# 'sysex_data' se divide al cargar en bytes fijos y huecos dinámicos; por evento solo se evalúan
+# los huecos, sobre una copia de la plantilla.
+SYSEX_START_BYTE = 0xF0
+SYSEX_END_BYTE = 0xF7
+# Un mensaje de la plantilla: bytes fijos (0 en los huecos) y ((posición, expresión), ...)
+CompiledSysexMessage = namedtuple("CompiledSysexMessage", ["buffer", "slots"])
+
+def _constant_sysex_byte(item):
+    """Valor de un elemento fijo de la plantilla (número o literal numérico); None si hay que evaluarlo."""
+    if isinstance(item, (int, float)):
+        return int(item)
+    if isinstance(item, str):
+        expr_kind, expr_data = _get_compiled_expression(item)
+        if expr_kind == 'int' or (expr_kind == 'const' and isinstance(expr_data, (int, float))):
+            return int(expr_data)
+    return None
 
-        if isinstance(scale_def, list):
-            # If scale_def is a list of intervals, num_notes is ignored.
-            return [min(127, max(0, root + i)) for i in intervals]
+def compile_sysex_template(sysex_template):
+    """
+    Divide una plantilla en mensajes: 0xF7 cierra un mensaje y 0xF0 al principio de uno se ignora
+    (mido los añade). Los demás bytes fijos se limitan a 0-127 aquí, una sola vez.
+    """
+    messages = []
+    buffer = bytearray()
+    slots = []
+    for item in sysex_template:
+        value = _constant_sysex_byte(item)
+        if value is None:
+            slots.append((len(buffer), item))
+            buffer.append(0)
+        elif value == SYSEX_END_BYTE:
+            if buffer:
+                messages.append(CompiledSysexMessage(bytes(buffer), tuple(slots)))
+            buffer = bytearray()
+            slots = []
+        elif value == SYSEX_START_BYTE and not buffer:
+            continue
         else:
-            # Build chord from scale name
-            chord_notes = []
-            for i in range(num_notes):
-                octave = i // len(intervals)
-                degree_index = i % len(intervals)
-                note = root + intervals[degree_index] + (12 * octave)
-                chord_notes.append(min(127, max(0, note)))
-            return chord_notes
-
-    eval_locals['chord'] = _chord_func
-
-    def _scale_number_func(index):
-        # Prioridad 1: Usar la lista personalizada si existe
-        if user_ordered_scale_names:
-            scale_source_list = user_ordered_scale_names
-        # Prioridad 2: Usar todas las escalas activas como fallback
+            buffer.append(max(0, min(127, value)))
+    if buffer or not messages:
+        messages.append(CompiledSysexMessage(bytes(buffer), tuple(slots)))
+    return tuple(messages)
+
+def render_sysex_message(compiled_message, eval_context, filter_id_for_debug):
+    """Rellena los huecos de un mensaje precompilado y devuelve sus bytes de datos."""
+    data = bytearray(compiled_message.buffer)
+    shift = 0 # Los huecos que devuelven listas (p.ej. chord()) desplazan los siguientes
+    for offset, item_expr in compiled_message.slots:
+        evaluated_item = get_evaluated_value_from_output_config(item_expr, 0, eval_context, filter_id_for_debug, "sysex_byte")
+        if isinstance(evaluated_item, list):
+            data[offset + shift:offset + shift + 1] = bytes(max(0, min(127, int(sub_item))) for sub_item in evaluated_item)
+            shift += len(evaluated_item) - 1
         else:
-            scale_source_list = list(active_scales.keys())
+            data[offset + shift] = max(0, min(127, int(evaluated_item)))
+    return data
+
+# --- Bloques 'output' precompilados ---
+# Los atajos ("note(60)": 100, "cc(7)": "value_2"...) y la plantilla 'sysex_data' de cada bloque se
+# analizan al cargar y se guardan en el propio bloque, como "_compiled" en los filtros.
+CompiledOutputBlock = namedtuple("CompiledOutputBlock", ["shortcut_keys", "first_shortcut", "sysex"])
+
+def _compile_output_shortcuts(out_conf):
+    """Devuelve (claves de atajo del bloque, (clave, tipo de evento, expresión value_1) del primero o None)."""
+    shortcut_keys = []
+    first_shortcut = None
+    for key in out_conf:
+        match = FILTER_SHORTCUT_PATTERN.match(key) if isinstance(key, str) else None
+        if match:
+            shortcut_keys.append(key)
+            if first_shortcut is None:
+                keyword, val1_expr = match.groups()
+                first_shortcut = (key, FILTER_SHORTCUT_EVENT_MAP.get(keyword, keyword), val1_expr)
+    return frozenset(shortcut_keys), first_shortcut
+
+def compile_output_block(out_conf):
+    """Analiza un bloque 'output': atajos y plantilla SysEx."""
+    shortcut_keys, first_shortcut = _compile_output_shortcuts(out_conf)
+    sysex_template = out_conf.get("sysex_data")
+    sysex = compile_sysex_template(sysex_template) if isinstance(sysex_template, list) else None
+    return CompiledOutputBlock(shortcut_keys, first_shortcut, sysex)
+
+def compile_output_blocks(outputs):
+    """Precompila los bloques 'output' (dict o lista de dicts) de un filtro o secuenciador."""
+    for out_conf in (outputs if isinstance(outputs, list) else [outputs]):
+        if isinstance(out_conf, dict):
+            out_conf["_compiled_output"] = compile_output_block(out_conf)
+
+# Bloque por defecto de los secuenciadores sin 'output' (sin atajos ni SysEx)
+DEFAULT_SEQUENCER_OUTPUT_BLOCKS = [{"event_out": "note", "_compiled_output": CompiledOutputBlock(frozenset(), None, None)}]
+
+def _get_compiled_output_block(out_conf):
+    """
+    Datos precompilados del bloque. Los bloques creados al vuelo (p.ej. un filtro que solo asigna
+    una variable de usuario) no pasan por compile_output_blocks: se analizan en el momento, sin guardarlos.
+    """
+    compiled = out_conf.get("_compiled_output")
+    return compiled if compiled is not None else compile_output_block(out_conf)
+
+# --- Espacio de nombres persistente para eval() ---
+# Alias públicos de las variables de entrada del contexto interno.
+PUBLIC_TO_INTERNAL_VAR_MAP = {
+    "channel_in": "ch0_in_ctx", "ch_in": "ch0_in_ctx", "channel": "ch0_in_ctx",
+    "value_1_in": "value_in_1_ctx", "value_1": "value_in_1_ctx",
+    "value_2_in": "value_in_2_ctx", "value_2": "value_in_2_ctx",
+    "delta_in": "delta_in_2_ctx",
+    "cc_val2_saved": "cc_value_sent_ctx",
+    "event_in": "event_type_in_ctx", "event": "event_type_in_ctx",
+    "cc_type_in": "cc_type_in_ctx", "cc_type": "cc_type_in_ctx"
+}
+EVAL_GLOBALS = {"__builtins__": {}}
 
-        if not scale_source_list:
-            return "major" # Fallback final
-        try:
-            safe_index = int(index) % len(scale_source_list)
-            return scale_source_list[safe_index]
-        except (ValueError, TypeError):
-            return "major"
-    eval_locals['scale_number'] = _scale_number_func
+def _toggle_func(value_arg):
+    """Invierte un valor numérico (0 a 1, y cualquier otro número a 0)."""
+    try:
+        # El argumento ya debería ser un número evaluado.
+        current_val = int(value_arg)
+        return 1 if current_val == 0 else 0
+    except (ValueError, TypeError):
+        # Si la expresión no resolvió a un número, retorna 0 de forma segura.
+        return 0
+
+def _chord_func(root, num_notes=3, scale_def='major'):
+    root = int(root)
+    num_notes = int(get_evaluated_value_from_output_config(num_notes, 3, _eval_namespace.context, "chord", "num_notes"))
+
+    intervals = []
+    if isinstance(scale_def, str):
+        scale_name = str(scale_def)
+        if scale_name in active_scales:
+            intervals = active_scales[scale_name]
+    elif isinstance(scale_def, list):
+        intervals = scale_def
+    
+    if not intervals: return [root]
 
-    def _arp_mode_number_func(index):
-        if not ARP_MODES_LIST:
-            return "as_played" # Fallback
-        try:
-            safe_index = int(index) % len(ARP_MODES_LIST)
-            return ARP_MODES_LIST[safe_index]
-        except (ValueError, TypeError):
-            return "as_played" # Fallback
-    eval_locals['arp_mode_number'] = _arp_mode_number_func
-            
+    if isinstance(scale_def, list):
+        # If scale_def is a list of intervals, num_notes is ignored.
+        return [min(127, max(0, root + i)) for i in intervals]
+    else:
+        # Build chord from scale name
+        chord_notes = []
+        for i in range(num_notes):
+            octave = i // len(intervals)
+            degree_index = i % len(intervals)
+            note = root + intervals[degree_index] + (12 * octave)
+            chord_notes.append(min(127, max(0, note)))
+        return chord_notes
+
+def _scale_number_func(index):
+    # Prioridad 1: Usar la lista personalizada si existe
+    if user_ordered_scale_names:
+        scale_source_list = user_ordered_scale_names
+    # Prioridad 2: Usar todas las escalas activas como fallback
+    else:
+        scale_source_list = list(active_scales.keys())
+
+    if not scale_source_list:
+        return "major" # Fallback final
+    try:
+        safe_index = int(index) % len(scale_source_list)
+        return scale_source_list[safe_index]
+    except (ValueError, TypeError):
+        return "major"
+
+def _arp_mode_number_func(index):
+    if not ARP_MODES_LIST:
+        return "as_played" # Fallback
+    try:
+        safe_index = int(index) % len(ARP_MODES_LIST)
+        return ARP_MODES_LIST[safe_index]
+    except (ValueError, TypeError):
+        return "as_played" # Fallback
 
-    def _duration_index_func(index):
-        # Prioridad 1: Usar la lista personalizada si existe
-        if user_ordered_duration_names:
-            duration_source_list = user_ordered_duration_names
-        # Prioridad 2: Usar la lista por defecto como fallback
+def _duration_index_func(index):
+    # Prioridad 1: Usar la lista personalizada si existe
+    if user_ordered_duration_names:
+        duration_source_list = user_ordered_duration_names
+    # Prioridad 2: Usar la lista por defecto como fallback
+    else:
+        duration_source_list = DEFAULT_NOTE_DURATIONS
+
+    if not duration_source_list:
+        return "1/16" # Fallback final
+    try:
+        safe_index = int(index) % len(duration_source_list)
+        return duration_source_list[safe_index]
+    except (ValueError, TypeError):
+        return "1/16" # Fallback si el índice no es un número
+
+def _get_var_func(array_name, index, seq_idx=None):
+    # Como los argumentos vienen de `eval`, ya están evaluados.
+    if not isinstance(array_name, str): return 0
+    
+    array_name = array_name.strip()
+    index = int(index) if isinstance(index, (int, float)) else 0
+
+    # Prioridad 1: Acceso directo a un secuenciador por índice
+    if seq_idx is not None and isinstance(seq_idx, int):
+        if 0 <= seq_idx < len(sequencers_state):
+            seq_arrays = sequencers_state[seq_idx].get('arrays', {})
+            if array_name in seq_arrays and 0 <= index < len(seq_arrays[array_name]):
+                return seq_arrays[array_name][index]
+    
+    # Prioridad 2: Arrays de Canal (lógica existente)
+    elif array_name.startswith("ch_"):
+        if array_name in channel_arrays and 0 <= index < len(channel_arrays.get(array_name, [])):
+            return channel_arrays[array_name][index]
+    
+    elif array_name in user_variables:
+        target_array = user_variables[array_name]
+        if isinstance(target_array, list) and 0 <= index < len(target_array):
+            # Devolver el valor. Puede ser un número o None (para silencios).
+            return target_array[index]
+        
+    # Prioridad 3: Contexto del secuenciador (para llamadas internas, lógica existente)
+    elif '_seq_arrays_ctx' in _eval_namespace.context and array_name in _eval_namespace.context['_seq_arrays_ctx']:
+        target_array = _eval_namespace.context['_seq_arrays_ctx'][array_name]
+        if 0 <= index < len(target_array):
+            return target_array[index]
+    
+    return 0 # Valor por defecto si no se encuentra nada
+
+class _EvalNamespace(dict):
+    """
+    Espacio de nombres de eval() que vive todo el programa. Las funciones integradas son
+    sus claves; lo demás se resuelve al vuelo, por orden: variables de usuario (sin copiarlas),
+    alias públicos del contexto y claves del contexto del evento actual.
+    """
+    __slots__ = ('context',)
+
+    def __init__(self, builtin_functions):
+        super().__init__(builtin_functions)
+        self.context = {}
+
+    def __missing__(self, name):
+        if name in user_variables:
+            return user_variables[name]
+        context = self.context
+        internal_name = PUBLIC_TO_INTERNAL_VAR_MAP.get(name)
+        if internal_name is not None and internal_name in context:
+            return context[internal_name]
+        if name in context:
+            return context[name]
+        raise KeyError(name)
+
+@contextlib.contextmanager
+def _eval_context_value(context, key, value):
+    """Da a 'key' un valor en el contexto del evento solo durante el bloque y luego lo restaura."""
+    missing = object()
+    previous_value = context.get(key, missing)
+    context[key] = value
+    try:
+        yield context
+    finally:
+        if previous_value is missing:
+            context.pop(key, None)
         else:
-            duration_source_list = DEFAULT_NOTE_DURATIONS
+            context[key] = previous_value
 
-        if not duration_source_list:
-            return "1/16" # Fallback final
-        try:
-            safe_index = int(index) % len(duration_source_list)
-            return duration_source_list[safe_index]
-        except (ValueError, TypeError):
-            return "1/16" # Fallback si el índice no es un número
-    eval_locals['duration_index'] = _duration_index_func
+_eval_namespace = _EvalNamespace({
+    'random': random.randint,
+    'prob': lambda p: 1 if random.random() < float(p) else 0,
+    'toggle': _toggle_func,
+    'chord': _chord_func,
+    'scale_number': _scale_number_func,
+    'arp_mode_number': _arp_mode_number_func,
+    'duration_index': _duration_index_func,
+    'get_var': _get_var_func,
+})
 
 
+def evaluate_expression(expression_str, context_vars_for_eval):
+    global user_variables, channel_arrays
 
+    if not isinstance(expression_str, (str, int, float, list, dict)): return expression_str 
+    if isinstance(expression_str, (int, float)): return int(expression_str)
 
-    def _get_var_func(array_name, index, seq_idx=None):
-        # Como los argumentos vienen de `eval`, ya están evaluados.
-        if not isinstance(array_name, str): return 0
-        
-        array_name = array_name.strip()
-        index = int(index) if isinstance(index, (int, float)) else 0
-
-        # Prioridad 1: Acceso directo a un secuenciador por índice
-        if seq_idx is not None and isinstance(seq_idx, int):
-            if 0 <= seq_idx < len(sequencers_state):
-                seq_arrays = sequencers_state[seq_idx].get('arrays', {})
-                if array_name in seq_arrays and 0 <= index < len(seq_arrays[array_name]):
-                    return seq_arrays[array_name][index]
-        
-        # Prioridad 2: Arrays de Canal (lógica existente)
-        elif array_name.startswith("ch_"):
-            if array_name in channel_arrays and 0 <= index < len(channel_arrays.get(array_name, [])):
-                return channel_arrays[array_name][index]
-        
-        elif array_name in user_variables:
-            target_array = user_variables[array_name]
-            if isinstance(target_array, list) and 0 <= index < len(target_array):
-                # Devolver el valor. Puede ser un número o None (para silencios).
-                return target_array[index]
-            
-        # Prioridad 3: Contexto del secuenciador (para llamadas internas, lógica existente)
-        elif '_seq_arrays_ctx' in context_vars_for_eval and array_name in context_vars_for_eval['_seq_arrays_ctx']:
-            target_array = context_vars_for_eval['_seq_arrays_ctx'][array_name]
-            if 0 <= index < len(target_array):
-                return target_array[index]
-        
-        return 0 # Valor por defecto si no se encuentra nada
+    expr_kind, expr_data = _get_compiled_expression(expression_str if isinstance(expression_str, str) else str(expression_str))
 
+    if expr_kind == 'int' or expr_kind == 'const':
+        return expr_data
+    if expr_kind == 'invalid':
+        return expr_data if isinstance(expression_str, str) else None
+    if expr_kind == 'random':
+        min_val = evaluate_expression(expr_data[0], context_vars_for_eval)
+        max_val = evaluate_expression(expr_data[1], context_vars_for_eval)
+        if isinstance(min_val, int) and isinstance(max_val, int):
+            if min_val > max_val: min_val, max_val = max_val, min_val
+            try: return random.randint(min_val, max_val)
+            except ValueError: return min_val 
+        return None
     
-    eval_locals['get_var'] = _get_var_func
+    previous_context = _eval_namespace.context
+    _eval_namespace.context = context_vars_for_eval
+    try:
+        if expr_kind == 'name':
+            # Una variable inexistente se devuelve como texto (p.ej. nombres de escala).
+            try: return _eval_namespace[expr_data]
+            except KeyError: return expr_data
 
-    current_expr_str_stripped = current_expr_str.strip()
-    if current_expr_str_stripped in eval_locals:
-        return eval_locals[current_expr_str_stripped]
+        code_obj, stripped_text = expr_data
+        if stripped_text in user_variables:
+            return user_variables[stripped_text]
 
-    try:
-        result = eval(current_expr_str, {"__builtins__": {}}, eval_locals)
-        return result
-    except Exception:
-        pass 
+        try:
+            return eval(code_obj, EVAL_GLOBALS, _eval_namespace)
+        except Exception:
+            pass 
+    finally:
+        _eval_namespace.context = previous_context
 
     if isinstance(expression_str, str):
-        return expression_str.strip()
+        return stripped_text
 
     return None
 
 
-
-
 def format_midi_message_for_log(msg, prefix="", active_version=-1, 
                                 rule_id_source=None, target_port_alias_for_log_output=None,
                                 input_port_actual_name=None, device_aliases_global_map=None):
@@ -1844,14 +2623,11 @@ def process_single_output_block(out_conf, i_out_idx, base_context_for_this_outpu
 
     # --- INICIO DE LA NUEVA LÓGICA CONDICIONAL ---
     if "if" in out_conf:
-        # El contexto de evaluación ya debe tener las variables de usuario
-        current_output_eval_context_for_if = base_context_for_this_output.copy()
-        current_output_eval_context_for_if.update(user_variables)
-
+        # Las variables de usuario las resuelve directamente el espacio de nombres de eval.
         condition_result = get_evaluated_value_from_output_config(
             out_conf["if"], 
             default_value_if_none=False, 
-            current_eval_context_for_expr=current_output_eval_context_for_if,
+            current_eval_context_for_expr=base_context_for_this_output,
             filter_id_for_debug=filter_id_for_debug,
             debug_field_name="if"
         )
@@ -1875,13 +2651,10 @@ def process_single_output_block(out_conf, i_out_idx, base_context_for_this_outpu
             # Permitir sobreescribir la dirección en la propia acción
             address = osc_action.get("address", address)
 
-            eval_context = base_context_for_this_output.copy()
-            eval_context.update(user_variables)
-
             args_to_send = []
             for arg_expr in osc_action.get("args", []):
                 evaluated_arg = get_evaluated_value_from_output_config(
-                    arg_expr, None, eval_context, filter_id_for_debug, "osc_arg"
+                    arg_expr, None, base_context_for_this_output, filter_id_for_debug, "osc_arg"
                 )
                 if evaluated_arg is not None:
                     args_to_send.append(evaluated_arg)
@@ -1942,8 +2715,8 @@ def process_single_output_block(out_conf, i_out_idx, base_context_for_this_outpu
         return None
 
     # --- 2. Manejar asignaciones de variables y configuración de módulos ---
-    current_output_eval_context = base_context_for_this_output.copy()
-    current_output_eval_context.update(user_variables)
+    # Las variables de usuario no se copian al contexto: se leen en vivo al evaluar.
+    current_output_eval_context = base_context_for_this_output
 
 
     # Primero, procesamos todas las asignaciones de variables de usuario en el bloque
@@ -1971,12 +2744,9 @@ def process_single_output_block(out_conf, i_out_idx, base_context_for_this_outpu
         'event_out', 'value_1_out', 'value_2_out', 'channel_out', 'device_out',
         'action', 'set_var', 'arp_id', 'sysex_data'
     }
-    has_midi_action = False
-    shortcut_pattern_local = re.compile(r"^\s*(note|note_on|note_off|cc|pc)\s*\((.+)\)\s*$")
-    for key in out_conf.keys():
-        if key in midi_action_keys or (isinstance(key, str) and shortcut_pattern_local.match(key)):
-            has_midi_action = True
-            break
+    compiled_output = _get_compiled_output_block(out_conf)
+    shortcut_keys, first_shortcut = compiled_output.shortcut_keys, compiled_output.first_shortcut
+    has_midi_action = bool(shortcut_keys) or any(key in midi_action_keys for key in out_conf)
             
     if processed_user_vars and not has_midi_action:
         return [] # Detenerse aquí si solo se asignaron variables.
@@ -1996,44 +2766,48 @@ def process_single_output_block(out_conf, i_out_idx, base_context_for_this_outpu
                     if sequencer_index_expr is not None:
                         sequencer_index_target = evaluate_expression(sequencer_index_expr, current_output_eval_context)
                     if array_name_str and index_expr_str is not None and value_expr_str is not None:
-                        target_array_dict = None; temp_eval_context = current_output_eval_context.copy(); is_channel_array = array_name_str.startswith("ch_")
+                        target_array_dict = None; seq_arrays_scope = None; is_channel_array = array_name_str.startswith("ch_")
                         if is_channel_array:
                             target_array_dict = channel_arrays
                             if array_name_str not in target_array_dict: target_array_dict[array_name_str] = [0] * 16
                         elif sequencer_index_target is not None and isinstance(sequencer_index_target, int) and 0 <= sequencer_index_target < len(sequencers_state):
                             target_array_dict = sequencers_state[sequencer_index_target]['arrays']
-                            temp_eval_context['_seq_arrays_ctx'] = target_array_dict
+                            seq_arrays_scope = target_array_dict
                         elif array_name_str in user_variables:
                             target_array_dict = user_variables
                         if target_array_dict:
-                            index_val = evaluate_expression(index_expr_str, temp_eval_context)
-                            value_to_set_any = get_evaluated_value_from_output_config(value_expr_str, None, temp_eval_context, filter_id_for_debug, f"set_var.{array_name_str}")
-                            if isinstance(index_val, (int, float)) and value_to_set_any is not None:
-                                index = int(index_val)
-                                if sequencer_index_target is not None and array_name_str not in target_array_dict:
-                                    num_steps_target_eval = get_evaluated_value_from_output_config(sequencers_state[sequencer_index_target]['config'].get('step_total', 16), 16, temp_eval_context, f"SEQ{sequencer_index_target}", "step_total")
-                                    target_array_dict[array_name_str] = [0] * int(num_steps_target_eval)
-                                    if monitor_active: print(f"    INFO: Array '{array_name_str}' creado dinámicamente para SEQ{sequencer_index_target}.")
-                                if 0 <= index < len(target_array_dict.get(array_name_str, [])):
-                                    try:
-                                        is_float_array = any(substr in array_name_str for substr in ["prob", "factor", "length", "shift"])
-                                        final_value = float(value_to_set_any) if is_float_array else int(value_to_set_any)
-                                        target_array_dict[array_name_str][index] = final_value
-                                        if monitor_active:
-                                            log_target = f"SEQ{sequencer_index_target}" if sequencer_index_target is not None else ("CH" if is_channel_array else "GLB")
-                                            print(f"     ⇢ SET: {log_target}:{array_name_str}[{index}] = {final_value}")
-                                        if sequencer_index_target is not None and array_name_str in ["shift_array", "swing_array"]:
-                                            sequencers_state[sequencer_index_target]['schedule_needs_rebuild'] = True
-                                    except (ValueError, TypeError) as e:
-                                        if monitor_active: print(f"Adv ({filter_id_for_debug}): Error convirtiendo valor para {array_name_str}[{index}]: {e}. Valor '{value_to_set_any}'")
+                            # get_var() ve los arrays del secuenciador destino solo durante esta asignación (sin copiar el contexto)
+                            scope = _eval_context_value(current_output_eval_context, '_seq_arrays_ctx', seq_arrays_scope) if seq_arrays_scope is not None else contextlib.nullcontext(current_output_eval_context)
+                            with scope as temp_eval_context:
+                                index_val = evaluate_expression(index_expr_str, temp_eval_context)
+                                value_to_set_any = get_evaluated_value_from_output_config(value_expr_str, None, temp_eval_context, filter_id_for_debug, f"set_var.{array_name_str}")
+                                if isinstance(index_val, (int, float)) and value_to_set_any is not None:
+                                    index = int(index_val)
+                                    if sequencer_index_target is not None and array_name_str not in target_array_dict:
+                                        num_steps_target_eval = get_evaluated_value_from_output_config(sequencers_state[sequencer_index_target]['config'].get('step_total', 16), 16, temp_eval_context, f"SEQ{sequencer_index_target}", "step_total")
+                                        target_array_dict[array_name_str] = [0] * int(num_steps_target_eval)
+                                        if monitor_active: print(f"    INFO: Array '{array_name_str}' creado dinámicamente para SEQ{sequencer_index_target}.")
+                                    if 0 <= index < len(target_array_dict.get(array_name_str, [])):
+                                        try:
+                                            is_float_array = any(substr in array_name_str for substr in ["prob", "factor", "length", "shift"])
+                                            final_value = float(value_to_set_any) if is_float_array else int(value_to_set_any)
+                                            target_array_dict[array_name_str][index] = final_value
+                                            if monitor_active:
+                                                log_target = f"SEQ{sequencer_index_target}" if sequencer_index_target is not None else ("CH" if is_channel_array else "GLB")
+                                                print(f"     ⇢ SET: {log_target}:{array_name_str}[{index}] = {final_value}")
+                                            if sequencer_index_target is not None and array_name_str in ["shift_array", "swing_array"]:
+                                                sequencers_state[sequencer_index_target]['schedule_needs_rebuild'] = True
+                                        except (ValueError, TypeError) as e:
+                                            if monitor_active: print(f"Adv ({filter_id_for_debug}): Error convirtiendo valor para {array_name_str}[{index}]: {e}. Valor '{value_to_set_any}'")
 
     if "arp_id" in out_conf:
         arp_id_eval = get_evaluated_value_from_output_config(out_conf["arp_id"], -1, current_output_eval_context, filter_id_for_debug, "arp_id")
         if arp_id_eval == -1: return []
         arp_id = int(arp_id_eval)
         if arp_id not in arpeggiator_templates: arpeggiator_templates[arp_id] = {}
+        previous_clock_source = _arp_clock_source(arpeggiator_templates[arp_id])
         for param_key, param_expr in out_conf.items():
-            if param_key in ['arp_id', '_comment'] or re.compile(r"^\s*(note|note_on|note_off|cc|pc)\s*\((.+)\)\s*$").match(str(param_key)): continue
+            if param_key in ['arp_id', '_comment', '_compiled_output'] or param_key in shortcut_keys: continue
             resolved_value = get_evaluated_value_from_output_config(param_expr, None, current_output_eval_context, filter_id_for_debug, param_key)
             if resolved_value is not None: arpeggiator_templates[arp_id][param_key] = resolved_value
         for instance in arpeggiator_instances.values():
@@ -2046,9 +2820,14 @@ def process_single_output_block(out_conf, i_out_idx, base_context_for_this_outpu
         final_ch_out_arp = max(0, min(15, int(final_ch_out_eval)))
         instance_key = (arp_id, final_ch_out_arp)
         if instance_key not in arpeggiator_instances:
-             arpeggiator_instances[instance_key] = {'config': final_template, 'is_playing': False, 'tick_counter': 0, 'active_step': 0, 'input_notes': [], 'arp_pattern': [], 'arp_velocity_pattern': [], 'pending_note_offs': [], 'is_armed': False, 'direction_state': 'up', 'direction_index': 0}
+             arpeggiator_instances[instance_key] = {'config': final_template, 'is_playing': False, 'tick_counter': 0, 'active_step': 0, 'input_notes': [], 'arp_pattern': [], 'arp_velocity_pattern': [], 'pending_note_offs': [], 'clock_tick': 0, 'is_armed': False, 'direction_state': 'up', 'direction_index': 0}
+             _rebuild_clock_subscriptions()
              if monitor_active: print(f"     ⇢ ARP: New instance created for ({arp_id}, {final_ch_out_arp})")
-        else: arpeggiator_instances[instance_key]['config'].update(final_template)
+        else:
+            arpeggiator_instances[instance_key]['config'].update(final_template)
+            # Las instancias de este arp_id siguen el reloj de la plantilla: solo se reconstruye si ha cambiado
+            if _arp_clock_source(final_template) != previous_clock_source:
+                _rebuild_clock_subscriptions()
         notes_to_send = get_evaluated_value_from_output_config(out_conf.get("value_1_out"), [base_context_for_this_output.get('value_in_1_ctx')], current_output_eval_context, filter_id_for_debug, "Arp.Val1")
         if not isinstance(notes_to_send, list): notes_to_send = [notes_to_send]
         velocity_to_send = get_evaluated_value_from_output_config(out_conf.get("value_2_out"), base_context_for_this_output.get('value_in_2_ctx'), current_output_eval_context, filter_id_for_debug, "Arp.Val2")
@@ -2062,57 +2841,37 @@ def process_single_output_block(out_conf, i_out_idx, base_context_for_this_outpu
             if monitor_active: print(f"Adv ({filter_id_for_debug}): 'sysex_data' debe ser una lista.")
             return []
 
-        final_sysex_bytes = []
-        for item_expr in sysex_template:
-            # Evaluar cada elemento de la plantilla
-            evaluated_item = get_evaluated_value_from_output_config(
-                item_expr, 0, current_output_eval_context, filter_id_for_debug, "sysex_byte"
-            )
-            
-            # Manejar si el elemento evaluado es una lista (p. ej. de una función como chord())
-            if isinstance(evaluated_item, list):
-                for sub_item in evaluated_item:
-                    # Asegurar que cada byte esté en el rango 0-127
-                    final_sysex_bytes.append(max(0, min(127, int(sub_item))))
-            else:
-                final_sysex_bytes.append(max(0, min(127, int(evaluated_item))))
-
         # Encontrar el puerto de salida (lógica similar a la de abajo)
         out_dev_alias = out_conf.get("device_out", filter_config_parent_ref.get("device_out"))
         if not out_dev_alias:
             return []
 
-        target_port_obj_to_use = None
-        out_dev_sub = device_aliases_g.get(out_dev_alias, out_dev_alias)
-        for p_name, p_info in mido_ports_map_g.items():
-            if p_info["type"] == "out" and out_dev_sub.lower() in p_name.lower():
-                target_port_obj_to_use = p_info["obj"]
-                break
-        
-        if target_port_obj_to_use:
-            sysex_msg = mido.Message('sysex', data=final_sysex_bytes)
-            # Devolver el mensaje SysEx y terminar el procesamiento de este bloque de output
-            return [(sysex_msg, target_port_obj_to_use, out_dev_alias, filter_id_for_debug, 'sysex', None)]
-        else:
+        target_port_obj_to_use = _resolve_output_port(out_dev_alias)
+        if not target_port_obj_to_use:
             return [] # Puerto no encontrado
 
+        # Solo se evalúan los huecos dinámicos de la plantilla precompilada
+        sysex_msgs = [mido.Message('sysex', data=render_sysex_message(compiled_message, current_output_eval_context, filter_id_for_debug))
+                      for compiled_message in compiled_output.sysex]
+        chunk_delay_ms = out_conf.get("sysex_chunk_delay", filter_config_parent_ref.get("sysex_chunk_delay", 0))
+        if len(sysex_msgs) > 1 and isinstance(chunk_delay_ms, (int, float)) and chunk_delay_ms > 0:
+            # Las partes salen espaciadas desde la agenda; aquí solo se informa de la primera
+            _schedule_sysex_chunks(target_port_obj_to_use, sysex_msgs, chunk_delay_ms / 1000.0)
+            if monitor_active:
+                print(f"     ⇢ SYSEX: {len(sysex_msgs)} partes hacia '{out_dev_alias}' cada {chunk_delay_ms:g} ms")
+            return []
+        # Devolver los mensajes SysEx y terminar el procesamiento de este bloque de output
+        return [(sysex_msg, target_port_obj_to_use, out_dev_alias, filter_id_for_debug, 'sysex', None) for sysex_msg in sysex_msgs]
+
 
     # --- 3. Unificar parámetros para la generación de MIDI ---
     output_messages_and_meta = []
     params = {}
-    shortcut_pattern = re.compile(r"^\s*(note|note_on|note_off|cc|pc)\s*\((.+)\)\s*$")
-    
-    # Buscamos atajos de SALIDA solo en el bloque de output actual
-    shortcut_actions = {k: v for k, v in out_conf.items() if isinstance(k, str) and shortcut_pattern.match(k)}
 
-    if shortcut_actions:
-        key, value = list(shortcut_actions.items())[0]
-        match = shortcut_pattern.match(key)
-        keyword, val1_expr = match.groups()
-
-        params['event_type_expr'] = {'note': 'note_on', 'cc': 'control_change', 'pc': 'program_change'}.get(keyword, keyword)
-        params['val1_expr'] = val1_expr
-        params['val2_expr'] = value
+    # Atajos de SALIDA del bloque de output actual (ya analizados)
+    if first_shortcut:
+        key, params['event_type_expr'], params['val1_expr'] = first_shortcut
+        params['val2_expr'] = out_conf[key]
     else:
         params['event_type_expr'] = out_conf.get("event_out")
         params['val1_expr'] = out_conf.get("value_1_out")
@@ -2184,12 +2943,7 @@ def process_single_output_block(out_conf, i_out_idx, base_context_for_this_outpu
             print(f"ERROR Creando Msg: {e}")
 
         if output_msg:
-            target_port_obj_to_use = None
-            out_dev_sub = device_aliases_g.get(out_dev_alias, out_dev_alias)
-            for p_name, p_info in mido_ports_map_g.items():
-                if p_info["type"] == "out" and out_dev_sub.lower() in p_name.lower():
-                    target_port_obj_to_use = p_info["obj"]
-                    break
+            target_port_obj_to_use = _resolve_output_port(out_dev_alias)
             if target_port_obj_to_use:
                 output_messages_and_meta.append((output_msg, target_port_obj_to_use, out_dev_alias, filter_id_for_debug, final_event_type_out_str, None))
 
@@ -2430,6 +3184,9 @@ def process_osc_event_new_logic(address, args, filter_config, current_active_ver
 
 
 # --- Helper Function para parsear condiciones de valor ---
+VALUE_RANGE_PATTERN = re.compile(r"^\s*(\d+)\s*-\s*(\d+)\s*$")
+VALUE_COMPARISON_PATTERN = re.compile(r"^\s*(>=|<=|>|<|==)\s*(-?\d+)\s*$")
+
 def _check_value_condition(condition_config, actual_value):
     if actual_value is None: return False # No hay valor para comparar
 
@@ -2440,7 +3197,7 @@ def _check_value_condition(condition_config, actual_value):
     elif isinstance(condition_config, str):
         condition_str = condition_config.strip()
         # Rangos: "min-max"
-        range_match = re.match(r"^\s*(\d+)\s*-\s*(\d+)\s*$", condition_str)
+        range_match = VALUE_RANGE_PATTERN.match(condition_str)
         if range_match:
             try:
                 min_val = int(range_match.group(1))
@@ -2449,7 +3206,7 @@ def _check_value_condition(condition_config, actual_value):
             except ValueError: return False # Malformado
 
         # Comparaciones: ">X", ">=X", "<X", "<=X", "==X" (==X es redundante pero puede incluirse)
-        comp_match = re.match(r"^\s*(>=|<=|>|<|==)\s*(-?\d+)\s*$", condition_str) # Añadido -? para números negativos
+        comp_match = VALUE_COMPARISON_PATTERN.match(condition_str) # Admite números negativos
         if comp_match:
             operator = comp_match.group(1)
             try:
@@ -2467,7 +3224,171 @@ def _check_value_condition(condition_config, actual_value):
 
 
 
-# midimod.py
+FILTER_SHORTCUT_PATTERN = re.compile(r"^\s*(note|note_on|note_off|cc|pc)\s*\((.+)\)\s*$")
+FILTER_SHORTCUT_EVENT_MAP = {'note': 'note_on', 'note_on': 'note_on', 'note_off': 'note_off', 'cc': 'control_change', 'pc': 'program_change'}
+
+def _decouple_filter_shortcut(filter_config):
+    """Convierte un filtro con atajo ("note_on(60)": {...}) a su forma explícita (event_in/value_1_in)."""
+    shortcut_key_found = None
+    for key in filter_config.keys():
+        if isinstance(key, str) and FILTER_SHORTCUT_PATTERN.match(key):
+            shortcut_key_found = key
+            break
+    if not shortcut_key_found:
+        return filter_config
+
+    temp_config = filter_config.copy()
+    action_block = temp_config.pop(shortcut_key_found)
+    if isinstance(action_block, dict): temp_config.update(action_block)
+    keyword, value_expr = FILTER_SHORTCUT_PATTERN.match(shortcut_key_found).groups()
+    temp_config['event_in'] = FILTER_SHORTCUT_EVENT_MAP.get(keyword, keyword)
+    temp_config['value_1_in'] = value_expr
+    return temp_config
+
+def _normalize_event_in_conditions(event_conditions):
+    """Normaliza 'event_in' (alias note/cc/pc, mayúsculas) a la lista de tipos mido aceptados."""
+    if not isinstance(event_conditions, list): event_conditions = [event_conditions]
+    normalized_conditions = []
+    for cond in event_conditions:
+        cond_lower = str(cond).lower()
+        if cond_lower == "note": normalized_conditions.extend(["note_on", "note_off"])
+        elif cond_lower == "cc": normalized_conditions.append("control_change")
+        elif cond_lower == "pc": normalized_conditions.append("program_change")
+        else: normalized_conditions.append(cond_lower)
+    return normalized_conditions
+
+def _get_event_dispatch_key(msg):
+    """Devuelve (tipo efectivo, canal, value_1) de un mensaje, igual que el contexto de entrada de los filtros."""
+    event_type = msg.type
+    if event_type == 'note_on':
+        return ('note_off' if msg.velocity == 0 else 'note_on'), msg.channel, msg.note
+    if event_type == 'note_off': return event_type, msg.channel, msg.note
+    if event_type == 'control_change': return event_type, msg.channel, msg.control
+    if event_type == 'program_change': return event_type, msg.channel, msg.program
+    if event_type == 'pitchwheel': return event_type, msg.channel, msg.pitch
+    if event_type == 'aftertouch': return event_type, msg.channel, msg.value
+    if event_type == 'polytouch': return event_type, msg.channel, msg.note
+    return event_type, getattr(msg, 'channel', -1), 0
+
+# Filtro 'midi_filter' ya compilado: atajo desacoplado, device_in resuelto y condiciones precalculadas.
+CompiledFilter = namedtuple("CompiledFilter", [
+    "config", "filter_id", "device_in_substring", "versions", "event_set",
+    "ch_in", "value_1_in", "value_2_in", "cc_type_in"
+])
+# Condición de valor compilada: mapa de 128 bytes (y su valor estático) o expresión a evaluar por evento.
+CompiledValueCondition = namedtuple("CompiledValueCondition", ["bitmap", "static", "expression"])
+
+def _compile_value_condition(condition):
+    """Precalcula una condición ch_in/value_*_in. Solo las que usan variables quedan como expresión."""
+    if isinstance(condition, str) and (VALUE_RANGE_PATTERN.match(condition) or VALUE_COMPARISON_PATTERN.match(condition)):
+        static_condition = condition.strip() # "0-7" es un rango, no la resta 0-7
+    elif isinstance(condition, (int, float, list)) or (isinstance(condition, str) and not re.search(r"[A-Za-z_]", condition)):
+        static_condition = evaluate_expression(condition, {})
+    else:
+        return CompiledValueCondition(None, None, condition)
+    bitmap = bytes(1 if _check_value_condition(static_condition, value) else 0 for value in range(128))
+    return CompiledValueCondition(bitmap, static_condition, None)
+
+def _value_condition_matches(condition, actual_value, context):
+    if condition.bitmap is not None:
+        if 0 <= actual_value < 128: return condition.bitmap[actual_value] == 1
+        return _check_value_condition(condition.static, actual_value)
+    return _check_value_condition(evaluate_expression(condition.expression, context), actual_value)
+
+def compile_midi_filter(filter_config):
+    """Compila una entrada de 'midi_filter'. Depende solo del fichero de reglas y de los alias cargados."""
+    decoupled = _decouple_filter_shortcut(filter_config)
+
+    device_in_alias = decoupled.get("device_in")
+    device_in_substring = None
+    if device_in_alias is not None:
+        device_in_substring = str(global_device_aliases.get(device_in_alias, device_in_alias)).lower()
+
+    versions = None
+    if "version" in decoupled:
+        version_cond = decoupled["version"]
+        if isinstance(version_cond, int): versions = (version_cond,)
+        elif isinstance(version_cond, list): versions = tuple(version_cond)
+        else: versions = () # Condición de versión no soportada: nunca coincide
+
+    return CompiledFilter(
+        config=decoupled,
+        filter_id=decoupled.get("_filter_id_str", "ID?"),
+        device_in_substring=device_in_substring,
+        versions=versions,
+        event_set=frozenset(_normalize_event_in_conditions(decoupled["event_in"])) if "event_in" in decoupled else None,
+        ch_in=_compile_value_condition(decoupled["ch_in"]) if "ch_in" in decoupled else None,
+        value_1_in=_compile_value_condition(decoupled["value_1_in"]) if "value_1_in" in decoupled else None,
+        value_2_in=_compile_value_condition(decoupled["value_2_in"]) if "value_2_in" in decoupled else None,
+        cc_type_in=str(decoupled.get("cc_type_in", "abs")).lower()
+    )
+
+def compile_all_midi_filters(filters_list):
+    """Compila (o recompila) todos los filtros cargados; el resultado se guarda en '_compiled'."""
+    for f_config in filters_list:
+        f_config["_compiled"] = compile_midi_filter(f_config)
+        compile_output_blocks(f_config["_compiled"].config.get("output")) # Antes del primer evento
+
+def _get_compiled_filter(filter_config):
+    compiled = filter_config.get("_compiled")
+    if compiled is None:
+        compiled = compile_midi_filter(filter_config)
+        filter_config["_compiled"] = compiled
+    return compiled
+
+def _build_port_dispatch_entries(port_name):
+    """Construye, para un puerto de entrada, la lista ordenada de filtros candidatos."""
+    entries = []
+    port_name_lower = port_name.lower()
+    for f_config in all_loaded_filters:
+        compiled = _get_compiled_filter(f_config)
+        if compiled.device_in_substring is None: continue # Solo se activan por cambio de versión
+        if compiled.device_in_substring not in port_name_lower: continue
+        entries.append((f_config, compiled))
+    filter_dispatch_index[port_name] = entries
+    return entries
+
+def build_filter_dispatch_index(input_port_names):
+    """Reconstruye el índice de despacho para los puertos de entrada abiertos."""
+    filter_dispatch_index.clear()
+    filter_dispatch_cache.clear()
+    for port_name in input_port_names:
+        _build_port_dispatch_entries(port_name)
+
+def _static_condition_allows(condition, value):
+    """Parte estática de una condición: las condiciones con variables se comprueban luego, por evento."""
+    if condition is None or condition.bitmap is None: return True
+    if 0 <= value < 128: return condition.bitmap[value] == 1
+    return _check_value_condition(condition.static, value)
+
+def get_candidate_filters(port_name, msg):
+    """Devuelve, en su orden original, solo los filtros que pueden coincidir con este mensaje de este puerto."""
+    event_type, channel, value_1 = _get_event_dispatch_key(msg)
+    cache_key = (port_name, event_type, channel, value_1)
+    candidates = filter_dispatch_cache.get(cache_key)
+    if candidates is not None:
+        return candidates
+
+    # Primer nivel: filtros del puerto que aceptan este tipo de evento.
+    type_key = (port_name, event_type)
+    typed_entries = filter_dispatch_cache.get(type_key)
+    if typed_entries is None:
+        entries = filter_dispatch_index.get(port_name)
+        if entries is None:
+            entries = _build_port_dispatch_entries(port_name)
+        typed_entries = tuple(
+            (f_config, compiled) for f_config, compiled in entries
+            if compiled.event_set is None or event_type in compiled.event_set
+        )
+        filter_dispatch_cache[type_key] = typed_entries
+
+    candidates = tuple(
+        f_config for f_config, compiled in typed_entries
+        if _static_condition_allows(compiled.ch_in, channel) and _static_condition_allows(compiled.value_1_in, value_1)
+    )
+    filter_dispatch_cache[cache_key] = candidates
+    return candidates
+
 
 def process_midi_event_new_logic(original_msg_or_dummy, msg_input_port_name_or_dummy, filter_config, current_active_version_global, device_aliases_global, mido_ports_map, is_virtual_mode_now, virtual_out_obj=None, virtual_out_name=""):
     global cc_value_sent, cc_value_control, cc_input_s_state
@@ -2475,65 +3396,31 @@ def process_midi_event_new_logic(original_msg_or_dummy, msg_input_port_name_or_d
     if msg_input_port_name_or_dummy != DUMMY_PORT_NAME_FOR_VERSION_TRIGGER and original_msg_or_dummy is None:
         return ([], None)
     
-    if original_msg_or_dummy.type == 'note_on' and original_msg_or_dummy.velocity == 0:
-        effective_msg_for_context = mido.Message('note_off', channel=original_msg_or_dummy.channel, note=original_msg_or_dummy.note, velocity=0)
-    else:
-        effective_msg_for_context = original_msg_or_dummy.copy()
-    
     is_version_trigger_call = (msg_input_port_name_or_dummy == DUMMY_PORT_NAME_FOR_VERSION_TRIGGER)
+    compiled_filter = _get_compiled_filter(filter_config)
+    f_config_processed = compiled_filter.config
 
-    # --- INICIO: Lógica de desacoplamiento de filtros ---
-    f_config_processed = None
-    shortcut_pattern = re.compile(r"^\s*(note|note_on|note_off|cc|pc)\s*\((.+)\)\s*$")
-    
-    shortcut_key_found = None
-    for key in filter_config.keys():
-        if isinstance(key, str) and shortcut_pattern.match(key):
-            shortcut_key_found = key
-            break
-
-    if shortcut_key_found:
-        temp_config = filter_config.copy()
-        action_block = temp_config.pop(shortcut_key_found)
-        if isinstance(action_block, dict): temp_config.update(action_block)
-        match = shortcut_pattern.match(shortcut_key_found)
-        keyword, value_expr = match.groups()
-        keyword_map = {'note': 'note_on', 'note_on': 'note_on', 'note_off': 'note_off', 'cc': 'control_change', 'pc': 'program_change'}
-        temp_config['event_in'] = keyword_map.get(keyword, keyword)
-        temp_config['value_1_in'] = value_expr
-        f_config_processed = temp_config
-    else:
-        f_config_processed = filter_config
-    # --- FIN: Lógica de desacoplamiento ---
-
-    if "version" in f_config_processed:
-        version_cond = f_config_processed["version"]
-        if not ((isinstance(version_cond, int) and version_cond == current_active_version_global) or \
-                (isinstance(version_cond, list) and current_active_version_global in version_cond)):
-            return ([], None)
+    if compiled_filter.versions is not None and current_active_version_global not in compiled_filter.versions:
+        return ([], None)
     
-    filter_device_in_alias = f_config_processed.get("device_in")
     if not is_version_trigger_call:
-        if filter_device_in_alias is None: return ([], None)
-        device_in_substring = device_aliases_global.get(filter_device_in_alias, filter_device_in_alias)
-        if device_in_substring.lower() not in msg_input_port_name_or_dummy.lower(): return ([], None)
-    elif filter_device_in_alias is not None:
+        if compiled_filter.device_in_substring is None: return ([], None)
+        if compiled_filter.device_in_substring not in msg_input_port_name_or_dummy.lower(): return ([], None)
+    elif compiled_filter.device_in_substring is not None:
         return ([], None)
 
     # --- Preparar CONTEXTO DE ENTRADA ---
-    ch0_in_ctx = getattr(effective_msg_for_context, 'channel', -1)
-    event_type_in_ctx = effective_msg_for_context.type
-    value_in_1_ctx = 0
+    # Un note_on con velocidad 0 se trata como note_off (sin copiar el mensaje).
+    event_type_in_ctx, ch0_in_ctx, value_in_1_ctx = _get_event_dispatch_key(original_msg_or_dummy)
     value_in_2_ctx = 0
     delta_in_2_ctx = 0
     cc_type_in_ctx = "abs"
 
     if event_type_in_ctx == 'control_change':
-        value_in_1_ctx = effective_msg_for_context.control
-        cc_ch_input = effective_msg_for_context.channel
-        cc_num_input = effective_msg_for_context.control
-        C_current_abs_input = effective_msg_for_context.value
-        cc_type_in_ctx = f_config_processed.get("cc_type_in", "abs").lower()
+        cc_ch_input = ch0_in_ctx
+        cc_num_input = value_in_1_ctx
+        C_current_abs_input = original_msg_or_dummy.value
+        cc_type_in_ctx = compiled_filter.cc_type_in
 
         if cc_type_in_ctx == "abs":
             value_in_2_ctx = C_current_abs_input
@@ -2577,18 +3464,10 @@ def process_midi_event_new_logic(original_msg_or_dummy, msg_input_port_name_or_d
             value_in_2_ctx = C_current_abs_input
             cc_type_in_ctx = "abs"
 
-    elif event_type_in_ctx in ['note_on', 'note_off']:
-        value_in_1_ctx = effective_msg_for_context.note
-        value_in_2_ctx = effective_msg_for_context.velocity
-    elif event_type_in_ctx == 'program_change':
-        value_in_1_ctx = effective_msg_for_context.program
-    elif event_type_in_ctx == 'pitchwheel':
-        value_in_1_ctx = effective_msg_for_context.pitch
-    elif event_type_in_ctx == 'aftertouch':
-        value_in_1_ctx = effective_msg_for_context.value
+    elif event_type_in_ctx == 'note_on' or event_type_in_ctx == 'note_off':
+        value_in_2_ctx = original_msg_or_dummy.velocity
     elif event_type_in_ctx == 'polytouch':
-        value_in_1_ctx = effective_msg_for_context.note
-        value_in_2_ctx = effective_msg_for_context.value
+        value_in_2_ctx = original_msg_or_dummy.value
     
     base_context_for_outputs = {
         'ch0_in_ctx': ch0_in_ctx, 'value_in_1_ctx': value_in_1_ctx, 'value_in_2_ctx': value_in_2_ctx,
@@ -2596,32 +3475,15 @@ def process_midi_event_new_logic(original_msg_or_dummy, msg_input_port_name_or_d
     }
 
     if not is_version_trigger_call:
-        if "event_in" in f_config_processed:
-            event_conditions = f_config_processed["event_in"]
-            if not isinstance(event_conditions, list): event_conditions = [event_conditions]
-            normalized_conditions = []
-            for cond in event_conditions:
-                cond_lower = str(cond).lower()
-                if cond_lower == "note": normalized_conditions.extend(["note_on", "note_off"])
-                elif cond_lower == "cc": normalized_conditions.append("control_change")
-                elif cond_lower == "pc": normalized_conditions.append("program_change")
-                else: normalized_conditions.append(cond_lower)
-            if event_type_in_ctx.lower() not in normalized_conditions: return ([], None)
-        
-        if "ch_in" in f_config_processed:
-            cond = evaluate_expression(f_config_processed["ch_in"], base_context_for_outputs)
-            if not _check_value_condition(cond, ch0_in_ctx): return ([], None)
-        if "value_1_in" in f_config_processed:
-            cond = evaluate_expression(f_config_processed["value_1_in"], base_context_for_outputs)
-            if not _check_value_condition(cond, value_in_1_ctx): return ([], None)
-        if "value_2_in" in f_config_processed:
-            cond = evaluate_expression(f_config_processed["value_2_in"], base_context_for_outputs)
-            if not _check_value_condition(cond, value_in_2_ctx): return ([], None)
+        if compiled_filter.event_set is not None and event_type_in_ctx not in compiled_filter.event_set: return ([], None)
+        if compiled_filter.ch_in is not None and not _value_condition_matches(compiled_filter.ch_in, ch0_in_ctx, base_context_for_outputs): return ([], None)
+        if compiled_filter.value_1_in is not None and not _value_condition_matches(compiled_filter.value_1_in, value_in_1_ctx, base_context_for_outputs): return ([], None)
+        if compiled_filter.value_2_in is not None and not _value_condition_matches(compiled_filter.value_2_in, value_in_2_ctx, base_context_for_outputs): return ([], None)
 
     version_action_from_this_filter = None
     if "set_version" in f_config_processed:
         base_context_for_outputs["version"] = current_active_version_global
-        version_action_from_this_filter = get_evaluated_value_from_output_config(f_config_processed["set_version"], None, base_context_for_outputs, f_config_processed.get('_filter_id_str', 'ID?'), "set_version")
+        version_action_from_this_filter = get_evaluated_value_from_output_config(f_config_processed["set_version"], None, base_context_for_outputs, compiled_filter.filter_id, "set_version")
 
     generated_outputs_with_meta = execute_all_outputs_for_filter(f_config_processed, base_context_for_outputs, current_active_version_global, device_aliases_global, mido_ports_map, is_virtual_mode_now, virtual_out_obj, virtual_out_name)
 
@@ -2671,7 +3533,7 @@ def process_version_activated_filters(new_version_activated, all_filters_list, d
             
             if dest_port_obj and hasattr(dest_port_obj, "send"):
                 try: 
-                    dest_port_obj.send(msg_to_send) # Enviar el msg_to_send
+                    _queue_output(dest_port_obj, msg_to_send, rate_policy=filter_rate_policies.get(src_filter_id_str))
                     _update_tui_port_out_data(dest_port_obj, msg_to_send, dest_alias_str)
                     if monitor_active:
                         log_line = format_midi_message_for_log(msg_to_send, prefix="  \u21E2 OUT: ", active_version=new_version_activated, rule_id_source=src_filter_id_str, target_port_alias_for_log_output=dest_alias_str)
@@ -2748,23 +3610,690 @@ def interactive_rule_selector():
 # --- list_midi_ports_action ---
 def list_midi_ports_action():
     print("Puertos de ENTRADA MIDI disponibles:")
-    input_names = mido.get_input_names()
+    input_names = midi_backend.get_input_names()
     if not input_names: print("  (Ningún puerto detectado)")
     else:
         for i, name in enumerate(input_names): print(f"  {i}: '{name}'")
     print("\nPuertos de SALIDA MIDI disponibles:")
-    output_names = mido.get_output_names()
+    output_names = midi_backend.get_output_names()
     if not output_names: print("  (Ningún puerto detectado)")
     else:
         for i, name in enumerate(output_names): print(f"  {i}: '{name}'")
     print("-" * 40)
 
 
+# --- Backend MIDI en memoria (loopback) ---
+class _LoopbackPort:
+    """Puerto de LoopbackMidiBackend con la interfaz que usa el motor: send, iter_pending, close y closed."""
+
+    def __init__(self, backend, name, is_input, callback=None):
+        self.backend = backend
+        self.name = name
+        self.is_input = is_input
+        self.callback = callback
+        self.closed = False
+        self.pending = deque()
+
+    def send(self, msg):
+        if not self.closed:
+            self.backend._record_sent(self.name, msg)
+
+    def iter_pending(self):
+        while self.pending:
+            yield self.pending.popleft()
+
+    def close(self):
+        self.closed = True
+
+class LoopbackMidiBackend:
+    """Backend MIDI en proceso: los alias se resuelven a colas en memoria, sin hardware ni rtmidi.
+
+    Sustituye a mido al listar y abrir puertos (ver _use_midi_backend). Un driver de pruebas
+    o de benchmark inyecta mensajes con inject() y recoge con take_sent() lo que envía el
+    motor como (instante, puerto, mensaje). Con port_names=None se crea al vuelo cada puerto
+    que pidan las reglas; con una lista solo existen esos (como un equipo con esos dispositivos).
+    """
+
+    def __init__(self, port_names=None, collect_sent=True):
+        self.auto_create_ports = port_names is None
+        self.collect_sent = collect_sent # False: solo se cuentan (uso en vivo, sin driver que los recoja)
+        self.port_names = sorted(set(port_names or []))
+        self.open_ports = []
+        self.sent_messages = [] # (instante, puerto, mensaje)
+        self.sent_count = 0
+        self.current_time = None # Instante virtual fijado por el driver; None = time.perf_counter()
+
+    def ensure_ports(self, names):
+        if self.auto_create_ports:
+            self.port_names = sorted(set(self.port_names).union(name for name in names if name))
+
+    def get_input_names(self):
+        return list(self.port_names)
+
+    def get_output_names(self):
+        return list(self.port_names)
+
+    def open_input(self, name, callback=None, **kwargs):
+        port = _LoopbackPort(self, name, True, callback)
+        self.open_ports.append(port)
+        return port
+
+    def open_output(self, name, **kwargs):
+        port = _LoopbackPort(self, name, False)
+        self.open_ports.append(port)
+        return port
+
+    def now(self):
+        return time.perf_counter() if self.current_time is None else self.current_time
+
+    def set_time(self, timestamp):
+        """Fija el instante virtual con el que se sellan los envíos (None vuelve al reloj real)."""
+        self.current_time = timestamp
+
+    def inject(self, port_name, msg, timestamp=None):
+        """Entrega msg a las entradas abiertas con ese nombre, como si llegara del dispositivo.
+
+        Con timestamp, el mensaje lleva ese instante en msg.time y los envíos que provoque
+        quedan sellados con él. Devuelve el número de puertos que lo recibieron.
+        """
+        if timestamp is not None:
+            self.current_time = timestamp
+            msg = msg.copy(time=timestamp)
+        delivered = 0
+        for port in self.open_ports:
+            if port.is_input and not port.closed and port.name == port_name:
+                if port.callback:
+                    port.callback(msg)
+                else:
+                    port.pending.append(msg)
+                delivered += 1
+        return delivered
+
+    def take_sent(self):
+        """Devuelve y vacía la lista de mensajes enviados: [(instante, puerto, mensaje)]."""
+        sent_messages, self.sent_messages = self.sent_messages, []
+        return sent_messages
+
+    def _record_sent(self, port_name, msg):
+        self.sent_count += 1
+        if self.collect_sent:
+            self.sent_messages.append((self.now(), port_name, msg))
+
+# --- Benchmark ---
+BENCH_RESULTS_FILE = "bench_results.json"
+BENCH_EVENTS_PER_SCENARIO = 2000
+BENCH_WARMUP_EVENTS = 200
+BENCH_ALLOC_EVENTS = 300 # Eventos medidos con tracemalloc (pasada aparte, más lenta)
+BENCH_FILTER_COUNTS = [10, 100, 1000]
+BENCH_SEQUENCER_COUNTS = [1, 4, 16, 64]
+BENCH_CC_BURST_LENGTH = 8
+
+@contextlib.contextmanager
+def _use_midi_backend(backend):
+    """Usa temporalmente otro backend MIDI (p. ej. LoopbackMidiBackend) para listar y abrir puertos."""
+    global midi_backend
+    saved_backend = midi_backend
+    midi_backend = backend
+    try:
+        yield backend
+    finally:
+        midi_backend = saved_backend
+
+def _reset_offline_state():
+    """Deja el estado global como recién arrancado (entre escenarios del benchmark o antes de un render)."""
+    global current_active_version, available_versions, internal_clock
+    if internal_clock:
+        internal_clock.stop()
+        internal_clock = None
+    initialize_state()
+    all_loaded_osc_filters.clear()
+    current_active_version = 0
+    available_versions = {0}
+    for pending_queue in (midi_input_queue, osc_message_queue, engine_command_queue):
+        while not pending_queue.empty():
+            pending_queue.get()
+
+def _bench_event_stream(stream_kind, input_ports, osc_addresses, count, rnd):
+    """Genera una lista de eventos sintéticos: ('midi', puerto, mensaje) u ('osc', dirección, args)."""
+    events = []
+    while len(events) < count:
+        port_name = rnd.choice(input_ports)
+        roll = rnd.random()
+        if stream_kind == "clock" or (stream_kind == "mixed" and roll < 0.4):
+            events.append(("midi", port_name, mido.Message('clock')))
+        elif roll < 0.65:
+            channel, note = rnd.randrange(16), rnd.randrange(128)
+            events.append(("midi", port_name, mido.Message('note_on', channel=channel, note=note, velocity=rnd.randrange(1, 128))))
+            events.append(("midi", port_name, mido.Message('note_off', channel=channel, note=note)))
+        elif roll < 0.9 or not osc_addresses:
+            channel, control = rnd.randrange(16), rnd.randrange(128)
+            for value in sorted(rnd.randrange(128) for _ in range(BENCH_CC_BURST_LENGTH)):
+                events.append(("midi", port_name, mido.Message('control_change', channel=channel, control=control, value=value)))
+        else:
+            events.append(("osc", rnd.choice(osc_addresses), (rnd.randrange(128),)))
+    return events[:count]
+
+def _bench_push_event(backend, event):
+    if event[0] == "osc":
+        osc_message_queue.put((event[1], event[2]))
+    else:
+        backend.inject(event[1], event[2])
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+def _run_bench_scenario(scenario_name, rule_dir, rule_stems, stream_kind, num_events, seed=1):
+    """Carga unas reglas contra puertos en memoria, inyecta eventos y mide latencia y memoria por evento."""
+    _reset_offline_state()
+    backend = LoopbackMidiBackend(collect_sent=False)
+    rnd = random.Random(seed)
+
+    def run_iteration():
+        _process_single_loop_iteration(False, rule_dir, False, "", "", None)
+
+    with _use_midi_backend(backend), contextlib.redirect_stdout(io.StringIO()):
+        active_filters, _ = load_configuration(rule_stems, rule_dir, False, "", "")
+        process_version_activated_filters(0, active_filters, global_device_aliases, opened_ports_tracking, False, None, "")
+        input_ports = sorted(active_input_handlers) or ["MIDImod bench"]
+        osc_addresses = sorted({f.get("address") for f in all_loaded_osc_filters if isinstance(f.get("address"), str)})
+
+        for port_name in input_ports:
+            _bench_push_event(backend, ("midi", port_name, mido.Message('start')))
+        run_iteration()
+        for event in _bench_event_stream(stream_kind, input_ports, osc_addresses, BENCH_WARMUP_EVENTS, rnd):
+            _bench_push_event(backend, event)
+            run_iteration()
+
+        # Pasada de tiempos: un evento por iteración del motor, como llegan en vivo.
+        sent_before = backend.sent_count
+        latencies = []
+        perf_counter = time.perf_counter
+        started = perf_counter()
+        for event in _bench_event_stream(stream_kind, input_ports, osc_addresses, num_events, rnd):
+            _bench_push_event(backend, event)
+            t0 = perf_counter()
+            run_iteration()
+            latencies.append(perf_counter() - t0)
+        elapsed = perf_counter() - started
+        outputs_sent = backend.sent_count - sent_before
+
+        # Pasada de memoria: pico de bytes reservados durante cada evento y bloques que quedan vivos.
+        alloc_events = _bench_event_stream(stream_kind, input_ports, osc_addresses, BENCH_ALLOC_EVENTS, rnd)
+        gc.collect()
+        blocks_before = sys.getallocatedblocks()
+        tracemalloc.start()
+        peak_bytes_total = 0
+        for event in alloc_events:
+            _bench_push_event(backend, event)
+            current_bytes, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            run_iteration()
+            peak_bytes_total += tracemalloc.get_traced_memory()[1] - current_bytes
+        tracemalloc.stop()
+        gc.collect()
+        retained_blocks = sys.getallocatedblocks() - blocks_before
+
+    latencies.sort()
+    return {
+        "scenario": scenario_name,
+        "rules": [str(rule_dir / stem) for stem in rule_stems],
+        "stream": stream_kind,
+        "filters": len(all_loaded_filters),
+        "sequencers": len(sequencers_state),
+        "events": num_events,
+        "outputs_sent": outputs_sent,
+        "events_per_sec": round(num_events / elapsed, 1) if elapsed > 0 else None,
+        "latency_us": {
+            "mean": round(elapsed / num_events * 1e6, 2),
+            "p50": round(_percentile(latencies, 0.50) * 1e6, 2),
+            "p99": round(_percentile(latencies, 0.99) * 1e6, 2),
+            "max": round(latencies[-1] * 1e6, 2),
+        },
+        "alloc_peak_bytes_per_event": round(peak_bytes_total / len(alloc_events), 1),
+        "retained_blocks_per_event": round(retained_blocks / len(alloc_events), 3),
+    }
+
+def _write_bench_rules(target_dir, stem, content):
+    with open(target_dir / (stem + ".json"), "w", encoding="utf-8") as f:
+        json.dump(content, f)
+    return stem
+
+def _make_bench_filter_rules(num_filters):
+    """Reglas sintéticas: num_filters filtros de notas y CC repartidos por canales y valores."""
+    filters = []
+    for i in range(num_filters):
+        is_note = i % 2 == 0
+        filters.append({
+            "device_in": "bench_in",
+            "event_in": "note_on" if is_note else "cc",
+            "ch_in": (i // 2) % 16,
+            "value_1_in": (i // 32) % 128,
+            "output": [{
+                "device_out": "bench_out",
+                "value_1_out": "value_1_in + 12" if is_note else "value_1_in",
+                "value_2_out": "value_2_in" if is_note else {"scale_value": "value_2_in", "range_in": [0, 127], "range_out": [20, 100]},
+            }],
+        })
+    return {"device_alias": {"bench_in": "Bench Keys", "bench_out": "Bench Synth"}, "midi_filter": filters}
+
+def _make_bench_sequencer_rules(num_sequencers):
+    """Reglas sintéticas: num_sequencers secuenciadores de 16 pasos sobre el mismo reloj."""
+    sequencers = []
+    for i in range(num_sequencers):
+        sequencers.append({
+            "seq_id": f"bench_{i}",
+            "clock_in": "bench_clock",
+            "device_out": "bench_out",
+            "channel_out": i % 16,
+            "step_total": 16,
+            "step_duration": ["1/16", "1/8", "1/4t"][i % 3],
+            "seq_note": [36 + (i + step) % 48 for step in range(16)],
+            "seq_velocity": [100, 80, 90, 70],
+            "seq_gate": [1, 1, 0, 1],
+        })
+    return {"device_alias": {"bench_clock": "Bench Clock", "bench_out": "Bench Synth"}, "sequencer": sequencers}
+
+def run_benchmark_action(results_path):
+    """Ejecuta la batería de benchmarks del camino caliente y guarda los resultados en JSON."""
+    global monitor_active, offline_mode
+    monitor_active = False
+    offline_mode = True
+    results = []
+
+    def report(result):
+        results.append(result)
+        if "error" in result:
+            print(f"  {result['scenario']:<40} ERROR: {result['error']}")
+        else:
+            latency = result["latency_us"]
+            print(f"  {result['scenario']:<40} {result['events_per_sec']:>10.0f} ev/s  "
+                  f"p50 {latency['p50']:>7.1f} us  p99 {latency['p99']:>8.1f} us  max {latency['max']:>8.1f} us  "
+                  f"{result['alloc_peak_bytes_per_event']:>8.0f} B/ev")
+
+    def run_guarded(scenario_name, *scenario_args):
+        try:
+            report(_run_bench_scenario(scenario_name, *scenario_args))
+        except Exception as e:
+            report({"scenario": scenario_name, "error": repr(e)})
+
+    print(f"--- Benchmark ({BENCH_EVENTS_PER_SCENARIO} eventos por escenario) ---")
+    print("\nFicheros de reglas:")
+    for rule_dir in (RULES_DIR, RULES_DIR / "examples"):
+        for rule_file in sorted(rule_dir.glob("*.json")):
+            run_guarded(f"rules:{rule_file.relative_to(RULES_DIR).with_suffix('')}", rule_dir, [rule_file.stem], "mixed", BENCH_EVENTS_PER_SCENARIO)
+
+    with tempfile.TemporaryDirectory(prefix="midimod_bench_") as temp_dir:
+        temp_dir = Path(temp_dir)
+        print("\nEscalado de filtros:")
+        for num_filters in BENCH_FILTER_COUNTS:
+            stem = _write_bench_rules(temp_dir, f"filters_{num_filters}", _make_bench_filter_rules(num_filters))
+            run_guarded(f"filters:{num_filters}", temp_dir, [stem], "notes_cc", BENCH_EVENTS_PER_SCENARIO)
+        print("\nEscalado de secuenciadores:")
+        for num_sequencers in BENCH_SEQUENCER_COUNTS:
+            stem = _write_bench_rules(temp_dir, f"sequencers_{num_sequencers}", _make_bench_sequencer_rules(num_sequencers))
+            run_guarded(f"sequencers:{num_sequencers}", temp_dir, [stem], "clock", BENCH_EVENTS_PER_SCENARIO)
+
+    _reset_offline_state()
+    summary = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "events_per_scenario": BENCH_EVENTS_PER_SCENARIO,
+        "scenarios": results,
+    }
+    with open(results_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    offline_mode = False
+    print(f"\nResultados guardados en '{results_path}'.")
+
+
+# --- Render offline ---
+RENDER_CLOCK_PPQN = 24 # Resolución del reloj MIDI sintetizado a partir del mapa de tempo
+RENDER_DEFAULT_TEMPO = 500000 # 120 BPM, tempo por defecto de un SMF sin 'set_tempo'
+RENDER_RANDOM_SEED = 0 # random() en las reglas da el mismo resultado en cada render
+
+def _read_midi_file_events(midi_file):
+    """Devuelve los mensajes de canal/sistema con su tick absoluto y pista, las metas de tempo y los nombres de pista."""
+    events = []
+    tempo_metas = []
+    track_names = []
+    for track_index, track in enumerate(midi_file.tracks):
+        absolute_tick = 0
+        track_name = ""
+        for msg in track:
+            absolute_tick += msg.time
+            if msg.is_meta:
+                if msg.type == 'track_name' and not track_name:
+                    track_name = msg.name
+                elif msg.type in ('set_tempo', 'time_signature', 'key_signature'):
+                    tempo_metas.append((absolute_tick, msg))
+                continue
+            events.append((absolute_tick, track_index, msg))
+        track_names.append(track_name)
+    tempo_metas.sort(key=lambda item: item[0])
+    return events, tempo_metas, track_names
+
+def _make_tick_to_seconds(tempo_metas, ticks_per_beat):
+    """Construye las conversiones tick absoluto <-> segundos según el mapa de tempo del fichero."""
+    segment_ticks = [0]
+    segment_seconds = [0.0]
+    segment_tempos = [RENDER_DEFAULT_TEMPO]
+    for tick, meta in tempo_metas:
+        if meta.type != 'set_tempo':
+            continue
+        elapsed = mido.tick2second(tick - segment_ticks[-1], ticks_per_beat, segment_tempos[-1])
+        segment_ticks.append(tick)
+        segment_seconds.append(segment_seconds[-1] + elapsed)
+        segment_tempos.append(meta.tempo)
+
+    def tick_to_seconds(tick):
+        i = bisect_right(segment_ticks, tick) - 1
+        return segment_seconds[i] + mido.tick2second(tick - segment_ticks[i], ticks_per_beat, segment_tempos[i])
+
+    def seconds_to_tick(seconds):
+        i = bisect_right(segment_seconds, seconds) - 1
+        return segment_ticks[i] + mido.second2tick(seconds - segment_seconds[i], ticks_per_beat, segment_tempos[i])
+    return tick_to_seconds, seconds_to_tick
+
+def _find_input_port_for_alias(alias):
+    """Nombre del puerto de entrada abierto que corresponde a un alias (o al reloj interno)."""
+    substring = str(global_device_aliases.get(alias, alias)).lower()
+    if substring == INTERNAL_CLOCK_ALIAS:
+        return INTERNAL_CLOCK_PORT_NAME
+    return next((name for name in sorted(active_input_handlers) if substring in name.lower()), None)
+
+def _get_render_clock_ports():
+    """Puertos cuyo reloj siguen los secuenciadores y las plantillas de arpegiador cargadas."""
+    clock_ports = set()
+    for seq_state in sequencers_state:
+        if seq_state['clock_in_port_name']:
+            clock_ports.add(_find_input_port_for_alias(seq_state['clock_in_port_name']))
+    for template in arpeggiator_templates.values():
+        alias = template.get('clock_in', template.get('device_in'))
+        if alias:
+            clock_ports.add(_find_input_port_for_alias(alias))
+    clock_ports.discard(None)
+    return sorted(clock_ports)
+
+def _write_render_jsonl(output_path, rendered):
+    with open(output_path, "w", encoding="utf-8") as f:
+        for tick, seconds, port_name, msg in rendered:
+            record = {"tick": tick, "time": round(seconds, 6), "port": port_name}
+            record.update((key, value) for key, value in msg.dict().items() if key != "time")
+            f.write(json.dumps(record) + "\n")
+
+def _write_render_midi(output_path, rendered, tempo_metas, ticks_per_beat):
+    """Escribe un SMF tipo 1: pista 0 con el mapa de tempo y una pista por puerto de salida."""
+    out_file = mido.MidiFile(type=1, ticks_per_beat=ticks_per_beat)
+    tempo_track = mido.MidiTrack()
+    previous_tick = 0
+    for tick, meta in tempo_metas:
+        tempo_track.append(meta.copy(time=tick - previous_tick))
+        previous_tick = tick
+    out_file.tracks.append(tempo_track)
+
+    port_names = sorted({port_name for _, _, port_name, _ in rendered})
+    for port_index, port_name in enumerate(port_names):
+        track = mido.MidiTrack()
+        track.append(mido.MetaMessage('track_name', name=port_name))
+        track.append(mido.MetaMessage('midi_port', port=port_index % 256))
+        previous_tick = 0
+        for tick, _, msg_port, msg in rendered:
+            if msg_port != port_name or msg.is_realtime:
+                continue # Los mensajes de tiempo real no existen en un SMF
+            track.append(msg.copy(time=tick - previous_tick))
+            previous_tick = tick
+        out_file.tracks.append(track)
+    out_file.save(output_path)
+
+def run_offline_render(rule_files_to_load, rules_base_dir, input_midi_path, output_path, forced_input_alias=None):
+    """Procesa un fichero .mid con las reglas sobre una línea de tiempo virtual, tan rápido como permita la CPU."""
+    global monitor_active, offline_mode
+    try:
+        midi_file = mido.MidiFile(input_midi_path, clip=True)
+    except Exception as e:
+        print(f"[!] No se pudo leer el archivo MIDI '{input_midi_path}': {e}")
+        return False
+    output_path = Path(output_path)
+
+    previous_monitor_active = monitor_active
+    monitor_active = False
+    offline_mode = True
+    try:
+        _reset_offline_state()
+        random.seed(RENDER_RANDOM_SEED)
+        backend = LoopbackMidiBackend()
+
+        with _use_midi_backend(backend):
+            active_filters, _ = load_configuration(rule_files_to_load, rules_base_dir, False, "", "")
+            file_events, tempo_metas, track_names = _read_midi_file_events(midi_file)
+            tick_to_seconds, seconds_to_tick = _make_tick_to_seconds(tempo_metas, midi_file.ticks_per_beat)
+            clock_ports = _get_render_clock_ports()
+
+            # Puerto de entrada por pista: el forzado, el que coincide con el nombre de pista o el primero de los filtros.
+            filter_ports = [name for name in sorted(active_input_handlers) if name not in clock_ports] or sorted(active_input_handlers)
+            forced_port = _find_input_port_for_alias(forced_input_alias) if forced_input_alias else None
+            if forced_input_alias and not forced_port:
+                print(f"[!] Puerto de entrada '{forced_input_alias}' no encontrado en las reglas.")
+                return False
+            track_ports = []
+            for track_name in track_names:
+                matching = next((name for name in sorted(active_input_handlers) if track_name and (name.lower() in track_name.lower() or track_name.lower() in name.lower())), None)
+                track_ports.append(forced_port or matching or (filter_ports[0] if filter_ports else None))
+
+            # Línea de tiempo: (tick, prioridad, orden, puerto, mensaje); los clocks van antes que las notas del mismo tick.
+            timeline = []
+            file_has_clock = any(msg.type == 'clock' for _, _, msg in file_events)
+            for order, (tick, track_index, msg) in enumerate(file_events):
+                if msg.type == 'clock':
+                    timeline.extend((tick, 0, order, port_name, msg) for port_name in clock_ports)
+                elif track_ports[track_index]:
+                    timeline.append((tick, 1, order, track_ports[track_index], msg))
+            last_tick = max((tick for tick, _, _ in file_events), default=0)
+            if clock_ports and not file_has_clock:
+                clock_msg = mido.Message('clock')
+                ticks_per_clock = midi_file.ticks_per_beat / RENDER_CLOCK_PPQN
+                for clock_index in range(int(last_tick / ticks_per_clock) + 1):
+                    timeline.extend((clock_index * ticks_per_clock, 0, -1, port_name, clock_msg) for port_name in clock_ports)
+            timeline.sort(key=lambda item: (item[0], item[1], item[2]))
+
+            rendered = []
+            def deliver(tick, port_name, msg):
+                # El reloj interno no es un puerto del backend: sus ticks entran directamente en la cola del motor.
+                if port_name in active_input_handlers:
+                    backend.inject(port_name, msg, tick_to_seconds(tick))
+                else:
+                    backend.set_time(tick_to_seconds(tick))
+                    midi_input_queue.put((port_name, msg))
+
+            def collect_outputs(tick):
+                rendered.extend((int(round(tick)), seconds, port_name, msg) for seconds, port_name, msg in backend.take_sent())
+
+            def run_iteration():
+                _process_single_loop_iteration(False, rules_base_dir, False, "", "", None)
+
+            def release_rate_limited_ccs(until_seconds):
+                # En vivo el motor despierta al vencer cada CC retenido por cc_max_rate; aquí se hace en su instante virtual
+                while cc_rate_next_due is not None and cc_rate_next_due <= until_seconds:
+                    backend.set_time(cc_rate_next_due)
+                    _flush_due_rate_limited_ccs()
+                    _flush_output_batch()
+                    collect_outputs(seconds_to_tick(backend.now()))
+
+            started = time.perf_counter()
+            process_version_activated_filters(0, active_filters, global_device_aliases, opened_ports_tracking, False, None, "")
+            for port_name in clock_ports:
+                deliver(0, port_name, mido.Message('start'))
+            run_iteration()
+            collect_outputs(0)
+            for tick, _, _, port_name, msg in timeline:
+                release_rate_limited_ccs(tick_to_seconds(tick))
+                deliver(tick, port_name, msg)
+                run_iteration()
+                if backend.sent_messages:
+                    collect_outputs(tick)
+            # Cerrar las notas que sigan sonando al final del fichero
+            for i, seq_state in enumerate(sequencers_state):
+                _silence_instance(seq_state, f"SEQ[{i}]")
+            for key, instance_state in arpeggiator_instances.items():
+                _silence_instance(instance_state, f"ARP[{key[0]},{key[1]}]")
+            _flush_output_batch()
+            backend.set_time(tick_to_seconds(last_tick))
+            collect_outputs(last_tick)
+            release_rate_limited_ccs(float('inf')) # Los últimos valores retenidos también salen
+
+            elapsed = time.perf_counter() - started
+    finally:
+        offline_mode = False
+        monitor_active = previous_monitor_active
+
+    if output_path.suffix.lower() == ".jsonl":
+        _write_render_jsonl(output_path, rendered)
+    else:
+        _write_render_midi(output_path, rendered, tempo_metas, midi_file.ticks_per_beat)
+    events_per_sec = len(timeline) / elapsed if elapsed > 0 else 0
+    print(f"\n[*] Render: {len(timeline)} eventos de entrada ({len(clock_ports)} puerto(s) de reloj), "
+          f"{len(rendered)} mensajes de salida en {elapsed:.3f} s ({events_per_sec:.0f} eventos/s)")
+    print(f"[*] Resultado guardado en '{output_path}'")
+    return True
+
+
+# --- Log del monitor (hilo escritor) ---
+class MonitorLogWriter:
+    """Sustituto de sys.stdout para el modo monitor: buffer circular de líneas vaciado por un hilo propio.
+
+    write() nunca espera a la terminal: junta el texto en líneas completas (por hilo) y las deja
+    en un deque acotado; si está lleno se pierde la más antigua y se cuenta en dropped_lines.
+    Con log_path el mismo flujo se escribe en un fichero que rota al llegar a MONITOR_LOG_FILE_MAX_BYTES.
+    """
+
+    def __init__(self, stream, capacity=MONITOR_LOG_BUFFER_LINES, log_path=None):
+        self.stream = stream
+        self.lines = deque(maxlen=capacity)
+        self.dropped_lines = 0
+        self.reported_dropped = 0
+        self.log_path = Path(log_path) if log_path else None
+        self.log_file = None
+        self._partial_lines = {} # id de hilo -> texto sin '\n' final
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def __getattr__(self, name):
+        # encoding, isatty, fileno... se delegan en la salida real
+        return getattr(self.stream, name)
+
+    def write(self, text):
+        thread_id = threading.get_ident()
+        pending = self._partial_lines.pop(thread_id, "") + text
+        if "\n" not in pending:
+            if pending:
+                self._partial_lines[thread_id] = pending
+            return len(text)
+        *complete_lines, rest = pending.split("\n")
+        if rest:
+            self._partial_lines[thread_id] = rest
+        lines = self.lines
+        for line in complete_lines:
+            if len(lines) == lines.maxlen:
+                self.dropped_lines += 1
+            lines.append(line)
+        return len(text)
+
+    def flush(self):
+        pass # El hilo escritor vacía el buffer cada MONITOR_LOG_FLUSH_INTERVAL
+
+    def start(self):
+        if self.log_path and not self.log_file:
+            try:
+                self.log_file = open(self.log_path, "a", encoding="utf-8")
+                self.log_file.write(f"--- MIDImod {time.strftime('%Y-%m-%d %H:%M:%S')} ---\n")
+            except OSError as e:
+                self.stream.write(f"[!] No se pudo abrir el log '{self.log_path}': {e}\n")
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="MIDImod-monitor-log", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Detiene el hilo y escribe lo que quede (incluidas líneas sin '\\n')."""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        for thread_id in list(self._partial_lines):
+            self.lines.append(self._partial_lines.pop(thread_id))
+        self._drain()
+
+    def close(self):
+        self.stop()
+        if self.log_file:
+            self.log_file.close()
+            self.log_file = None
+
+    def _run(self):
+        while not self._stop_event.wait(MONITOR_LOG_FLUSH_INTERVAL):
+            self._drain()
+
+    def _drain(self):
+        lines = self.lines
+        chunk = []
+        while lines:
+            chunk.append(lines.popleft())
+        if self.dropped_lines != self.reported_dropped:
+            chunk.append(f"[!] Monitor: {self.dropped_lines - self.reported_dropped} línea(s) descartada(s) (la terminal no da abasto)")
+            self.reported_dropped = self.dropped_lines
+        if not chunk:
+            return
+        text = "\n".join(chunk) + "\n"
+        try:
+            self.stream.write(text)
+            self.stream.flush()
+        except (OSError, ValueError):
+            pass
+        if self.log_file:
+            self._write_log_file(text)
+
+    def _write_log_file(self, text):
+        try:
+            self.log_file.write(text)
+            self.log_file.flush()
+            if self.log_file.tell() >= MONITOR_LOG_FILE_MAX_BYTES:
+                self._rotate_log_file()
+        except (OSError, ValueError):
+            pass
+
+    def _rotate_log_file(self):
+        """midimod.log -> midimod.log.1 -> ... -> .N (se pierde el más antiguo)."""
+        self.log_file.close()
+        for index in range(MONITOR_LOG_FILE_BACKUPS - 1, 0, -1):
+            older = self.log_path.with_name(f"{self.log_path.name}.{index}")
+            if older.exists():
+                older.replace(self.log_path.with_name(f"{self.log_path.name}.{index + 1}"))
+        if MONITOR_LOG_FILE_BACKUPS > 0:
+            self.log_path.replace(self.log_path.with_name(f"{self.log_path.name}.1"))
+        self.log_file = open(self.log_path, "w", encoding="utf-8")
+
+def _install_monitor_log():
+    """Redirige sys.stdout al buffer del monitor (si no lo estaba ya)."""
+    if monitor_log_writer and sys.stdout is not monitor_log_writer:
+        monitor_log_writer.stream = sys.stdout
+        sys.stdout = monitor_log_writer
+        monitor_log_writer.start()
+
+def _uninstall_monitor_log():
+    """Vacía el buffer y devuelve sys.stdout a la terminal (antes de la TUI o al salir)."""
+    if monitor_log_writer and sys.stdout is monitor_log_writer:
+        monitor_log_writer.stop()
+        sys.stdout = monitor_log_writer.stream
+
+
 # --- OSC Server Implementation ---
 def _osc_message_handler(address, *args):
     """Pone los mensajes OSC recibidos en una cola para el hilo principal."""
     global osc_message_queue
     osc_message_queue.put((address, args))
+    _wake_engine()
 
 def start_osc_server():
     """Inicia el servidor OSC en un hilo separado si está configurado."""
@@ -2795,6 +4324,220 @@ def start_osc_server():
         osc_server_thread = None
 
 
+# --- Salida con ancho de banda limitado (DIN) ---
+DIN_BYTES_PER_SEC = 3125 # 31250 baudios, 10 bits por byte
+PACED_REALTIME_TYPES = frozenset({'clock', 'start', 'stop', 'continue', 'active_sensing', 'reset'})
+PACED_PRIORITY_BY_TYPE = {'note_on': 1, 'note_off': 1, 'sysex': 3} # Resto (CC, PC, pitch...): 2
+
+class PacedOutputPort:
+    """
+    Envoltorio de todos los puertos de salida. Sin límite (bytes_per_sec None) envía directamente;
+    con límite, los mensajes esperan en una cola con prioridad que un hilo propio vacía al ritmo
+    del cable: primero notas, luego CC y demás, y al final sysex. Reloj y tiempo real no esperan nunca.
+    """
+
+    def __init__(self, port):
+        self.port = port
+        self.bytes_per_sec = None
+        self.queue = [] # heap de (prioridad, orden, hora de llegada, mensaje)
+        self.last_delay = 0.0 # Espera en cola del último mensaje enviado (s)
+        self._order = itertools.count()
+        self._wire_free_at = 0.0 # perf_counter en que el cable queda libre
+        self._cond = threading.Condition()
+        self._thread = None
+
+    @property
+    def name(self):
+        return self.port.name
+
+    @property
+    def closed(self):
+        return self.port.closed
+
+    def set_bandwidth(self, bytes_per_sec):
+        """Activa (bytes/s) o desactiva (None) el envío con ritmo; lo que quede en cola sale ya."""
+        with self._cond:
+            self.bytes_per_sec = bytes_per_sec
+            if bytes_per_sec and not self._thread:
+                self._thread = threading.Thread(target=self._run, name=f"MIDImod-paced-{self.port.name}", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        if not bytes_per_sec:
+            self._drain_queue()
+
+    def send(self, msg):
+        if not self.bytes_per_sec:
+            self.port.send(msg)
+            return
+        now = time.perf_counter()
+        with self._cond:
+            if msg.type in PACED_REALTIME_TYPES:
+                # Se cuela delante de la cola, pero ocupa su byte en el cable
+                self._wire_free_at = max(now, self._wire_free_at) + 1 / self.bytes_per_sec
+            else:
+                heapq.heappush(self.queue, (PACED_PRIORITY_BY_TYPE.get(msg.type, 2), next(self._order), now, msg))
+                self._cond.notify()
+                return
+        self.port.send(msg)
+
+    def get_queue_stats(self):
+        """(mensajes en cola, espera del último enviado en s) para la TUI; None sin límite."""
+        if not self.bytes_per_sec:
+            return None
+        return (len(self.queue), self.last_delay)
+
+    def close(self):
+        self.set_bandwidth(None) # Vacía la cola y deja terminar el hilo
+        self.port.close()
+
+    def _drain_queue(self):
+        with self._cond:
+            pending = [heapq.heappop(self.queue)[3] for _ in range(len(self.queue))]
+        for msg in pending:
+            self.port.send(msg)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self.bytes_per_sec and not self.queue:
+                    self._cond.wait()
+                if not self.bytes_per_sec:
+                    self._thread = None
+                    return
+                now = time.perf_counter()
+                if now < self._wire_free_at:
+                    self._cond.wait(self._wire_free_at - now)
+                    continue
+                _, _, queued_at, msg = heapq.heappop(self.queue)
+                self._wire_free_at = now + len(msg.bytes()) / self.bytes_per_sec
+                self.last_delay = now - queued_at
+            try:
+                self.port.send(msg)
+            except Exception as e:
+                if monitor_active:
+                    print(f"  [!] No se pudo enviar a '{self.port.name}': {e}")
+
+
+# --- Reloj Maestro Interno ---
+class InternalClock:
+    """
+    Reloj MIDI generado por MIDImod en su propio hilo.
+    Cada tick se programa sobre una línea de tiempo absoluta (inicio + n * intervalo) con un
+    temporizador monotónico, de modo que los retrasos de un tick no se acumulan en los siguientes.
+    Los ticks se envían directamente a los puertos 'clock_out' y se inyectan en la cola de entrada
+    del motor como si llegaran de un puerto llamado INTERNAL_CLOCK_PORT_NAME.
+    """
+
+    def __init__(self, bpm, ppqn, output_ports):
+        self.bpm = bpm
+        self.ppqn = ppqn
+        self.output_ports = output_ports # Lista de (alias, objeto de puerto)
+        self.is_running = False
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def configure(self, bpm, ppqn, output_ports):
+        """Aplica un nuevo tempo/resolución/destinos; el hilo lo toma en el siguiente tick."""
+        self.bpm = bpm
+        self.ppqn = ppqn
+        self.output_ports = output_ports
+
+    def tick_interval(self):
+        return 60.0 / (self.bpm * self.ppqn)
+
+    def _emit(self, msg):
+        """Envía un mensaje de reloj/transporte a las salidas y al motor."""
+        for alias, port_obj in self.output_ports:
+            try:
+                port_obj.send(msg)
+            except Exception as e:
+                if monitor_active:
+                    print(f"  [!] Reloj interno: no se pudo enviar '{msg.type}' a '{alias}': {e}")
+        midi_input_queue.put((INTERNAL_CLOCK_PORT_NAME, msg))
+        _wake_engine()
+
+    def start(self):
+        if self.is_running:
+            return
+        self.is_running = True
+        self._stop_event.clear()
+        self._emit(mido.Message('start'))
+        self._thread = threading.Thread(target=self._run, name="MIDImod-clock", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self.is_running:
+            return
+        self.is_running = False
+        self._stop_event.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+        self._thread = None
+        self._emit(mido.Message('stop'))
+
+    def _run(self):
+        clock_msg = mido.Message('clock')
+        next_tick_time = time.perf_counter()
+        while not self._stop_event.is_set():
+            remaining = next_tick_time - time.perf_counter()
+            # Dormir hasta poco antes del tick y esperar activamente el último tramo.
+            if remaining > INTERNAL_CLOCK_SPIN_WINDOW:
+                if self._stop_event.wait(remaining - INTERNAL_CLOCK_SPIN_WINDOW):
+                    break
+            while time.perf_counter() < next_tick_time:
+                pass
+            self._emit(clock_msg.copy(time=time.perf_counter()) if jitter_measure_enabled else clock_msg)
+            interval = self.tick_interval()
+            next_tick_time += interval
+            # Si el proceso se quedó congelado, re-sincronizar en lugar de disparar una ráfaga de ticks.
+            if time.perf_counter() - next_tick_time > interval * INTERNAL_CLOCK_MAX_LATE_TICKS:
+                next_tick_time = time.perf_counter() + interval
+
+def _configure_internal_clock(clock_conf):
+    """Crea, actualiza o elimina el reloj interno según la sección 'internal_clock' de las reglas."""
+    global internal_clock
+
+    if not isinstance(clock_conf, dict):
+        if internal_clock:
+            internal_clock.stop()
+            internal_clock = None
+            print("  - [CLOCK] Reloj interno eliminado.")
+        return
+
+    eval_context = {"version": current_active_version}
+    bpm = float(get_evaluated_value_from_output_config(clock_conf.get('bpm'), INTERNAL_CLOCK_DEFAULTS['bpm'], eval_context, "internal_clock", "bpm"))
+    ppqn = int(get_evaluated_value_from_output_config(clock_conf.get('ppqn'), INTERNAL_CLOCK_DEFAULTS['ppqn'], eval_context, "internal_clock", "ppqn"))
+    if bpm <= 0 or ppqn <= 0:
+        print(f"  [!] Reloj interno: bpm/ppqn no válidos ({bpm}/{ppqn}). Usando valores por defecto.")
+        bpm, ppqn = INTERNAL_CLOCK_DEFAULTS['bpm'], INTERNAL_CLOCK_DEFAULTS['ppqn']
+
+    output_ports = []
+    for alias in _get_internal_clock_out_aliases(clock_conf):
+        port_obj = _resolve_output_port(alias)
+        if port_obj:
+            output_ports.append((alias, port_obj))
+        else:
+            print(f"  [!] Reloj interno: puerto de salida '{alias}' no encontrado.")
+
+    if internal_clock:
+        internal_clock.configure(bpm, ppqn, output_ports)
+        print(f"  - [CLOCK] Reloj interno actualizado: {bpm:g} BPM, {ppqn} PPQN")
+    else:
+        internal_clock = InternalClock(bpm, ppqn, output_ports)
+        print(f"  - [CLOCK] Reloj interno: {bpm:g} BPM, {ppqn} PPQN")
+        if clock_conf.get('autostart', INTERNAL_CLOCK_DEFAULTS['autostart']) and not offline_mode:
+            internal_clock.start()
+
+def _get_internal_clock_out_aliases(clock_conf):
+    """Devuelve la lista de alias de 'clock_out' (acepta un único alias o una lista)."""
+    clock_out = clock_conf.get('clock_out', [])
+    if isinstance(clock_out, str):
+        return [clock_out]
+    if isinstance(clock_out, list):
+        return [alias for alias in clock_out if isinstance(alias, str)]
+    return []
+
+
 def _cleanup_for_reload():
     """Preserva el estado de los módulos activos y limpia las configuraciones recargables."""
     global sequencers_state, persisted_sequencer_states, monitor_active
@@ -2821,7 +4564,8 @@ def _cleanup_for_reload():
         instance_state['is_armed'] = False
         _silence_instance(instance_state, f"ARP[{key[0]},{key[1]}]")
 
-    # Enviar panic a los puertos ANTES de limpiarlos
+    # Enviar panic a los puertos ANTES de limpiarlos (tras las note-off ya encoladas)
+    _flush_output_batch()
     for port_info in opened_ports_tracking.values():
         if port_info["type"] == "out" and port_info["obj"] and not port_info["obj"].closed:
             try:
@@ -2830,7 +4574,7 @@ def _cleanup_for_reload():
                     port_info["obj"].send(msg)
                 
                 # Marcamos la actividad para la TUI una sola vez, fuera del bucle
-                port_info["last_out_msg_str"] = "AllNotesOff"
+                port_info["last_out_msg"] = "AllNotesOff"
                 now = time.time()
                 port_info["last_out_msg_time"] = now
                 port_info["activity_time"] = now
@@ -2842,6 +4586,42 @@ def _cleanup_for_reload():
     clear_reloadable_state()
 
 
+def _collect_required_port_aliases(all_configs, internal_clock_conf):
+    """Devuelve (entradas, salidas): los puertos (alias resueltos) que piden filtros, módulos y reloj interno."""
+    required_inputs = set()
+    required_outputs = set()
+
+    for conf_dict in all_configs:
+        # Recopilar puertos de entrada
+        for key in ["device_in", "clock_in"]:
+            alias = conf_dict.get(key)
+            if alias and global_device_aliases.get(alias, alias) != INTERNAL_CLOCK_ALIAS:
+                required_inputs.add(global_device_aliases.get(alias, alias))
+        
+        # Recopilar puertos de salida
+        alias = conf_dict.get("device_out")
+        if alias:
+            required_outputs.add(global_device_aliases.get(alias, alias))
+        
+        # Recopilar puertos de salida de los bloques 'output'
+        outputs = conf_dict.get("output", [])
+        if isinstance(outputs, list):
+            for out_block in outputs:
+                if isinstance(out_block, dict):
+                    alias = out_block.get("device_out")
+                    if alias:
+                        required_outputs.add(global_device_aliases.get(alias, alias))
+
+    if "TPT_out" in global_device_aliases:
+        required_outputs.add(global_device_aliases["TPT_out"])
+
+    if isinstance(internal_clock_conf, dict):
+        for alias in _get_internal_clock_out_aliases(internal_clock_conf):
+            required_outputs.add(global_device_aliases.get(alias, alias))
+
+    return required_inputs, required_outputs
+
+
 # midimod.py
 
 def load_configuration(rule_files_to_load, base_dir, is_virtual_mode, vp_in_name, vp_out_name):
@@ -2872,6 +4652,7 @@ def load_configuration(rule_files_to_load, base_dir, is_virtual_mode, vp_in_name
         if not json_content: continue
         
         full_json_contents.append(json_content)
+        loaded_rule_files[file_path.name] = (json_content, copy.deepcopy(json_content)) # Referencia para la recarga incremental
         global_device_aliases.update(json_content.get("device_alias", {}))
         
         if not osc_conf_source_file and "osc_configuration" in json_content:
@@ -2908,9 +4689,11 @@ def load_configuration(rule_files_to_load, base_dir, is_virtual_mode, vp_in_name
                 if isinstance(osc_f, dict):
                     osc_f["_source_file"] = file_path.name
                     osc_f["_filter_id_str"] = f"{rule_file_name_stem}.osc.{i}"
+                    compile_output_blocks(osc_f.get("output", []))
                     all_loaded_osc_filters.append(osc_f)
 
     user_variables.update(next((content.get("user_variables", {}) for content in full_json_contents if "user_variables" in content), {}))
+    internal_clock_conf = next((content["internal_clock"] for content in full_json_contents if "internal_clock" in content), None)
 
     
     for var_name, initial_value in user_variables.items():
@@ -2929,42 +4712,19 @@ def load_configuration(rule_files_to_load, base_dir, is_virtual_mode, vp_in_name
     load_sequencers(full_json_contents, global_device_aliases)
     load_arpeggiators(full_json_contents)
     collect_available_versions_from_filters(all_loaded_filters)
+    compile_all_midi_filters(all_loaded_filters)
 
     # --- Gestión Inteligente de Puertos ---
     print("\n--- Gestión de Puertos MIDI ---")
     
     # --- INICIO DE LA NUEVA LÓGICA ---
-    required_inputs = set()
-    required_outputs = set()
-
     all_configs = all_loaded_filters + [s['config'] for s in sequencers_state] + [a['config'] for a in arpeggiator_instances.values()]
-    
-    for conf_dict in all_configs:
-        # Recopilar puertos de entrada
-        for key in ["device_in", "clock_in"]:
-            alias = conf_dict.get(key)
-            if alias:
-                required_inputs.add(global_device_aliases.get(alias, alias))
-        
-        # Recopilar puertos de salida
-        alias = conf_dict.get("device_out")
-        if alias:
-            required_outputs.add(global_device_aliases.get(alias, alias))
-        
-        # Recopilar puertos de salida de los bloques 'output'
-        outputs = conf_dict.get("output", [])
-        if isinstance(outputs, list):
-            for out_block in outputs:
-                if isinstance(out_block, dict):
-                    alias = out_block.get("device_out")
-                    if alias:
-                        required_outputs.add(global_device_aliases.get(alias, alias))
-
-    if "TPT_out" in global_device_aliases:
-        required_outputs.add(global_device_aliases["TPT_out"])
+    required_inputs, required_outputs = _collect_required_port_aliases(all_configs, internal_clock_conf)
 
     # Cerrar puertos que ya no se necesitan
     all_required_aliases = required_inputs.union(required_outputs)
+    required_port_aliases.clear()
+    required_port_aliases.update(all_required_aliases)
     for port_name, port_info in list(opened_ports_tracking.items()):
         if port_info["alias_used"] not in all_required_aliases:
             print(f"  - [CLOSE] Puerto '{port_name}' (usado por '{port_info['alias_used']}') ya no es necesario. Cerrando...")
@@ -2977,8 +4737,10 @@ def load_configuration(rule_files_to_load, base_dir, is_virtual_mode, vp_in_name
                 print(f"  [!] Error cerrando puerto '{port_name}': {e}")
 
     # Abrir puertos nuevos que se necesiten
-    mido_inputs = mido.get_input_names()
-    mido_outputs = mido.get_output_names()
+    if isinstance(midi_backend, LoopbackMidiBackend):
+        midi_backend.ensure_ports(all_required_aliases)
+    mido_inputs = midi_backend.get_input_names()
+    mido_outputs = midi_backend.get_output_names()
 
     # Abrir puertos de ENTRADA
     for alias in required_inputs:
@@ -2986,12 +4748,12 @@ def load_configuration(rule_files_to_load, base_dir, is_virtual_mode, vp_in_name
         port_name_in = find_port_by_substring(mido_inputs, alias)
         if port_name_in and port_name_in not in active_input_handlers:
             try:
-                in_port_obj = mido.open_input(port_name_in)
+                in_port_obj = midi_backend.open_input(port_name_in, callback=_make_midi_input_callback(port_name_in))
                 active_input_handlers[port_name_in] = in_port_obj
                 opened_ports_tracking[port_name_in] = {
                     "obj": in_port_obj, "type": "in", "alias_used": alias,
-                    "last_in_msg_str": "", "last_in_msg_time": 0,
-                    "last_out_msg_str": "", "last_out_msg_time": 0, "activity_time": 0
+                    "last_in_msg": None, "last_in_msg_time": 0,
+                    "last_out_msg": None, "last_out_msg_time": 0, "activity_time": 0
                 }
                 print(f"  - [OPEN-IN] Abierto '{port_name_in}' (requerido por '{alias}')")
             except Exception as e:
@@ -3003,11 +4765,11 @@ def load_configuration(rule_files_to_load, base_dir, is_virtual_mode, vp_in_name
         port_name_out = find_port_by_substring(mido_outputs, alias)
         if port_name_out and not any(p_info.get("obj") and p_info["obj"].name == port_name_out for p_info in opened_ports_tracking.values()):
             try:
-                out_port_obj = mido.open_output(port_name_out)
+                out_port_obj = PacedOutputPort(midi_backend.open_output(port_name_out))
                 opened_ports_tracking[port_name_out] = {
                     "obj": out_port_obj, "type": "out", "alias_used": alias,
-                    "last_in_msg_str": "", "last_in_msg_time": 0,
-                    "last_out_msg_str": "", "last_out_msg_time": 0, "activity_time": 0
+                    "last_in_msg": None, "last_in_msg_time": 0,
+                    "last_out_msg": None, "last_out_msg_time": 0, "activity_time": 0
                 }
                 print(f"  - [OPEN-OUT] Abierto '{port_name_out}' (requerido por '{alias}')")
                 if alias == global_device_aliases.get("TPT_out"):
@@ -3017,8 +4779,16 @@ def load_configuration(rule_files_to_load, base_dir, is_virtual_mode, vp_in_name
     # --- FIN DE LA NUEVA LÓGICA ---
 
     # --- Finalización ---
-    active_filters_final = [f for f in all_loaded_filters if f.get("device_in") is None or any(global_device_aliases.get(f.get("device_in"), f.get("device_in")).lower() in name.lower() for name in active_input_handlers)]
-    return active_filters_final, None
+    _rebuild_port_alias_tables()
+    _rebuild_cc_rate_policies()
+    _configure_internal_clock(internal_clock_conf)
+    build_filter_dispatch_index(active_input_handlers)
+    _rebuild_clock_subscriptions()
+    return _get_active_filters(), None
+
+def _get_active_filters():
+    """Filtros que pueden dispararse: los de versión (sin device_in) y los de entradas abiertas."""
+    return [f for f in all_loaded_filters if f.get("device_in") is None or any(global_device_aliases.get(f.get("device_in"), f.get("device_in")).lower() in name.lower() for name in active_input_handlers)]
 
 
 def reload_all_configuration(base_dir, is_virtual_mode, vp_in_name, vp_out_name):
@@ -3058,73 +4828,351 @@ def reload_all_configuration(base_dir, is_virtual_mode, vp_in_name, vp_out_name)
     return active_filters, virtual_port_ref
 
 
+# --- Recarga incremental ---
+# Al guardar un fichero de reglas solo se vuelve a leer ese fichero. Si únicamente cambian sus filtros,
+# secuenciadores o arpegiadores, se sustituyen esos elementos (comparados por posición con la copia
+# intacta de la carga anterior) y el resto sigue sonando, sin panic. Los cambios en ajustes globales
+# (alias, variables, reloj interno, escalas, OSC...) o que necesiten puertos nuevos hacen la recarga completa.
+RULE_MODULE_SECTIONS = ("midi_filter", "osc_filter", "sequencer", "arpeggiator")
+
+def _rule_file_global_settings(content):
+    return {key: value for key, value in content.items() if key not in RULE_MODULE_SECTIONS}
+
+def _reuse_unchanged_rule_items(new_items, old_items, old_pristine_items):
+    """Conserva el objeto en uso de cada elemento que no ha cambiado en su misma posición."""
+    if not isinstance(new_items, list) or not isinstance(old_items, list) or not isinstance(old_pristine_items, list):
+        return new_items
+    return [old_items[i] if i < len(old_items) and i < len(old_pristine_items) and item == old_pristine_items[i] else item
+            for i, item in enumerate(new_items)]
+
+def _rule_section_items(content, section):
+    items = content.get(section, [])
+    return [item for item in items if isinstance(item, dict)] if isinstance(items, list) else []
+
+def reload_changed_rule_file(changed_path, base_dir, is_virtual_mode, vp_in_name, vp_out_name):
+    """
+    Recarga un único fichero de reglas. Devuelve (filtros activos, puerto virtual) o None si
+    hace falta la recarga completa.
+    """
+    global all_loaded_filters, all_loaded_osc_filters, sequencers_state, monitor_active
+
+    file_path = Path(changed_path)
+    previous = loaded_rule_files.get(file_path.name)
+    if previous is None or file_path.parent.resolve() != Path(base_dir).resolve():
+        return None # Fichero nuevo para esta configuración
+    old_content, old_pristine = previous
+
+    print(f"\n[*] Recarga incremental de '{file_path.name}'")
+    new_content = _load_json_file_content(file_path)
+    if not isinstance(new_content, dict):
+        print(f"  [!] No se ha podido leer '{file_path.name}'. Se mantiene la versión en uso.")
+        return _get_active_filters(), None
+    if new_content == old_pristine:
+        print("  - Sin cambios.")
+        return _get_active_filters(), None
+    if _rule_file_global_settings(new_content) != _rule_file_global_settings(old_pristine):
+        print("  - Han cambiado ajustes globales del fichero: recarga completa.")
+        return None
+
+    new_pristine = copy.deepcopy(new_content)
+    for section in RULE_MODULE_SECTIONS:
+        if section in new_content:
+            new_content[section] = _reuse_unchanged_rule_items(new_content[section], old_content.get(section), old_pristine.get(section))
+
+    # Lo nuevo o modificado no tiene aún los campos internos ni estado. Lo compilado ('_compiled',
+    # '_compiled_output') vive en el propio bloque: lo sustituido no deja nada en ninguna caché.
+    stem = file_path.stem
+    changed_filters = []
+    for i, f_config in enumerate(new_content.get("midi_filter", []) if isinstance(new_content.get("midi_filter"), list) else []):
+        if isinstance(f_config, dict) and "_source_file" not in f_config:
+            f_config["_source_file"] = file_path.name
+            f_config["_filter_id_str"] = f"{stem}.{i}"
+            changed_filters.append(f_config)
+    for i, osc_f in enumerate(new_content.get("osc_filter", []) if isinstance(new_content.get("osc_filter"), list) else []):
+        if isinstance(osc_f, dict) and "_source_file" not in osc_f:
+            osc_f["_source_file"] = file_path.name
+            osc_f["_filter_id_str"] = f"{stem}.osc.{i}"
+            compile_output_blocks(osc_f.get("output", []))
+
+    old_arp_items = _rule_section_items(old_content, "arpeggiator")
+    new_arp_items = _rule_section_items(new_content, "arpeggiator")
+    changed_arp_ids = {arp_conf.get("arp_id") for arp_conf in old_arp_items if not any(arp_conf is item for item in new_arp_items)}
+    changed_arp_ids |= {arp_conf.get("arp_id") for arp_conf in new_arp_items if not any(arp_conf is item for item in old_arp_items)}
+
+    contents = [new_content if content is old_content else content for content, _ in loaded_rule_files.values()]
+    new_filters = [f for content in contents for f in _rule_section_items(content, "midi_filter")]
+    new_seq_configs = [seq_conf for content in contents for seq_conf in _rule_section_items(content, "sequencer")]
+    kept_arp_configs = [instance['config'] for key, instance in arpeggiator_instances.items() if key[0] not in changed_arp_ids]
+
+    # Abrir puertos implica la gestión completa de puertos
+    internal_clock_conf = next((content["internal_clock"] for content in contents if "internal_clock" in content), None)
+    required_inputs, required_outputs = _collect_required_port_aliases(new_filters + new_seq_configs + kept_arp_configs, internal_clock_conf)
+    if not (required_inputs | required_outputs) <= required_port_aliases:
+        print("  - Los cambios necesitan puertos nuevos: recarga completa.")
+        return None
+
+    # --- Aplicar ---
+    full_json_contents[next(i for i, content in enumerate(full_json_contents) if content is old_content)] = new_content
+    loaded_rule_files[file_path.name] = (new_content, new_pristine)
+
+    all_loaded_filters = new_filters
+    all_loaded_osc_filters = [osc_f for content in contents for osc_f in _rule_section_items(content, "osc_filter")]
+    compile_all_midi_filters(changed_filters)
+    collect_available_versions_from_filters(all_loaded_filters)
+
+    old_states_by_config = {id(seq_state['config']): seq_state for seq_state in sequencers_state}
+    new_sequencers_state = []
+    new_seq_states = []
+    for i, seq_conf in enumerate(new_seq_configs):
+        seq_state = old_states_by_config.pop(id(seq_conf), None)
+        if seq_state is None:
+            seq_state = _build_sequencer_state(i, seq_conf, global_device_aliases)
+            new_seq_states.append(seq_state)
+        new_sequencers_state.append(seq_state)
+    # Los secuenciadores sustituidos o quitados sueltan sus notas; si seguían sonando, el nuevo con el mismo seq_id continúa
+    playing_by_seq_id = {}
+    for seq_state in old_states_by_config.values():
+        seq_id = seq_state['config'].get('seq_id')
+        _silence_instance(seq_state, f"SEQ '{seq_id}'" if seq_id else "SEQ")
+        if seq_id and seq_state.get('is_playing'):
+            playing_by_seq_id[seq_id] = {key: seq_state.get(key) for key in ('is_playing', 'tick_counter', 'last_known_tick', 'active_step')}
+    for seq_state in new_seq_states:
+        preserved_state = playing_by_seq_id.get(seq_state['config'].get('seq_id'))
+        if preserved_state:
+            seq_state.update(preserved_state)
+            seq_state['schedule_needs_rebuild'] = True
+    sequencers_state = new_sequencers_state
+
+    for arp_id in changed_arp_ids:
+        arpeggiator_templates.pop(arp_id, None)
+    for i, arp_conf in enumerate(arp_conf for content in contents for arp_conf in _rule_section_items(content, "arpeggiator")):
+        if arp_conf.get("arp_id") in changed_arp_ids:
+            arp_template = _build_arp_template(i, arp_conf)
+            if arp_template:
+                arpeggiator_templates[arp_template[0]] = arp_template[1]
+    for key in [key for key in arpeggiator_instances if key[0] in changed_arp_ids]:
+        instance_state = arpeggiator_instances.pop(key)
+        _silence_instance(instance_state, f"ARP[{key[0]},{key[1]}]") # Se recrea con la nueva plantilla en la próxima nota
+
+    build_filter_dispatch_index(active_input_handlers)
+    _rebuild_clock_subscriptions()
+    _rebuild_cc_rate_policies()
+
+    print(f"  - {len(changed_filters)} filtro(s), {len(new_seq_states)} secuenciador(es) y "
+          f"{len(changed_arp_ids)} plantilla(s) de arpegiador sustituidos. El resto sigue igual.")
+    version_filters = [f for f in changed_filters if f.get("device_in") is None]
+    if version_filters:
+        process_version_activated_filters(current_active_version, version_filters, global_device_aliases, opened_ports_tracking, is_virtual_mode, None, vp_out_name)
+    return _get_active_filters(), None
+
+
+# --- Perfilador ---
+def _profiler_record(profile_key, elapsed, outputs_generated):
+    """Acumula llamadas, tiempo total/máximo y salidas generadas de un filtro o módulo."""
+    stats = profiler_stats.get(profile_key)
+    if stats is None:
+        stats = profiler_stats[profile_key] = {'calls': 0, 'total_time': 0.0, 'max_time': 0.0, 'outputs': 0}
+    stats['calls'] += 1
+    stats['total_time'] += elapsed
+    if elapsed > stats['max_time']:
+        stats['max_time'] = elapsed
+    stats['outputs'] += outputs_generated
+
+def _profiled_process_midi_event(original_msg, port_name, filter_config, *args):
+    started = time.perf_counter()
+    outputs, version_action = process_midi_event_new_logic(original_msg, port_name, filter_config, *args)
+    _profiler_record(filter_config.get('_filter_id_str', 'ID?'), time.perf_counter() - started, len(outputs) if outputs else 0)
+    return outputs, version_action
+
+def _profiled_sequencer_step(seq_index, *args):
+    started = time.perf_counter()
+    messages_sent = process_sequencer_step(seq_index, *args)
+    _profiler_record(f"SEQ[{seq_index}]", time.perf_counter() - started, messages_sent or 0)
+    return messages_sent
+
+def _profiled_arpeggiator_step(instance_key, *args):
+    started = time.perf_counter()
+    messages_sent = process_arpeggiator_step(instance_key, *args)
+    _profiler_record(f"ARP[{instance_key[0]},{instance_key[1]}]", time.perf_counter() - started, messages_sent or 0)
+    return messages_sent
+
+def _profiler_note_clock(port_name):
+    """Estima el periodo de tick de cada puerto de reloj (media móvil de los intervalos)."""
+    now = time.perf_counter()
+    entry = profiler_clock_periods.get(port_name)
+    if entry is None:
+        profiler_clock_periods[port_name] = [now, None]
+        return
+    interval = now - entry[0]
+    entry[0] = now
+    if interval > 1.0:
+        return # Pausa del reloj: no es un periodo real
+    entry[1] = interval if entry[1] is None else entry[1] * 0.9 + interval * 0.1
+
+def _profiler_tick_period():
+    """Periodo de tick más corto entre los relojes activos (el presupuesto de tiempo por tick)."""
+    periods = [period for _, period in profiler_clock_periods.values() if period]
+    return min(periods) if periods else None
+
+def _get_profiler_rows():
+    """Entradas del perfilador ordenadas por tiempo acumulado: (clave, llamadas, total, máximo, salidas)."""
+    return sorted(
+        ((key, stats['calls'], stats['total_time'], stats['max_time'], stats['outputs']) for key, stats in profiler_stats.items()),
+        key=lambda row: row[2], reverse=True
+    )
+
+def _engine_dump_profile():
+    """Comando: guarda las estadísticas del perfilador en PROFILE_DUMP_FILE (tecla 'p')."""
+    global tui_last_osc_msg_str, tui_last_osc_msg_time
+    tick_period = _profiler_tick_period()
+    entries = [{
+        'id': key, 'calls': calls, 'outputs': outputs,
+        'total_ms': round(total_time * 1e3, 3),
+        'mean_us': round(total_time / calls * 1e6, 2) if calls else 0.0,
+        'max_ms': round(max_time * 1e3, 3),
+        'exceeds_tick': bool(tick_period and max_time > tick_period),
+    } for key, calls, total_time, max_time, outputs in _get_profiler_rows()]
+    try:
+        with open(PROFILE_DUMP_FILE, "w", encoding="utf-8") as f:
+            json.dump({
+                'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+                'tick_period_ms': round(tick_period * 1e3, 3) if tick_period else None,
+                'entries': entries,
+            }, f, indent=2)
+        status_text = f"Perfil guardado en '{PROFILE_DUMP_FILE}' ({len(entries)} entradas)"
+    except OSError as e:
+        status_text = f"ERROR guardando perfil: {e}"
+    if monitor_active:
+        print(f"[*] {status_text}")
+    else:
+        tui_last_osc_msg_str = status_text
+        tui_last_osc_msg_time = time.time()
+
+
+# --- Medición de jitter ---
+def _jitter_record(module_key, lateness):
+    """Añade una muestra de retraso (envío - llegada del clock) al histograma de un módulo."""
+    stats = jitter_stats.get(module_key)
+    if stats is None:
+        stats = jitter_stats[module_key] = {'count': 0, 'sum': 0.0, 'sum_sq': 0.0, 'max': 0.0, 'bins': [0] * (JITTER_NUM_BINS + 1)}
+    stats['count'] += 1
+    stats['sum'] += lateness
+    stats['sum_sq'] += lateness * lateness
+    if lateness > stats['max']:
+        stats['max'] = lateness
+    stats['bins'][min(JITTER_NUM_BINS, max(0, int(lateness / JITTER_BIN_WIDTH)))] += 1
+
+def _jitter_note_send(module_key):
+    """Registra el envío de un módulo respecto al clock que lo disparó (si se recibió en esta iteración)."""
+    clock_arrival = jitter_pending_clock.get(module_key)
+    if clock_arrival:
+        _jitter_record(module_key, time.perf_counter() - clock_arrival)
+
+def _jitter_percentile(stats, fraction):
+    """Percentil aproximado a partir del histograma (borde superior de la barra)."""
+    target = stats['count'] * fraction
+    accumulated = 0
+    for bin_index, bin_count in enumerate(stats['bins']):
+        accumulated += bin_count
+        if accumulated >= target and bin_count:
+            return stats['max'] if bin_index == JITTER_NUM_BINS else min(stats['max'], (bin_index + 1) * JITTER_BIN_WIDTH)
+    return stats['max']
+
+def _get_jitter_rows():
+    """Resumen por módulo: (clave, muestras, media, p50, p99, máximo, desviación típica), en segundos."""
+    rows = []
+    for key, stats in sorted(jitter_stats.items()):
+        count = stats['count']
+        mean = stats['sum'] / count
+        std_dev = max(0.0, stats['sum_sq'] / count - mean * mean) ** 0.5
+        rows.append((key, count, mean, _jitter_percentile(stats, 0.50), _jitter_percentile(stats, 0.99), stats['max'], std_dev))
+    return rows
+
+def _format_jitter_row(row):
+    key, count, mean, p50, p99, max_lateness, std_dev = row
+    return (f"{key[:12]:<12} | {count:>7} | {mean * 1e3:>6.3f} | {p50 * 1e3:>6.3f} | {p99 * 1e3:>6.3f} | "
+            f"{max_lateness * 1e3:>7.3f} | {std_dev * 1e3:>6.3f}")
+
+def _print_jitter_summary():
+    """Resumen periódico en modo monitor."""
+    global jitter_last_summary_time
+    now = time.time()
+    if now - jitter_last_summary_time < JITTER_SUMMARY_INTERVAL:
+        return
+    jitter_last_summary_time = now
+    rows = _get_jitter_rows()
+    if rows and monitor_active:
+        print("[JITTER] " + "  ".join(f"{key}: p50 {p50 * 1e3:.2f} / p99 {p99 * 1e3:.2f} / max {max_lateness * 1e3:.2f} ms"
+                                       for key, _, _, p50, p99, max_lateness, _ in rows))
+
+def write_jitter_report(report_path):
+    """Escribe el informe final de retraso reloj -> salida con un histograma por módulo."""
+    rows = _get_jitter_rows()
+    lines = [
+        "MIDImod - Retraso reloj -> salida (ms)",
+        f"Generado: {time.strftime('%Y-%m-%d %H:%M:%S')}",
+        "",
+        "MODULO       | MUESTRAS |  MEDIA |    P50 |    P99 |     MAX | JITTER(std)",
+    ]
+    lines.extend(_format_jitter_row(row) for row in rows)
+    group_width = JITTER_BIN_WIDTH * JITTER_REPORT_BIN_GROUP
+    for key, stats in sorted(jitter_stats.items()):
+        lines.append("")
+        lines.append(f"{key} ({stats['count']} muestras)")
+        grouped = [sum(stats['bins'][i:i + JITTER_REPORT_BIN_GROUP]) for i in range(0, JITTER_NUM_BINS, JITTER_REPORT_BIN_GROUP)]
+        overflow = stats['bins'][JITTER_NUM_BINS]
+        last_used = max((i for i, bin_count in enumerate(grouped) if bin_count), default=0)
+        peak = max(grouped + [overflow]) or 1
+        for i in range(last_used + 1):
+            bar = "#" * int(round(grouped[i] / peak * 50))
+            lines.append(f"  {i * group_width * 1e3:>6.2f}-{(i + 1) * group_width * 1e3:<6.2f} ms | {bar} {grouped[i]}")
+        if overflow:
+            lines.append(f"  >= {JITTER_NUM_BINS * JITTER_BIN_WIDTH * 1e3:.2f} ms     | {'#' * int(round(overflow / peak * 50))} {overflow}")
+    with open(report_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return rows
+
+
 def _process_single_loop_iteration(is_live_mode, rules_base_dir, virtual_port_mode_active, virtual_input_name, virtual_output_name, virtual_output_port_object_ref):
     """
     Ejecuta una única pasada de la lógica principal de procesamiento de eventos.
-    Maneja la entrada de teclado SOLO cuando está en modo monitor (no TUI).
+    Se ejecuta siempre en el hilo del motor, tanto en modo TUI como en modo monitor.
     """
     global shutdown_flag, current_active_version, available_versions, monitor_active, all_loaded_filters, \
            global_device_aliases, opened_ports_tracking, midimaster_assumed_status, reload_queue, \
            tui_last_osc_msg_str, tui_last_osc_msg_time, active_input_handlers, all_loaded_osc_filters, \
            sequencers_state, arpeggiator_instances, transport_out_port_obj, clock_tick_counters
 
+    # Con el perfilador apagado se llaman directamente las funciones normales.
+    if profiler_enabled:
+        filter_processor, sequencer_step, arpeggiator_step = _profiled_process_midi_event, _profiled_sequencer_step, _profiled_arpeggiator_step
+    else:
+        filter_processor, sequencer_step, arpeggiator_step = process_midi_event_new_logic, process_sequencer_step, process_arpeggiator_step
+
     # 1. Comprobar si hay una solicitud de recarga y la ejecuta.
     if is_live_mode and not reload_queue.empty():
-        if reload_queue.get() == "reload":
-            all_loaded_filters, virtual_output_port_object_ref = reload_all_configuration(
+        changed_paths = []
+        while not reload_queue.empty():
+            reload_request = reload_queue.get()
+            if isinstance(reload_request, tuple) and reload_request[0] == "reload":
+                if reload_request[1] not in changed_paths: changed_paths.append(reload_request[1])
+            else:
+                changed_paths = None # Petición sin fichero: todo
+                break
+        reload_result = None
+        for changed_path in changed_paths or []:
+            reload_result = reload_changed_rule_file(changed_path, rules_base_dir, virtual_port_mode_active, virtual_input_name, virtual_output_name)
+            if reload_result is None: break
+        if reload_result is None:
+            reload_result = reload_all_configuration(
                 rules_base_dir, virtual_port_mode_active, virtual_input_name, virtual_output_name
             )
+        all_loaded_filters, virtual_output_port_object_ref = reload_result
     
-    # --- MANEJO DE TECLADO (SOLO EN MODO MONITOR) ---
-    if monitor_active:
-        char_input = get_char_non_blocking()
-        if char_input:
-            if char_input.lower() == 'm':
-                return "toggle_monitor"
-
-    # 2. Procesamiento de eventos (se ejecuta en ambos modos: TUI y Monitor).
-    
-            prev_active_version_kb = current_active_version
-            version_changed_by_kb = False
-            
-            if char_input.isdigit():
-                new_version_attempt = int(char_input)
-                if new_version_attempt in available_versions:
-                    if current_active_version != new_version_attempt:
-                        current_active_version = new_version_attempt
-                        version_changed_by_kb = True
-            elif char_input == ' ':
-                if available_versions:
-                    try: current_idx = available_versions.index(current_active_version)
-                    except ValueError: current_idx = -1
-                    current_active_version = available_versions[(current_idx + 1) % len(available_versions)]
-                    version_changed_by_kb = True
-            elif (char_input == '\r' or char_input == '\n'): # TECLA ENTER
-                if transport_out_port_obj:
-                    try:
-                        if midimaster_assumed_status == "STOPPED":
-                            msg_to_send = mido.Message('start')
-                            transport_out_port_obj.send(msg_to_send)
-                            _update_tui_port_out_data(transport_out_port_obj, msg_to_send, "TPT_out")
-                            midimaster_assumed_status = "PLAYING"
-                            print(f"[!] Comando START enviado a TPT")
-                        elif midimaster_assumed_status == "PLAYING":
-                            msg_to_send = mido.Message('stop')
-                            transport_out_port_obj.send(msg_to_send)
-                            _update_tui_port_out_data(transport_out_port_obj, msg_to_send, "TPT_out")
-                            midimaster_assumed_status = "STOPPED"
-                            global_panic()
-                            print(f"[!] Comando STOP enviado a TPT")
-                    except Exception as e:
-                        print(f"[!] Error enviando comando a TPT: {e}")
-                else:
-                    print(f"[!] Puerto TPT no disponible.")
-            
-            if version_changed_by_kb and current_active_version != prev_active_version_kb:
-                print(f"[*] Versión {current_active_version}/{len(available_versions) - 1}")
-                process_version_activated_filters(current_active_version, all_loaded_filters, global_device_aliases, opened_ports_tracking, virtual_port_mode_active, virtual_output_port_object_ref, virtual_output_name)
-            elif version_changed_by_kb and char_input.isdigit() and current_active_version == prev_active_version_kb:
-                print(f"[*] Versión '{char_input}' no disponible o ya activa. Actual: V{current_active_version}.")
+    # 2. Ejecutar los comandos enviados por la interfaz (teclado del monitor o TUI).
+    while not engine_command_queue.empty():
+        command_func, command_args = engine_command_queue.get()
+        command_func(*command_args)
 
     # Procesamiento de OSC
     while not osc_message_queue.empty():
@@ -3142,7 +5190,7 @@ def _process_single_loop_iteration(is_live_mode, rules_base_dir, virtual_port_mo
             if outputs_from_this_filter:
                 for (msg_to_send, dest_port_obj, alias_log, rule_log, _, _) in outputs_from_this_filter:
                     if dest_port_obj and hasattr(dest_port_obj, "send"):
-                        dest_port_obj.send(msg_to_send)
+                        _queue_output(dest_port_obj, msg_to_send, rate_policy=filter_rate_policies.get(rule_log))
                         if monitor_active:
                             log_line = format_midi_message_for_log(
                                 msg_to_send, prefix="  ⇢ OUT: ", active_version=current_active_version,
@@ -3150,18 +5198,18 @@ def _process_single_loop_iteration(is_live_mode, rules_base_dir, virtual_port_mo
                             )
                             if log_line: print(log_line)
 
-    # Procesamiento de MIDI
+    # Procesamiento de MIDI (los callbacks de entrada ya dejaron los mensajes en la cola)
     incoming_messages_this_cycle = []
-    for port_full_name, mido_in_port_obj in active_input_handlers.items():
-        for msg in mido_in_port_obj.iter_pending():
-            incoming_messages_this_cycle.append({'msg': msg, 'port_name': port_full_name})
-            if port_full_name in opened_ports_tracking:
-                port_info = opened_ports_tracking[port_full_name]
-                formatted_msg = format_midi_message_for_log(msg, prefix="")
-                port_info["last_in_msg_str"] = formatted_msg if formatted_msg is not None else msg.type.title()
-                now = time.time()
-                port_info["last_in_msg_time"] = now
-                port_info["activity_time"] = now
+    now = time.time()
+    while not midi_input_queue.empty():
+        port_full_name, msg = midi_input_queue.get()
+        incoming_messages_this_cycle.append({'msg': msg, 'port_name': port_full_name})
+        if port_full_name in opened_ports_tracking:
+            # Mensaje crudo: el texto para la TUI se genera al dibujar el panel
+            port_info = opened_ports_tracking[port_full_name]
+            port_info["last_in_msg"] = msg
+            port_info["last_in_msg_time"] = now
+            port_info["activity_time"] = now
     
     # --- CORRECCIÓN: Mover la inicialización de estas variables aquí ---
     all_generated_outputs_this_cycle = []
@@ -3189,53 +5237,59 @@ def _process_single_loop_iteration(is_live_mode, rules_base_dir, virtual_port_mo
                     global_panic()
                 if msg.type == 'clock' and midimaster_assumed_status == "PLAYING":
                     clock_tick_counters[port_name] += 1
-                for i, seq_state in enumerate(sequencers_state):
-                    if seq_state['clock_in_port_name'] and seq_state['clock_in_port_name'].lower() in port_name.lower():
-                        if msg_type_for_modules == 'start':
-                            seq_conf = seq_state['config']
-                            if not seq_conf.get("quantize_start"):
-                                seq_state['is_playing'] = True; seq_state['tick_counter'] = 0; seq_state['last_known_tick'] = -1
-                                _silence_instance(seq_state, f"SEQ[{i}] start"); _rebuild_sequencer_schedule(i, seq_state)
-                                if monitor_active: print(f"SQ[{i}] Start (transport/auto)")
-                            else:
-                                if not seq_state['is_playing'] and not seq_state['is_armed']:
-                                    seq_state['is_armed'] = True
-                                    display_grid = seq_conf.get("quantize_start");
-                                    if not isinstance(display_grid, str): display_grid = "grid"
-                                    if monitor_active: print(f"SQ[{i}] ARMED by transport/auto (waiting for '{display_grid}')")
-                        elif msg_type_for_modules in ['stop', 'reset']:
-                            seq_state['is_playing'] = False; seq_state['is_armed'] = False
-                            if monitor_active: print(f"SQ[{i}] Stop")
-                        elif msg_type_for_modules == 'continue':
-                            seq_state['is_playing'] = True
-                            if monitor_active: print(f"SQ[{i}] Continue")
-                        if msg.type == 'clock' and seq_state['is_playing']:
-                            seq_state['tick_counter'] += 1
-                for key, instance in arpeggiator_instances.items():
-                    arp_clock_in_alias = instance['config'].get('clock_in', instance['config'].get('device_in'))
-                    if arp_clock_in_alias:
-                        arp_clock_in_substr = global_device_aliases.get(arp_clock_in_alias, arp_clock_in_alias)
-                        if arp_clock_in_substr.lower() in port_name.lower():
-                            if msg_type_for_modules == 'start':
-                                if not instance['config'].get("quantize_start"):
-                                    instance['is_playing'] = True; instance['tick_counter'] = 0; instance['active_step'] = 0; instance['pending_note_offs'].clear()
-                                    if monitor_active: print(f"ARP[{key[0]},{key[1]}] Start (transport/auto)")
-                            elif msg_type_for_modules in ['stop', 'reset']:
-                                instance['is_playing'] = False; instance['is_armed'] = False
-                                if monitor_active: print(f"ARP[{key[0]},{key[1]}] Stop")
-                            elif msg_type_for_modules == 'continue':
-                                instance['is_playing'] = True
-                                if monitor_active: print(f"ARP[{key[0]},{key[1]}] Continue")
-                            if msg.type == 'clock' and instance['is_playing']:
-                                instance['tick_counter'] += 1
+                if profiler_enabled and msg.type == 'clock':
+                    _profiler_note_clock(port_name)
+                seq_subscribers, arp_subscribers = _get_clock_subscribers(port_name)
+                if jitter_measure_enabled and msg.type == 'clock' and msg.time:
+                    # Se conserva el clock más antiguo pendiente de cada módulo en esta iteración
+                    for i, _ in seq_subscribers:
+                        jitter_pending_clock.setdefault(f"SEQ[{i}]", msg.time)
+                    for key, _ in arp_subscribers:
+                        jitter_pending_clock.setdefault(f"ARP[{key[0]},{key[1]}]", msg.time)
+                for i, seq_state in seq_subscribers:
+                    if msg_type_for_modules == 'start':
+                        seq_conf = seq_state['config']
+                        if not seq_conf.get("quantize_start"):
+                            seq_state['is_playing'] = True; seq_state['tick_counter'] = 0; seq_state['last_known_tick'] = -1
+                            _silence_instance(seq_state, f"SEQ[{i}] start"); _rebuild_sequencer_schedule(i, seq_state)
+                            if monitor_active: print(f"SQ[{i}] Start (transport/auto)")
+                        else:
+                            if not seq_state['is_playing'] and not seq_state['is_armed']:
+                                seq_state['is_armed'] = True
+                                display_grid = seq_conf.get("quantize_start");
+                                if not isinstance(display_grid, str): display_grid = "grid"
+                                if monitor_active: print(f"SQ[{i}] ARMED by transport/auto (waiting for '{display_grid}')")
+                    elif msg_type_for_modules in ['stop', 'reset']:
+                        seq_state['is_playing'] = False; seq_state['is_armed'] = False
+                        if monitor_active: print(f"SQ[{i}] Stop")
+                    elif msg_type_for_modules == 'continue':
+                        seq_state['is_playing'] = True
+                        if monitor_active: print(f"SQ[{i}] Continue")
+                    if msg.type == 'clock' and seq_state['is_playing']:
+                        seq_state['tick_counter'] += 1
+                for key, instance in arp_subscribers:
+                    if msg_type_for_modules == 'start':
+                        if not instance['config'].get("quantize_start"):
+                            instance['is_playing'] = True; instance['tick_counter'] = 0; instance['active_step'] = 0; instance['pending_note_offs'].clear()
+                            if monitor_active: print(f"ARP[{key[0]},{key[1]}] Start (transport/auto)")
+                    elif msg_type_for_modules in ['stop', 'reset']:
+                        instance['is_playing'] = False; instance['is_armed'] = False
+                        if monitor_active: print(f"ARP[{key[0]},{key[1]}] Stop")
+                    elif msg_type_for_modules == 'continue':
+                        instance['is_playing'] = True
+                        if monitor_active: print(f"ARP[{key[0]},{key[1]}] Continue")
+                    if msg.type == 'clock':
+                        instance['clock_tick'] += 1 # Reloj absoluto: avanza aunque esté parado
+                        if instance['is_playing']:
+                            instance['tick_counter'] += 1
             else:
                 other_messages_to_process.append(event)
         
         for event in other_messages_to_process:
             original_input_msg = event['msg']
             port_full_name = event['port_name']
-            for event_filter_config in all_loaded_filters:
-                outputs_from_this_filter, version_action = process_midi_event_new_logic(
+            for event_filter_config in get_candidate_filters(port_full_name, original_input_msg):
+                outputs_from_this_filter, version_action = filter_processor(
                     original_input_msg, port_full_name, event_filter_config,
                     current_active_version, global_device_aliases, opened_ports_tracking,
                     virtual_port_mode_active, virtual_output_port_object_ref, virtual_output_name
@@ -3255,15 +5309,12 @@ def _process_single_loop_iteration(is_live_mode, rules_base_dir, virtual_port_mo
                             print(f"{log_in_vchange} ⇢ (set_version: '{raw_set_version}' -> '{version_action}')")
         
         if all_generated_outputs_this_cycle:
-            for (msg_to_send, dest_port_obj, dest_alias_str, _, sent_event_type_str, _) in all_generated_outputs_this_cycle:
+            for (msg_to_send, dest_port_obj, dest_alias_str, src_filter_id, sent_event_type_str, _) in all_generated_outputs_this_cycle:
                 if dest_port_obj and hasattr(dest_port_obj, "send"):
-                    try:
-                        dest_port_obj.send(msg_to_send)
-                        _update_tui_port_out_data(dest_port_obj, msg_to_send, dest_alias_str)
-                        if sent_event_type_str == 'control_change':
-                            cc_value_sent[(msg_to_send.channel, msg_to_send.control)] = msg_to_send.value
-                    except Exception as e_send:
-                        print(f"  ERR SEND: {e_send}")
+                    _queue_output(dest_port_obj, msg_to_send, rate_policy=filter_rate_policies.get(src_filter_id))
+                    _update_tui_port_out_data(dest_port_obj, msg_to_send, dest_alias_str)
+                    if sent_event_type_str == 'control_change':
+                        cc_value_sent[(msg_to_send.channel, msg_to_send.control)] = msg_to_send.value
         
         if monitor_active:
             for event in other_messages_to_process:
@@ -3313,9 +5364,6 @@ def _process_single_loop_iteration(is_live_mode, rules_base_dir, virtual_port_mo
                     new_version = action_value
             if new_version != -1 and new_version != current_active_version:
                 current_active_version = new_version
-            if not monitor_active:
-                if tui_app and not tui_app.is_done:
-                    tui_app.invalidate()
             process_version_activated_filters(current_active_version, all_loaded_filters, global_device_aliases, opened_ports_tracking, virtual_port_mode_active, virtual_output_port_object_ref, virtual_output_name)
 
     armed_modules_to_check = []
@@ -3342,17 +5390,7 @@ def _process_single_loop_iteration(is_live_mode, rules_base_dir, virtual_port_mo
             if not clock_alias_expr: continue
             clock_alias = get_evaluated_value_from_output_config(clock_alias_expr, None, state.get('eval_context',{}), "quantize_launch", "device_in")
             if not clock_alias: continue
-            clock_port_name = None
-            for p_name, p_info in opened_ports_tracking.items():
-                if p_info.get('alias_used') == clock_alias:
-                    clock_port_name = p_name
-                    break
-            if not clock_port_name:
-                 resolved_substring = global_device_aliases.get(clock_alias, clock_alias)
-                 for p_name in opened_ports_tracking.keys():
-                      if resolved_substring.lower() in p_name.lower():
-                           clock_port_name = p_name
-                           break
+            clock_port_name = _find_port_name_by_alias(clock_alias)
             if not clock_port_name:
                 if monitor_active: print(f"Adv: No se pudo encontrar un puerto abierto para el reloj '{clock_alias}' del módulo {mod['id']}. No se puede lanzar cuantizado.")
                 continue
@@ -3376,43 +5414,39 @@ def _process_single_loop_iteration(is_live_mode, rules_base_dir, virtual_port_mo
         current_tick = seq_state['tick_counter']
         cycle_duration = seq_state.get('current_cycle_duration', 0)
         if cycle_duration > 0 and current_tick >= cycle_duration:
+            # Las note-off pendientes usan ticks absolutos: basta con mover el inicio del ciclo.
             seq_state['tick_counter'] -= cycle_duration
             current_tick = seq_state['tick_counter']
             seq_state['last_known_tick'] -= cycle_duration
-            adjusted_offs = []
-            for fire_at, msg, port, alias in seq_state['pending_note_offs']:
-                adjusted_offs.append((fire_at - cycle_duration, msg, port, alias))
-            seq_state['pending_note_offs'] = adjusted_offs
+            seq_state['cycle_start_tick'] += cycle_duration
             _rebuild_sequencer_schedule(i, seq_state)
-        due_note_offs = [item for item in seq_state['pending_note_offs'] if current_tick >= item[0]]
+        due_note_offs = _pop_due_note_offs(seq_state, seq_state['cycle_start_tick'] + current_tick)
         if due_note_offs:
-            seq_state['pending_note_offs'] = [item for item in seq_state['pending_note_offs'] if item not in due_note_offs]
-            for _, msg, port, alias in due_note_offs:
-                try:
-                    port.send(msg)
-                    if monitor_active: # Only print logs if in monitor mode
-                        log_prefix = f"  \u21E2 SQ[{i}] off:"
-                        log_line = format_midi_message_for_log(msg, log_prefix, current_active_version, None, alias)
-                        if log_line: print(log_line)
-                except Exception as e:
-                    print(f"Err sending scheduled note_off: {e}")
+            for _, _, msg, port, alias in due_note_offs:
+                _queue_output(port, msg)
+                if monitor_active: # Only print logs if in monitor mode
+                    log_prefix = f"  \u21E2 SQ[{i}] off:"
+                    log_line = format_midi_message_for_log(msg, log_prefix, current_active_version, None, alias)
+                    if log_line: print(log_line)
+        # Solo se visitan los pasos con last_known_tick < fire_at <= current_tick: el coste
+        # depende de los pasos que se disparan, no del número total de pasos.
+        if current_tick <= seq_state['last_known_tick']:
+            continue
         schedule = seq_state.get('event_schedule', [])
-        for event_to_fire in schedule:
-            if event_to_fire['fire_at'] <= current_tick and event_to_fire['fire_at'] > seq_state['last_known_tick']:
+        fire_ticks = seq_state.get('event_fire_ticks', [])
+        first_due = bisect_right(fire_ticks, seq_state['last_known_tick'])
+        last_due = bisect_right(fire_ticks, current_tick)
+        for event_to_fire in schedule[first_due:last_due]:
+            if event_to_fire['fire_at'] > seq_state['last_known_tick']: # Pasos con el mismo tick: solo el primero
                 seq_state['active_step'] = event_to_fire['step']
-                process_sequencer_step(i, seq_state, event_to_fire['fire_at'], opened_ports_tracking, virtual_port_mode_active, virtual_output_port_object_ref, virtual_output_name)
+                sequencer_step(i, seq_state, event_to_fire['fire_at'], opened_ports_tracking, virtual_port_mode_active, virtual_output_port_object_ref, virtual_output_name)
                 seq_state['last_known_tick'] = event_to_fire['fire_at']
 
     arp_instances_to_remove = []
     for instance_key, instance_state in list(arpeggiator_instances.items()):
         arp_conf = instance_state['config']
-        due_note_offs = [item for item in instance_state['pending_note_offs'] if instance_state['tick_counter'] >= item[0]]
-        for item in due_note_offs:
-            _, msg, port, alias = item
-            try: port.send(msg)
-            except Exception: pass
-            if item in instance_state['pending_note_offs']:
-                instance_state['pending_note_offs'].remove(item)
+        for _, _, msg, port, alias in _pop_due_note_offs(instance_state, instance_state['clock_tick']):
+            _queue_output(port, msg)
         if instance_state['is_playing']:
             ppqn = int(arp_conf.get('ppqn', ARP_DEFAULTS['ppqn']))
             step_duration = arp_conf.get('step_duration', ARP_DEFAULTS['step_duration'])
@@ -3421,7 +5455,7 @@ def _process_single_loop_iteration(is_live_mode, rules_base_dir, virtual_port_mo
                 pattern = instance_state.get('arp_pattern', [])
                 if pattern:
                    current_tick_snapshot = instance_state['tick_counter']
-                   process_arpeggiator_step(instance_key, instance_state, opened_ports_tracking, virtual_port_mode_active, virtual_output_port_object_ref, virtual_output_name, current_tick_snapshot)
+                   arpeggiator_step(instance_key, instance_state, opened_ports_tracking, virtual_port_mode_active, virtual_output_port_object_ref, virtual_output_name, current_tick_snapshot)
                    instance_state['tick_counter'] -= ticks_for_step
                    current_step = instance_state.get('active_step', 0)
                    pattern_len = len(pattern)
@@ -3433,9 +5467,110 @@ def _process_single_loop_iteration(is_live_mode, rules_base_dir, virtual_port_mo
         if key in arpeggiator_instances:
             del arpeggiator_instances[key]
             if monitor_active: print(f"     ⇢ ARP: Instancia {key} eliminada.")
+    if arp_instances_to_remove:
+        _rebuild_clock_subscriptions()
 
-    # Si no se detectó un cambio de modo, devuelve None.
-    return None
+    _flush_due_sysex_chunks()
+    _flush_due_rate_limited_ccs()
+    _flush_output_batch()
+
+    if jitter_measure_enabled:
+        jitter_pending_clock.clear()
+        _print_jitter_summary()
+
+
+def _post_engine_command(command_func, *command_args):
+    """Encola una acción de la interfaz para que la ejecute el hilo del motor."""
+    engine_command_queue.put((command_func, command_args))
+    _wake_engine()
+
+def _engine_select_version(new_version, is_virtual_mode_now, virtual_out_obj=None, virtual_out_name=""):
+    """Comando: activa una versión concreta (teclas 0-9)."""
+    global current_active_version
+    if new_version not in available_versions or new_version == current_active_version:
+        if monitor_active:
+            print(f"[*] Versión '{new_version}' no disponible o ya activa. Actual: V{current_active_version}.")
+        return
+    current_active_version = new_version
+    if monitor_active:
+        print(f"[*] Versión {current_active_version}/{len(available_versions) - 1}")
+    process_version_activated_filters(current_active_version, all_loaded_filters, global_device_aliases, opened_ports_tracking, is_virtual_mode_now, virtual_out_obj, virtual_out_name)
+
+def _engine_cycle_version(is_virtual_mode_now, virtual_out_obj=None, virtual_out_name=""):
+    """Comando: cicla a la siguiente versión disponible (barra espaciadora)."""
+    if not available_versions:
+        return
+    try: current_idx = available_versions.index(current_active_version)
+    except ValueError: current_idx = -1
+    next_version = available_versions[(current_idx + 1) % len(available_versions)]
+    if next_version != current_active_version:
+        _engine_select_version(next_version, is_virtual_mode_now, virtual_out_obj, virtual_out_name)
+
+def _engine_toggle_transport():
+    """Comando: arranca/para el reloj interno o envía Start/Stop al puerto 'TPT_out' (tecla Enter)."""
+    global midimaster_assumed_status, tui_last_osc_msg_str, tui_last_osc_msg_time
+    if internal_clock:
+        # El reloj interno envía Start/Stop a sus 'clock_out' y al motor, que actualiza el transporte.
+        if internal_clock.is_running:
+            internal_clock.stop()
+            if monitor_active: print(f"[!] Reloj interno detenido")
+        else:
+            internal_clock.start()
+            if monitor_active: print(f"[!] Reloj interno en marcha ({internal_clock.bpm:g} BPM)")
+        return
+    if not transport_out_port_obj:
+        if monitor_active:
+            print(f"[!] Puerto TPT no disponible.")
+        else:
+            tui_last_osc_msg_str = f"ERROR: Puerto TPT no disponible."
+            tui_last_osc_msg_time = time.time()
+        return
+    try:
+        if midimaster_assumed_status == "STOPPED":
+            msg_to_send = mido.Message('start')
+            transport_out_port_obj.send(msg_to_send)
+            _update_tui_port_out_data(transport_out_port_obj, msg_to_send, "TPT_out")
+            midimaster_assumed_status = "PLAYING"
+            if monitor_active: print(f"[!] Comando START enviado a TPT")
+        elif midimaster_assumed_status == "PLAYING":
+            msg_to_send = mido.Message('stop')
+            transport_out_port_obj.send(msg_to_send)
+            _update_tui_port_out_data(transport_out_port_obj, msg_to_send, "TPT_out")
+            midimaster_assumed_status = "STOPPED"
+            global_panic()
+            if monitor_active: print(f"[!] Comando STOP enviado a TPT")
+    except Exception as e:
+        if monitor_active:
+            print(f"[!] Error enviando comando a TPT: {e}")
+        else:
+            tui_last_osc_msg_str = f"ERROR TPT: {e}"
+            tui_last_osc_msg_time = time.time()
+
+def _request_tui_exit():
+    """Pide a la TUI (si está corriendo) que termine, desde cualquier hilo."""
+    if tui_app and tui_app.is_running and tui_app.loop:
+        tui_app.loop.call_soon_threadsafe(tui_app.exit)
+
+def _engine_thread_main(is_live_mode, rules_base_dir, virtual_port_mode_active, virtual_input_name, virtual_output_name, virtual_output_port_object_ref):
+    """Bucle del hilo de tiempo real: procesa MIDI, reloj y módulos sin depender de la interfaz."""
+    global shutdown_flag
+    try:
+        while not shutdown_flag:
+            # Bloquea hasta que llegue MIDI/OSC/recarga/comando (o hasta el siguiente mantenimiento).
+            engine_wakeup_event.wait(_get_engine_wait_timeout())
+            engine_wakeup_event.clear()
+            if shutdown_flag:
+                break
+            with engine_state_lock:
+                _process_single_loop_iteration(
+                    is_live_mode, rules_base_dir, virtual_port_mode_active,
+                    virtual_input_name, virtual_output_name, virtual_output_port_object_ref
+                )
+    except Exception as e_engine:
+        print(f"\nERROR INESPERADO EN EL HILO DEL MOTOR: {e_engine}")
+        traceback.print_exc()
+        shutdown_flag = True
+        _request_tui_exit()
 
 # --- Main Application ---
 
@@ -3471,6 +5606,20 @@ MIDImod {script_version} - Command Line & Interactive Controls
   `--list-ports`
     Lists available MIDI input/output ports and exits.
 
+  `--render FILE.mid`, `--render-out FILE`, `--render-in ALIAS`
+    Offline render: plays FILE.mid through the given rule files on a
+    virtual timeline (as fast as the CPU allows) and writes the output
+    as a multi-port .mid or, if FILE ends in .jsonl, as JSON lines.
+
+  `--bench`, `--bench-out FILE`
+    Runs the event-processing benchmark against in-memory ports and writes
+    the results as JSON (default: '{BENCH_RESULTS_FILE}'), then exits.
+
+  `--loopback`
+    Replaces the real MIDI devices with in-memory ports created for every
+    alias in the rules. Useful with the internal clock or OSC to test a
+    setup with no hardware and no rtmidi.
+
   `--virtual-ports`
     Enables virtual MIDI ports ('MIDImod_IN', 'MIDImod_OUT') for use
     with DAWs or other software.
@@ -3481,9 +5630,27 @@ MIDImod {script_version} - Command Line & Interactive Controls
   `--no-log`
     Starts without the real-time MIDI monitor. By default, this will launch the TUI.
 
+  `--log-file FILE`
+    Also writes the monitor output to FILE, rotated every
+    {MONITOR_LOG_FILE_MAX_BYTES // (1024 * 1024)} MB (keeping {MONITOR_LOG_FILE_BACKUPS} old files).
+
+  `--tui-fps N`
+    Maximum TUI redraws per second (default: {TUI_MAX_REFRESH_RATE}). The screen is
+    only redrawn when something it shows has changed.
+
   `--verbose`
     Enables detailed logging for module loading and value evaluation.
 
+  `--profile`
+    Records call count, total/max time and outputs for every filter,
+    sequencer and arpeggiator, shown in a TUI panel. Press 'p' to save
+    the data to '{PROFILE_DUMP_FILE}'.
+
+  `--measure-jitter`
+    Measures the delay between each incoming clock tick and the notes
+    sequencers/arpeggiators send for it. Shows a live summary and writes
+    a histogram report to '{JITTER_REPORT_FILE}' on exit.
+
   `--help`, `-h`
     Displays this help message and exits.
 
@@ -3506,8 +5673,10 @@ MIDImod {script_version} - Command Line & Interactive Controls
   `[Spacebar]`   : Cycles to the next available 'version'.
   `[0-9]`        : Jumps directly to a specific 'version' number.
   `m`            : Toggles between the TUI and the real-time MIDI monitor log.
+  `p`            : Saves the profiler data to a file (with --profile).
   `[Enter]`      : Sends Start/Stop transport commands to the port
-                 aliased as 'TPT_out' in your JSON files.
+                 aliased as 'TPT_out' in your JSON files, or starts/stops
+                 the 'internal_clock' when one is configured.
   `[Ctrl+C]`     : Safely shuts down the script.
 -------------------------------------------------------------------------------
 """
@@ -3521,18 +5690,35 @@ MIDImod {script_version} - Command Line & Interactive Controls
     parser.add_argument("rule_files", nargs='*', default=None, 
                         help=f"Nombres base (sin .json) de archivos de reglas de './{RULES_DIR_NAME}/'. Si no se da, se abre selector interactivo.")
     parser.add_argument("--list-ports", action="store_true", help="Lista puertos MIDI y sale.")
+    parser.add_argument("--render", type=str, default=None, metavar="FICHERO.mid", help="Render offline: procesa un .mid con las reglas y sale.")
+    parser.add_argument("--render-out", type=str, default=None, metavar="FICHERO", help="Salida del render (.mid multipuerto o .jsonl; default: <entrada>_render.mid).")
+    parser.add_argument("--render-in", type=str, default=None, metavar="ALIAS", help="Puerto de entrada (alias) por el que llegan todas las pistas del .mid.")
+    parser.add_argument("--bench", action="store_true", help="Ejecuta el benchmark del procesamiento de eventos y sale.")
+    parser.add_argument("--bench-out", type=str, default=BENCH_RESULTS_FILE, metavar="FICHERO", help=f"Fichero JSON de resultados del benchmark (default: {BENCH_RESULTS_FILE}).")
     parser.add_argument("--no-log", action="store_false", dest="monitor_active_cli", default=True, help="Desactiva monitor MIDI al inicio, lanzando la TUI.")
+    parser.add_argument("--loopback", action="store_true", help="Usa puertos MIDI en memoria en lugar de los dispositivos reales (sin hardware).")
     parser.add_argument("--virtual-ports", action="store_true", help="Activa el modo de puertos MIDI virtuales.")
     parser.add_argument("--vp-in", type=str, default="MIDImod_IN", metavar="NOMBRE", help="Puerto MIDI virtual de ENTRADA (default: MIDImod_IN).")
     parser.add_argument("--vp-out", type=str, default="MIDImod_OUT", metavar="NOMBRE", help="Puerto MIDI virtual de SALIDA (default: MIDImod_OUT).")
+    parser.add_argument("--log-file", type=str, default=None, metavar="FICHERO", help=f"Copia la salida del monitor en un fichero que rota cada {MONITOR_LOG_FILE_MAX_BYTES // (1024 * 1024)} MB.")
+    parser.add_argument("--tui-fps", type=int, default=TUI_MAX_REFRESH_RATE, metavar="N", help=f"Redibujos por segundo como máximo de la TUI (default: {TUI_MAX_REFRESH_RATE}).")
     parser.add_argument("--verbose", action="store_true", help="Muestra detalles adicionales de los filtros.")
+    parser.add_argument("--profile", action="store_true", help="Activa el perfilador de filtros y módulos (panel en la TUI, 'p' para guardarlo).")
+    parser.add_argument("--measure-jitter", action="store_true", help=f"Mide el retraso reloj -> nota de secuenciadores/arpegiadores; informe en '{JITTER_REPORT_FILE}' al salir.")
     parser.add_argument("--live", action="store_true", help="Activa el modo Live, cargando reglas de './live' y recargando al guardar.")
+    parser.add_argument("--no-rule-cache", action="store_false", dest="rule_cache", default=True, help=f"No usa la caché de reglas analizadas ('{RULE_CACHE_DIR}').")
     args = parser.parse_args()
 
+    global rule_cache_enabled
+    rule_cache_enabled = args.rule_cache
 
     if args.list_ports:
         list_midi_ports_action()
         return
+
+    if args.bench:
+        run_benchmark_action(args.bench_out)
+        return
     
     is_live_mode = args.live
     
@@ -3549,12 +5735,32 @@ MIDImod {script_version} - Command Line & Interactive Controls
             if not selected_names: print("Saliendo."); return
             rule_file_names_to_load = selected_names
 
-    global VERBOSE_MODE
+    global VERBOSE_MODE, profiler_enabled, jitter_measure_enabled
     VERBOSE_MODE = args.verbose
     if VERBOSE_MODE:
         print("[!] Modo VERBOSO")
 
+    if args.render:
+        render_input = Path(args.render)
+        render_output = args.render_out or str(render_input.with_name(render_input.stem + "_render.mid"))
+        run_offline_render(rule_file_names_to_load, rules_base_dir, render_input, render_output, args.render_in)
+        return
+
+    profiler_enabled = args.profile
+    if profiler_enabled:
+        print(f"[!] Perfilador activo ('p' guarda el perfil en '{PROFILE_DUMP_FILE}')")
+    jitter_measure_enabled = args.measure_jitter
+    if jitter_measure_enabled:
+        print(f"[!] Medición de jitter reloj -> salida activa (informe en '{JITTER_REPORT_FILE}' al salir)")
+
     monitor_active = args.monitor_active_cli
+    global tui_max_refresh_rate
+    tui_max_refresh_rate = max(1, args.tui_fps)
+
+    global midi_backend
+    if args.loopback:
+        midi_backend = LoopbackMidiBackend(collect_sent=False)
+        print("[!] Backend MIDI en memoria (loopback): no se usan dispositivos reales")
 
     virtual_port_mode_active = args.virtual_ports
     virtual_input_name = args.vp_in
@@ -3567,8 +5773,8 @@ MIDImod {script_version} - Command Line & Interactive Controls
 
     start_osc_server()
 
-    if not active_input_handlers and not osc_server_instance:
-        print("\nNo hay puertos de ENTRADA (MIDI u OSC) activos. Saliendo.")
+    if not active_input_handlers and not osc_server_instance and not internal_clock:
+        print("\nNo hay puertos de ENTRADA (MIDI u OSC) ni reloj interno activos. Saliendo.")
         return
     if not active_filters_final and not sequencers_state and not all_loaded_osc_filters:
         print("\nNo hay filtros (MIDI u OSC) ni secuenciadores configurados. Saliendo.")
@@ -3598,21 +5804,45 @@ MIDImod {script_version} - Command Line & Interactive Controls
         print(version_log_header)
     process_version_activated_filters(current_active_version, active_filters_final, global_device_aliases, opened_ports_tracking,
                                     virtual_port_mode_active, virtual_output_port_object_ref, virtual_output_name)
+    _flush_output_batch()
+
+    # El procesamiento corre siempre en su propio hilo; cambiar entre TUI y monitor no altera su temporización.
+    global monitor_log_writer
+    monitor_log_writer = MonitorLogWriter(sys.stdout, log_path=args.log_file)
+    if monitor_active:
+        _install_monitor_log()
+    engine_thread = threading.Thread(
+        target=_engine_thread_main, name="MIDImod-engine", daemon=True,
+        args=(is_live_mode, rules_base_dir, virtual_port_mode_active, virtual_input_name, virtual_output_name, virtual_output_port_object_ref)
+    )
+    engine_thread.start()
+    version_command_args = (virtual_port_mode_active, virtual_output_port_object_ref, virtual_output_name)
 
     try:
         while not shutdown_flag:
             if monitor_active:
                 # --- MODO LOG ---
-                result = _process_single_loop_iteration(
-                    is_live_mode, rules_base_dir, virtual_port_mode_active,
-                    virtual_input_name, virtual_output_name, virtual_output_port_object_ref
-                )
-                if result == "toggle_monitor":
-                    monitor_active = False # Cambiar estado para la próxima iteración del bucle
-                    print("\033[H\033[J", end="") # Limpiar para la transición
-                time.sleep(0.001)
+                # Aquí solo se atiende el teclado; el hilo del motor imprime el log (vía MonitorLogWriter).
+                _install_monitor_log()
+                char_input = get_char_non_blocking()
+                if char_input:
+                    if char_input.lower() == 'm':
+                        monitor_active = False # Cambiar estado para la próxima iteración del bucle
+                        _uninstall_monitor_log()
+                        print("\033[H\033[J", end="") # Limpiar para la transición
+                        continue
+                    elif char_input.isdigit():
+                        _post_engine_command(_engine_select_version, int(char_input), *version_command_args)
+                    elif char_input == ' ':
+                        _post_engine_command(_engine_cycle_version, *version_command_args)
+                    elif char_input == '\r' or char_input == '\n': # TECLA ENTER
+                        _post_engine_command(_engine_toggle_transport)
+                    elif char_input.lower() == 'p' and profiler_enabled:
+                        _post_engine_command(_engine_dump_profile)
+                time.sleep(KEYBOARD_POLL_INTERVAL)
             else:
                 # --- MODO TUI (SIN PARPADEO) ---
+                _uninstall_monitor_log() # prompt_toolkit necesita la terminal real
                 kb = KeyBindings()
                 
                 @kb.add("c-c", eager=True)
@@ -3633,76 +5863,43 @@ MIDImod {script_version} - Command Line & Interactive Controls
                 @kb.add(" ", eager=True)
                 def _(event):
                     """ Ciclar a la siguiente versión disponible. """
-                    global current_active_version, available_versions
-                    if available_versions:
-                        try: current_idx = available_versions.index(current_active_version)
-                        except ValueError: current_idx = -1
-                        current_active_version = available_versions[(current_idx + 1) % len(available_versions)]
-                        process_version_activated_filters(current_active_version, all_loaded_filters, global_device_aliases, opened_ports_tracking, virtual_port_mode_active, virtual_output_port_object_ref, virtual_output_name)
-                    # No es necesario invalidar aquí, el inputhook lo hará.
+                    _post_engine_command(_engine_cycle_version, *version_command_args)
 
                 for digit in "0123456789":
                     @kb.add(digit, eager=True)
                     def _(event, d=digit):
                         """ Saltar directamente a una versión específica. """
-                        global current_active_version, available_versions
-                        new_version_attempt = int(d)
-                        if new_version_attempt in available_versions:
-                            if current_active_version != new_version_attempt:
-                                current_active_version = new_version_attempt
-                                process_version_activated_filters(current_active_version, all_loaded_filters, global_device_aliases, opened_ports_tracking, virtual_port_mode_active, virtual_output_port_object_ref, virtual_output_name)
-                        # No es necesario invalidar aquí, el inputhook lo hará.
+                        _post_engine_command(_engine_select_version, int(d), *version_command_args)
 
                 @kb.add("enter", eager=True)
                 def _(event):
                     """ Enviar comandos de transporte Start/Stop. """
-                    global transport_out_port_obj, midimaster_assumed_status, tui_last_osc_msg_str, tui_last_osc_msg_time
-                    if transport_out_port_obj:
-                        try:
-                            if midimaster_assumed_status == "STOPPED":
-                                msg_to_send = mido.Message('start')
-                                transport_out_port_obj.send(msg_to_send)
-                                _update_tui_port_out_data(transport_out_port_obj, msg_to_send, "TPT_out")
-                                midimaster_assumed_status = "PLAYING"
-                            elif midimaster_assumed_status == "PLAYING":
-                                msg_to_send = mido.Message('stop')
-                                transport_out_port_obj.send(msg_to_send)
-                                _update_tui_port_out_data(transport_out_port_obj, msg_to_send, "TPT_out")
-                                midimaster_assumed_status = "STOPPED"
-                                global_panic()
-                        except Exception as e:
-                            tui_last_osc_msg_str = f"ERROR TPT: {e}"
-                            tui_last_osc_msg_time = time.time()
-                    else:
-                        tui_last_osc_msg_str = f"ERROR: Puerto TPT no disponible."
-                        tui_last_osc_msg_time = time.time()
-                    # No es necesario invalidar aquí, el inputhook lo hará.
+                    _post_engine_command(_engine_toggle_transport)
 
-                global tui_app
-                
-                def tui_input_hook(context):
-                    """Esta función se ejecuta repetidamente mientras la TUI espera input."""
-                    # 1. Ejecutar nuestra lógica de fondo, que actualiza el estado global.
-                    _process_single_loop_iteration(
-                        is_live_mode, rules_base_dir, virtual_port_mode_active,
-                        virtual_input_name, virtual_output_name, virtual_output_port_object_ref
-                    )
-                    
-                    tui_app.invalidate()
+                if profiler_enabled:
+                    @kb.add("p", eager=True)
+                    def _(event):
+                        """ Guardar las estadísticas del perfilador en un fichero. """
+                        _post_engine_command(_engine_dump_profile)
 
-                    # 3. Una pequeña pausa para no consumir 100% de CPU.
-                    time.sleep(0.02)
+                global tui_app
 
-                # CORRECCIÓN: Crear la aplicación SIN el inputhook
+                # La TUI no procesa MIDI: el hilo de refresco compone la pantalla a partir de una
+                # instantánea del estado y solo la invalida cuando cambia algo visible.
                 tui_app = Application(
                     layout=_create_tui_layout(), 
                     key_bindings=kb, 
                     full_screen=True, 
                     mouse_support=False
                 )
-                
-                # CORRECCIÓN: Pasar el inputhook al método .run()
-                result = tui_app.run(inputhook=tui_input_hook)
+                tui_refresh_stop = threading.Event()
+                tui_refresh_thread = threading.Thread(target=_tui_refresh_loop, args=(tui_app, tui_refresh_stop), name="MIDImod-tui-refresh", daemon=True)
+                tui_refresh_thread.start()
+                try:
+                    result = tui_app.run()
+                finally:
+                    tui_refresh_stop.set()
+                    tui_refresh_thread.join(timeout=1.0)
 
                 if result != "toggle_monitor":
                     shutdown_flag = True
@@ -3716,6 +5913,22 @@ MIDImod {script_version} - Command Line & Interactive Controls
             print(f"\nERROR INESPERADO EN BUCLE PRINCIPAL: {e_main_loop}")
             traceback.print_exc()
     finally:
+        if internal_clock:
+            internal_clock.stop()
+        shutdown_flag = True
+        _wake_engine()
+        engine_thread.join(timeout=2.0)
+        _uninstall_monitor_log()
+        if monitor_log_writer:
+            monitor_log_writer.close()
+        if jitter_measure_enabled:
+            try:
+                jitter_rows = write_jitter_report(JITTER_REPORT_FILE)
+                print(f"\n[*] Informe de jitter guardado en '{JITTER_REPORT_FILE}'")
+                for row in jitter_rows:
+                    print(f"  {_format_jitter_row(row)}")
+            except OSError as e_report:
+                print(f"\n[!] No se pudo guardar el informe de jitter: {e_report}")
         print("\nCerrando puertos y deteniendo de MIDImod...")
         if osc_server_instance:
             print("  - Deteniendo servidor OSC...")
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# midimod.py está en la raíz del repositorio, no instalado como paquete
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
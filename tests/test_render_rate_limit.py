@@ -0,0 +1,41 @@
+import json
+from pathlib import Path
+
+import mido
+
+import midimod
+
+RULE = """{
+  "device_alias": {"IN": "render_in", "OUT": "render_out"},
+  "midi_filter": [
+    {"device_in": "IN", "event_in": "cc", "cc_max_rate": 10, "output": [{"device_out": "OUT"}]}
+  ]
+}"""
+
+
+def _write_cc_ramp(path, steps=32, step_seconds=0.0625):
+    midi_file = mido.MidiFile(ticks_per_beat=480)
+    track = mido.MidiTrack()
+    midi_file.tracks.append(track)
+    track.append(mido.MetaMessage('track_name', name="render_in"))
+    delta = int(mido.second2tick(step_seconds, 480, 500000))
+    for step in range(steps):
+        track.append(mido.Message('control_change', control=7, value=step * 4, time=0 if step == 0 else delta))
+    midi_file.save(path)
+    return steps * step_seconds
+
+
+def test_render_delivers_rate_limited_cc_ramp(tmp_path, monkeypatch):
+    monkeypatch.setattr(midimod, "rule_cache_enabled", False)
+    (tmp_path / "cc.json").write_text(RULE, encoding="utf-8")
+    duration = _write_cc_ramp(tmp_path / "in.mid")
+    out_path = tmp_path / "out.jsonl"
+
+    assert midimod.run_offline_render(["cc"], tmp_path, tmp_path / "in.mid", out_path)
+
+    records = [json.loads(line) for line in out_path.read_text(encoding="utf-8").splitlines()]
+    ccs = [r for r in records if r["type"] == "control_change" and r["control"] == 7]
+    assert abs(len(ccs) - 10 * duration) <= 2
+    assert ccs[-1]["value"] == 31 * 4
+    times = [r["time"] for r in ccs]
+    assert all(later - earlier >= 0.1 - 1e-6 for earlier, later in zip(times, times[1:]))